@@ -0,0 +1,60 @@
+"""Rebuild the order analytics rollups from orders and orders_archive.
+
+    python -m app.backfill                           every day since the oldest finished order
+    python -m app.backfill --from 2024-01-01         from that day up to today
+    python -m app.backfill --from 2024-01-01 --to 2024-02-01
+
+Days are UTC and --to is exclusive. Each day is recomputed and replaced in
+its own transaction, so the command can be interrupted and re-run. Run it
+once after deploying the order_rollups migration; afterwards the rollups
+are kept up to date by background jobs and a re-run is only needed to repair
+them. Orders finishing while a day is rebuilt can be missed, prefer off-peak.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+def _day_ms(value: Optional[date]) -> Optional[int]:
+    if value is None:
+        return None
+    return int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+async def _main(args):
+    from app.core import analytics, database
+
+    try:
+        day_ms = _day_ms(args.start)
+        if day_ms is None:
+            async with database.SessionLocal() as db:
+                day_ms = await analytics.first_order_day(db)
+            if day_ms is None:
+                print("No finished orders, nothing to backfill")
+                return
+        end_ms = _day_ms(args.end) or analytics.floor_ms(int(time.time() * 1000), analytics.DAY_MS) + analytics.DAY_MS
+
+        days = total = 0
+        started = time.perf_counter()
+        while day_ms < end_ms:
+            async with database.SessionLocal() as db:
+                counted = await analytics.backfill_day(db, day_ms)
+            logger.info("%s: %d orders", datetime.fromtimestamp(day_ms / 1000, tz=timezone.utc).date(), counted)
+            days += 1
+            total += counted
+            day_ms += analytics.DAY_MS
+        print(f"Backfilled {days} day(s), {total} order(s) in {time.perf_counter() - started:.1f}s")
+    finally:
+        await database.engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, help="first day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, help="day after the last one, YYYY-MM-DD")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(_main(args))
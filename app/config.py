@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -8,11 +9,122 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7 # 7 days
 
+    # Authenticated user lookups (invalidated on admin status changes)
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_SIZE: int = 10000
+    # How often each worker looks for status changes made through other workers
+    USER_CACHE_REVALIDATE_SECONDS: float = 2.0
+
+    # Password hashing thread pool
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_CONCURRENCY: int = 32 # running + queued, beyond this callers wait
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS: float = 5.0 # then 503
+
+    # How often a worker re-checks the pricing version against the DB
+    PRICING_CACHE_TTL_SECONDS: int = 60
+
+    # List endpoints
+    PAGE_DEFAULT_LIMIT: int = 50
+    PAGE_MAX_LIMIT: int = 200
+
+    # Background jobs from the outbox table, see app/core/jobs.py
+    JOBS_WORKERS: int = 4 # per process; 0 leaves this process's jobs to the others
+    JOBS_BATCH_SIZE: int = 200 # jobs claimed per poll
+    JOBS_POLL_SECONDS: float = 1.0 # idle poll, picks up jobs enqueued by other processes
+    JOBS_LEASE_SECONDS: int = 60 # a claimed job runs again after this if its worker died
+    JOBS_MAX_ATTEMPTS: int = 8 # then the job is marked dead
+    JOBS_RETRY_BASE_SECONDS: float = 2.0 # doubled on every further attempt
+
+    # Finished orders older than this move to orders_archive (0 disables)
+    ORDER_ARCHIVE_AFTER_DAYS: int = 90
+    ORDER_ARCHIVE_INTERVAL_SECONDS: int = 60 * 60
+    ORDER_ARCHIVE_BATCH_SIZE: int = 1000 # orders per transaction
+
+    # Admin CSV/NDJSON exports, see app/core/exports.py
+    EXPORT_CHUNK_ROWS: int = 5000 # rows fetched and encoded at a time
+    EXPORT_GZIP_LEVEL: int = 6
+
+    # Order analytics rollups, see app/core/analytics.py
+    ANALYTICS_MAX_BUCKETS: int = 24 * 92 # per /admin/analytics/orders response
+    ANALYTICS_BACKFILL_BATCH_SIZE: int = 5000 # rows fetched per round trip
+
+    # Recompute /admin/stats counters from source tables (0 disables)
+    STATS_RECONCILE_INTERVAL_SECONDS: int = 60 * 60
+
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./sql_app.db")
+    DB_ECHO: bool = False # log every statement
+    # Connection pool, per worker process (ignored for SQLite)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 10.0 # waiting for a free connection
+    DB_POOL_RECYCLE_SECONDS: int = 30 * 60
+    DB_POOL_PRE_PING: bool = True
+    # asyncpg only; set the statement cache to 0 behind PgBouncer in transaction mode
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_COMMAND_TIMEOUT_SECONDS: float = 30.0
+    # SQLite only; how long a write waits for another connection's lock
+    DB_SQLITE_BUSY_TIMEOUT_SECONDS: float = 30.0
+    # Optional read replica for read-only endpoints (same pool settings as the primary)
+    DATABASE_READ_URL: Optional[str] = os.getenv("DATABASE_READ_URL")
+    DB_READ_RETRY_SECONDS: float = 30.0 # after a failed replica connection, read from the primary this long
+    # Read-your-writes: a caller's reads stay on the primary this long after
+    # their last write (0 disables). Tracked per worker process.
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0
+    DB_READ_YOUR_WRITES_MAX_SIZE: int = 100000
+
+    # /metrics, require `Authorization: Bearer <token>` when set
+    METRICS_TOKEN: Optional[str] = os.getenv("METRICS_TOKEN")
+
+    # Per-request query instrumentation
+    DB_SLOW_QUERY_MS: float = 200.0
+    DB_REQUEST_QUERY_WARN: int = 50 # queries in one request
+    DB_REPEATED_QUERY_WARN: int = 10 # same statement in one request, likely N+1
     
     # Uploads
     UPLOAD_DIR: str = os.path.join(os.getcwd(), "uploads")
+    UPLOAD_MAX_BYTES: int = 5 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 64 * 1024
+
+    # Geo index for pending orders
+    GEO_CELL_DEGREES: float = 0.01 # ~1.1 km grid cells
+    GEO_INDEX_REFRESH_SECONDS: int = 30 # resync with the DB (other workers' orders)
+    DRIVER_ORDERS_RADIUS_KM: float = 10.0
+    DRIVER_ORDERS_LIMIT: int = 20
+
+    # Driver locations are buffered in memory and written back in batches
+    LOCATION_FLUSH_INTERVAL_SECONDS: float = 5.0
+    # Location history: every ping is appended to compact per-driver chunks
+    LOCATION_HISTORY_FLUSH_SECONDS: float = 30.0
+    LOCATION_HISTORY_MAX_BUFFERED: int = 1_000_000 # pings per process, newer ones dropped beyond this
+    LOCATION_HISTORY_RAW_HOURS: int = 48 # then thinned to one point per DOWNSAMPLE_SECONDS
+    LOCATION_HISTORY_DOWNSAMPLE_SECONDS: int = 15
+    LOCATION_HISTORY_WINDOW_SECONDS: int = 60 * 60 # thinned chunks hold one window per driver
+    LOCATION_HISTORY_DOWNSAMPLE_INTERVAL_SECONDS: int = 60 * 60 # 0 disables
+    LOCATION_HISTORY_DOWNSAMPLE_BATCH: int = 5000 # chunks per transaction
+
+    # Realtime push over WebSocket
+    EVENTS_QUEUE_SIZE: int = 100 # per connection, oldest events dropped beyond this
+    EVENTS_AREA_CELL_DEGREES: float = 0.05 # ~5.5 km area topics for pending orders
+
+    # Fare quotes: distance is the great-circle distance times a road factor,
+    # computed between snapped cells so nearby requests share cached quotes
+    QUOTE_ROAD_FACTOR: float = 1.3
+    QUOTE_CELL_DEGREES: float = 0.001 # ~110 m
+    QUOTE_CACHE_TTL_SECONDS: int = 10 * 60
+    QUOTE_CACHE_MAX_SIZE: int = 50000
+    QUOTE_MAX_TRIPS: int = 50
+
+    # Bulk delivery creation for merchants, items per request
+    BULK_ORDER_MAX_ITEMS: int = 500
+
+    # Batch dispatch: offers pending orders to the nearest free drivers.
+    # Offers live in process memory, enable it on one worker only.
+    DISPATCH_ENABLED: bool = False
+    DISPATCH_INTERVAL_SECONDS: float = 3.0
+    DISPATCH_MAX_PICKUP_KM: float = 5.0
+    DISPATCH_OFFER_TTL_SECONDS: float = 15.0
+    DISPATCH_DRIVER_MAX_AGE_SECONDS: int = 60 # drivers without a newer fix are offline
 
     class Config:
         case_sensitive = True
@@ -0,0 +1,223 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.core import jobs, pagination
+from app.core.location_history import epoch_ms, from_epoch_ms
+
+# Hourly and daily rollups of finished orders per type and status: count,
+# revenue, price and distance sums. Orders are bucketed by created_at (UTC),
+# so a bucket is final once its orders are. order_state queues every
+# completion and cancellation as a job in the same transaction and a batch
+# handler adds them to the order_rollups rows; backfill_day() rebuilds a day
+# from orders and orders_archive (`python -m app.backfill`).
+#
+# Range queries read at most one row per bucket, type and status: summaries
+# use day rows for the whole days of a range and hour rows for its ends.
+
+ROLLUP_JOB = "analytics.rollup"
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+GRANULARITIES = {"hour": HOUR_MS, "day": DAY_MS}
+
+FINAL_STATUSES = (models.OrderStatus.COMPLETED, models.OrderStatus.CANCELLED)
+MEASURES = ("orders", "revenue", "price_sum", "distance_km_sum", "distance_orders")
+
+Key = Tuple[str, int, str, str] # granularity, bucket_ms, type, status
+
+def _plain(value) -> str:
+    return getattr(value, "value", value)
+
+def floor_ms(value_ms: int, size_ms: int) -> int:
+    return value_ms - value_ms % size_ms
+
+def ceil_ms(value_ms: int, size_ms: int) -> int:
+    return -floor_ms(-value_ms, size_ms)
+
+def _payload(order_type: str, status: str, created_at: datetime, price: float, distance_km: Optional[float]) -> dict:
+    return {
+        "type": _plain(order_type),
+        "status": _plain(status),
+        "created_ms": epoch_ms(created_at),
+        "price": price,
+        "distance_km": distance_km,
+    }
+
+def record(db: AsyncSession, order_type: str, status: str, created_at: datetime, price: float, distance_km: Optional[float]):
+    # Queues a finished order in the caller's transaction. price is what the
+    # customer pays for completed orders and the quote for cancelled ones.
+    jobs.enqueue(db, ROLLUP_JOB, _payload(order_type, status, created_at, price, distance_km))
+
+def _totals() -> Dict[Key, Dict[str, float]]:
+    return defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+
+def _add(totals: Dict[Key, Dict[str, float]], payload: dict, sign: int = 1):
+    completed = payload["status"] == models.OrderStatus.COMPLETED
+    for granularity, size_ms in GRANULARITIES.items():
+        measures = totals[(granularity, floor_ms(payload["created_ms"], size_ms), payload["type"], payload["status"])]
+        measures["orders"] += sign
+        measures["price_sum"] += sign * payload["price"]
+        if completed:
+            measures["revenue"] += sign * payload["price"]
+        if payload["distance_km"] is not None:
+            measures["distance_km_sum"] += sign * payload["distance_km"]
+            measures["distance_orders"] += sign
+
+def _key_filter(key: Key):
+    granularity, bucket_ms, order_type, status = key
+    return and_(
+        models.OrderRollup.granularity == granularity,
+        models.OrderRollup.bucket_ms == bucket_ms,
+        models.OrderRollup.type == order_type,
+        models.OrderRollup.status == status,
+    )
+
+@jobs.handler(ROLLUP_JOB, batch=True)
+async def apply_queued(db: AsyncSession, payloads: List[dict]):
+    # One update per touched row, in key order so concurrent batches lock
+    # rows the same way. Two batches creating the same new row conflict on
+    # the primary key; the loser is retried by the job queue.
+    totals = _totals()
+    for payload in payloads:
+        _add(totals, payload)
+    for key in sorted(totals):
+        measures = totals[key]
+        result = await db.execute(
+            update(models.OrderRollup)
+            .where(_key_filter(key))
+            .values({name: getattr(models.OrderRollup, name) + measures[name] for name in MEASURES})
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            granularity, bucket_ms, order_type, status = key
+            db.add(models.OrderRollup(granularity=granularity, bucket_ms=bucket_ms, type=order_type, status=status, **measures))
+
+def _price(status: str, actual_price: Optional[float], estimated_price: float) -> float:
+    if status == models.OrderStatus.COMPLETED and actual_price is not None:
+        return actual_price
+    return estimated_price
+
+async def first_order_day(db: AsyncSession) -> Optional[int]:
+    # Start of the UTC day of the oldest finished order, live or archived
+    earliest = []
+    for model in (models.Order, models.ArchivedOrder):
+        created_at = await db.scalar(select(func.min(model.created_at)).where(model.status.in_(FINAL_STATUSES)))
+        if created_at is not None:
+            earliest.append(epoch_ms(created_at))
+    return floor_ms(min(earliest), DAY_MS) if earliest else None
+
+async def backfill_day(db: AsyncSession, day_ms: int) -> int:
+    # Recomputes the hour and day rollups of the UTC day starting at day_ms
+    # from orders and orders_archive and replaces the stored rows. Orders
+    # are streamed, so memory stays bounded by the number of rollup rows.
+    # Like stats.reconcile, jobs applied while this runs can be missed.
+    # Commits; returns the number of orders counted.
+    totals = _totals()
+    counted = 0
+    day_start, day_end = from_epoch_ms(day_ms), from_epoch_ms(day_ms + DAY_MS)
+    for model in (models.Order, models.ArchivedOrder):
+        query = select(
+            model.type, model.status, model.created_at, model.actual_price, model.estimated_price, model.distance_km
+        ).where(model.status.in_(FINAL_STATUSES))
+        query = pagination.filter_created(db, query, model.created_at, day_start, day_end)
+        result = await db.stream(query.execution_options(yield_per=settings.ANALYTICS_BACKFILL_BATCH_SIZE))
+        async for row in result:
+            price = _price(row.status, row.actual_price, row.estimated_price)
+            _add(totals, _payload(row.type, row.status, row.created_at, price, row.distance_km))
+            counted += 1
+
+    # Jobs still in the outbox get added on top of what is written here
+    queued = await db.execute(
+        select(models.OutboxJob.payload).where(models.OutboxJob.kind == ROLLUP_JOB, models.OutboxJob.dead == False)
+    )
+    for (payload,) in queued.all():
+        if day_ms <= payload["created_ms"] < day_ms + DAY_MS:
+            _add(totals, payload, sign=-1)
+
+    await db.execute(
+        delete(models.OrderRollup)
+        .where(models.OrderRollup.bucket_ms >= day_ms, models.OrderRollup.bucket_ms < day_ms + DAY_MS)
+        .execution_options(synchronize_session=False)
+    )
+    rows = [
+        {"granularity": granularity, "bucket_ms": bucket_ms, "type": order_type, "status": status, **measures}
+        for (granularity, bucket_ms, order_type, status), measures in totals.items()
+        if measures["orders"]
+    ]
+    if rows:
+        await db.execute(insert(models.OrderRollup), rows)
+    await db.commit()
+    return counted
+
+def _filters(order_type: Optional[str], status: Optional[str]) -> list:
+    conditions = []
+    if order_type:
+        conditions.append(models.OrderRollup.type == order_type)
+    if status:
+        conditions.append(models.OrderRollup.status == status)
+    return conditions
+
+def _measures(row) -> dict:
+    return {
+        "type": row.type,
+        "status": row.status,
+        "orders": int(row.orders),
+        "revenue": row.revenue,
+        "avg_price": row.price_sum / row.orders if row.orders else None,
+        "avg_distance_km": row.distance_km_sum / row.distance_orders if row.distance_orders else None,
+    }
+
+async def series(
+    db: AsyncSession, granularity: str, start_ms: int, end_ms: int, order_type: Optional[str] = None, status: Optional[str] = None
+) -> List[dict]:
+    # Buckets overlapping [start_ms, end_ms), oldest first
+    size_ms = GRANULARITIES[granularity]
+    result = await db.execute(
+        select(models.OrderRollup)
+        .where(
+            models.OrderRollup.granularity == granularity,
+            models.OrderRollup.bucket_ms >= floor_ms(start_ms, size_ms),
+            models.OrderRollup.bucket_ms < end_ms,
+            *_filters(order_type, status),
+        )
+        .order_by(models.OrderRollup.bucket_ms, models.OrderRollup.type, models.OrderRollup.status)
+    )
+    return [dict(_measures(row), start=from_epoch_ms(row.bucket_ms)) for row in result.scalars().all()]
+
+def summary_ranges(start_ms: int, end_ms: int) -> List[Tuple[str, int, int]]:
+    # Covers the hours overlapping [start_ms, end_ms) with day buckets for
+    # the whole days and hour buckets for the rest
+    hours_from, hours_to = floor_ms(start_ms, HOUR_MS), ceil_ms(end_ms, HOUR_MS)
+    days_from, days_to = ceil_ms(hours_from, DAY_MS), floor_ms(hours_to, DAY_MS)
+    if days_from >= days_to:
+        return [("hour", hours_from, hours_to)]
+    ranges = [("hour", hours_from, days_from), ("day", days_from, days_to), ("hour", days_to, hours_to)]
+    return [(granularity, low, high) for granularity, low, high in ranges if low < high]
+
+async def summary(
+    db: AsyncSession, start_ms: int, end_ms: int, order_type: Optional[str] = None, status: Optional[str] = None
+) -> List[dict]:
+    # Totals per type and status over the hours overlapping [start_ms, end_ms)
+    rollup = models.OrderRollup
+    covered = or_(*(
+        and_(rollup.granularity == granularity, rollup.bucket_ms >= low, rollup.bucket_ms < high)
+        for granularity, low, high in summary_ranges(start_ms, end_ms)
+    ))
+    result = await db.execute(
+        select(
+            rollup.type,
+            rollup.status,
+            *(func.sum(getattr(rollup, name)).label(name) for name in MEASURES),
+        )
+        .where(covered, *_filters(order_type, status))
+        .group_by(rollup.type, rollup.status)
+        .order_by(rollup.type, rollup.status)
+    )
+    return [_measures(row) for row in result.all()]
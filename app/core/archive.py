@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Sequence
+
+from sqlalchemy import delete, exists, func, insert, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.core import database, pagination
+
+logger = logging.getLogger(__name__)
+
+# Completed and cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS move from
+# orders to orders_archive in batched background runs, so the live table only
+# holds recent and active orders and the pending/dispatch/driver queries stay
+# small. History reads go through order_history_page() and find_order(),
+# which look at both tables. Orders with a rating stay live, ratings
+# reference orders.id.
+
+FINAL_STATUSES = (models.OrderStatus.COMPLETED, models.OrderStatus.CANCELLED)
+
+def includes_archive(status: Optional[str]) -> bool:
+    # Archived orders are always finished, filtering by a live status never needs them
+    return status is None or status in FINAL_STATUSES
+
+def order_history_page(
+    db: AsyncSession,
+    names: Sequence[str],
+    where: Callable[[type], List],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    cursor: Optional[str],
+    limit: int,
+    include_archive: bool = True,
+):
+    # Keyset page over live and archived orders. where(model) returns the
+    # filters for either table. Filters, cursor and limit are applied inside
+    # each branch, so both use their own indexes and the outer query only
+    # merges at most 2 * (limit + 1) rows.
+    sources = (models.Order, models.ArchivedOrder) if include_archive else (models.Order,)
+    branches = []
+    for model in sources:
+        query = select(*(getattr(model, name) for name in names)).where(*where(model))
+        query = pagination.filter_created(db, query, model.created_at, created_from, created_to)
+        branches.append(pagination.apply_keyset(db, query, model.created_at, model.id, cursor, limit))
+    if len(branches) == 1:
+        return branches[0]
+
+    # SQLite does not allow ORDER BY/LIMIT directly on compound members
+    history = union_all(*(select(branch.subquery()) for branch in branches)).subquery("order_history")
+    return pagination.apply_keyset(db, select(history), history.c.created_at, history.c.id, None, limit)
+
+async def find_order(db: AsyncSession, names: Sequence[str], order_id: int):
+    # Live table first; only orders that are not there cost a second lookup
+    for model in (models.Order, models.ArchivedOrder):
+        result = await db.execute(select(*(getattr(model, name) for name in names)).where(model.id == order_id))
+        row = result.first()
+        if row is not None:
+            return row
+    return None
+
+async def archive_batch(db: AsyncSession, cutoff: datetime, batch_size: int) -> int:
+    # Copies up to batch_size finished orders created before cutoff and
+    # deletes them from orders in one transaction. If another worker archived
+    # some of them first, the delete count differs and this batch rolls back.
+    result = await db.execute(
+        select(models.Order.id)
+        .where(
+            models.Order.status.in_(FINAL_STATUSES),
+            models.Order.created_at < cutoff,
+            ~exists().where(models.Rating.order_id == models.Order.id),
+            # Only possible on SQLite databases from before v008, which reused
+            # archived ids; such orders stay live rather than block every run
+            ~exists().where(models.ArchivedOrder.id == models.Order.id),
+        )
+        .order_by(models.Order.created_at)
+        .limit(batch_size)
+    )
+    ids = result.scalars().all()
+    if not ids:
+        return 0
+
+    names = [column.name for column in models.Order.__table__.columns]
+    await db.execute(
+        insert(models.ArchivedOrder).from_select(
+            names, select(*(models.Order.__table__.c[name] for name in names)).where(models.Order.id.in_(ids))
+        )
+    )
+    deleted = await db.execute(
+        delete(models.Order)
+        .where(models.Order.id.in_(ids), models.Order.status.in_(FINAL_STATUSES))
+        .execution_options(synchronize_session=False)
+    )
+    if deleted.rowcount != len(ids):
+        await db.rollback()
+        return 0
+    await db.commit()
+    return len(ids)
+
+async def count_by_status(db: AsyncSession) -> dict:
+    # Order counts per status across both tables, for stats reconciliation
+    counts: dict = {}
+    for model in (models.Order, models.ArchivedOrder):
+        result = await db.execute(select(model.status, func.count(model.id)).group_by(model.status))
+        for status, count in result.all():
+            counts[status] = counts.get(status, 0) + count
+    return counts
+
+class OrderArchiver:
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+        total = 0
+        while True:
+            try:
+                async with database.SessionLocal() as db:
+                    moved = await archive_batch(db, cutoff, self.batch_size)
+            except Exception:
+                # e.g. another worker archiving the same rows at the same time
+                logger.exception("Archiving orders failed")
+                return total
+            total += moved
+            if moved < self.batch_size:
+                if total:
+                    logger.info("Archived %d orders created before %s", total, cutoff.isoformat())
+                return total
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
+
+    def start(self):
+        if self._task is None and self.interval > 0 and settings.ORDER_ARCHIVE_AFTER_DAYS > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+archiver = OrderArchiver(settings.ORDER_ARCHIVE_INTERVAL_SECONDS, settings.ORDER_ARCHIVE_BATCH_SIZE)
@@ -0,0 +1,39 @@
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.core import jobs
+
+# Audit trail of order transitions and admin actions. record() only queues a
+# job in the caller's transaction; the entry is written in the background
+# once that transaction commits, so nothing is logged for rolled back changes.
+
+AUDIT_JOB = "audit.record"
+
+def record(db: AsyncSession, action: str, actor_id: Optional[int], subject_type: str, subject_id: Optional[int], **details):
+    jobs.enqueue(db, AUDIT_JOB, {
+        "action": action,
+        "actor_id": actor_id,
+        "subject_type": subject_type,
+        "subject_id": subject_id,
+        "details": details or None,
+        "at_ms": int(time.time() * 1000),
+    })
+
+@jobs.handler(AUDIT_JOB, batch=True)
+async def write_entries(db: AsyncSession, payloads: List[dict]):
+    await db.execute(insert(models.AuditEntry), [
+        {
+            "action": payload["action"],
+            "actor_id": payload["actor_id"],
+            "subject_type": payload["subject_type"],
+            "subject_id": payload["subject_id"],
+            "details": payload["details"],
+            "created_at": datetime.fromtimestamp(payload["at_ms"] / 1000, tz=timezone.utc),
+        }
+        for payload in payloads
+    ])
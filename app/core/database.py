@@ -1,15 +1,116 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import settings
+from app.core import metrics, querystats
+from app.core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+def engine_options(url: str) -> dict:
+    options = {"echo": settings.DB_ECHO, "pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"timeout": settings.DB_SQLITE_BUSY_TIMEOUT_SECONDS}
+        return options
+    options.update(
+        poolclass=metrics.TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    )
+    if url.startswith("postgresql+asyncpg"):
+        options["connect_args"] = {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "command_timeout": settings.DB_COMMAND_TIMEOUT_SECONDS,
+        }
+    return options
+
+engine = create_async_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+querystats.instrument(engine.sync_engine)
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+def _checked_out() -> int:
+    pool = engine.sync_engine.pool
+    return pool.checkedout() if hasattr(pool, "checkedout") else 0
+
+metrics.registry.gauge("dot_db_pool_checked_out", "DB connections currently checked out", function=_checked_out)
 
 SessionLocal = sessionmaker(
     autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
 )
 
+# Read replica. Without DATABASE_READ_URL, get_read_db hands out primary sessions.
+read_engine = None
+ReadSessionLocal = None
+if settings.DATABASE_READ_URL:
+    read_engine = create_async_engine(settings.DATABASE_READ_URL, **engine_options(settings.DATABASE_READ_URL))
+    querystats.instrument(read_engine.sync_engine)
+    ReadSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, bind=read_engine, class_=AsyncSession
+    )
+
+read_fallbacks = metrics.registry.counter(
+    "dot_db_read_fallbacks", "Reads served by the primary although a replica is configured", ("reason",)
+)
+
 Base = declarative_base()
 
-async def get_db():
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+# Authorization header -> True for callers who wrote within DB_READ_YOUR_WRITES_SECONDS
+_recent_writers = TTLCache(settings.DB_READ_YOUR_WRITES_MAX_SIZE, settings.DB_READ_YOUR_WRITES_SECONDS)
+_replica_down_until = 0.0
+
+async def get_db(request: Request):
+    # Every authenticated request resolves this through get_current_user, so
+    # this is where a write marks its caller for read-your-writes. Marked up
+    # front, a read racing the response still goes to the primary.
+    if request.method not in SAFE_METHODS and settings.DB_READ_YOUR_WRITES_SECONDS > 0:
+        authorization = request.headers.get("authorization")
+        if authorization:
+            _recent_writers.set(authorization, True)
     async with SessionLocal() as session:
         yield session
+
+async def replica_session() -> Optional[AsyncSession]:
+    # Connects eagerly so an unreachable replica is noticed here, not halfway
+    # through the endpoint. After a failure reads use the primary for
+    # DB_READ_RETRY_SECONDS before the replica is tried again. None without
+    # a usable replica; the caller closes the session.
+    if ReadSessionLocal is None:
+        return None
+    global _replica_down_until
+    if time.monotonic() < _replica_down_until:
+        read_fallbacks.labels("unavailable").inc()
+        return None
+    session = ReadSessionLocal()
+    try:
+        await session.connection()
+    except (DBAPIError, OSError, asyncio.TimeoutError) as error:
+        await session.close()
+        _replica_down_until = time.monotonic() + settings.DB_READ_RETRY_SECONDS
+        logger.warning("Read replica unavailable, reading from the primary for %ss: %s", settings.DB_READ_RETRY_SECONDS, error)
+        read_fallbacks.labels("unavailable").inc()
+        return None
+    return session
+
+async def get_read_db(request: Request):
+    # For endpoints that only read. Results may lag the primary by the
+    # replication delay, except for callers who just wrote (see get_db).
+    session = None
+    if ReadSessionLocal is not None:
+        authorization = request.headers.get("authorization")
+        if authorization and _recent_writers.get(authorization):
+            read_fallbacks.labels("read_your_writes").inc()
+        else:
+            session = await replica_session()
+    if session is None:
+        session = SessionLocal()
+    async with session:
+        yield session
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.core import database, events, geo, locations, metrics
+
+logger = logging.getLogger(__name__)
+
+# Every tick takes all pending orders and all drivers with a recent fix, builds
+# the order x driver distance matrix in one vectorized pass and assigns pairs
+# globally, so a driver is offered the order they are best placed for instead
+# of whatever they grab first. Offers are advisory: the driver still takes the
+# order through PUT /driver/orders/{id}/accept and its compare-and-set.
+
+@dataclass(frozen=True)
+class Offer:
+    order_id: int
+    driver_id: int
+    distance_km: float
+    expires_at: float # time.monotonic()
+
+def match(distances: np.ndarray, max_km: float) -> List[Tuple[int, int, float]]:
+    # Greedy global matching by mutual-nearest rounds: each round pairs every
+    # order whose nearest free driver also has that order as its nearest, then
+    # drops the matched rows and columns. The result is the same as repeatedly
+    # taking the globally closest remaining pair, but each round settles many
+    # pairs at once. Returns (order_index, driver_index, distance_km).
+    pairs: List[Tuple[int, int, float]] = []
+    if distances.size == 0:
+        return pairs
+
+    order_ids = np.arange(distances.shape[0])
+    driver_ids = np.arange(distances.shape[1])
+    remaining = np.where(distances <= max_km, distances, np.inf).astype(np.float32, copy=False)
+
+    while remaining.size:
+        nearest_driver = remaining.argmin(axis=1)
+        nearest_distance = remaining[np.arange(remaining.shape[0]), nearest_driver]
+        reachable = np.isfinite(nearest_distance)
+        if not reachable.any():
+            break
+
+        nearest_order = remaining.argmin(axis=0)
+        rows = np.flatnonzero(reachable & (nearest_order[nearest_driver] == np.arange(remaining.shape[0])))
+        cols = nearest_driver[rows]
+        if rows.size == 0:
+            # Only possible with exact ties, fall back to the single closest pair
+            row, col = np.unravel_index(remaining.argmin(), remaining.shape)
+            rows, cols = np.array([row]), np.array([col])
+
+        pairs.extend(zip(order_ids[rows].tolist(), driver_ids[cols].tolist(), remaining[rows, cols].tolist()))
+
+        # Keep orders that are still reachable by somebody and drivers not taken
+        keep_rows = reachable.copy()
+        keep_rows[rows] = False
+        keep_cols = np.ones(remaining.shape[1], dtype=bool)
+        keep_cols[cols] = False
+        remaining = remaining[keep_rows][:, keep_cols]
+        order_ids = order_ids[keep_rows]
+        driver_ids = driver_ids[keep_cols]
+
+    return pairs
+
+def assign(
+    orders: List[Tuple[int, float, float]],
+    drivers: List[Tuple[int, float, float]],
+    max_km: float,
+    excluded: Optional[Set[Tuple[int, int]]] = None,
+) -> List[Tuple[int, int, float]]:
+    # (order_id, lat, lng) x (driver_id, lat, lng) -> [(order_id, driver_id, distance_km)]
+    if not orders or not drivers:
+        return []
+
+    order_points = np.array([(lat, lng) for _, lat, lng in orders], dtype=np.float64)
+    driver_points = np.array([(lat, lng) for _, lat, lng in drivers], dtype=np.float64)
+    distances = geo.haversine_km_matrix(order_points[:, 0], order_points[:, 1], driver_points[:, 0], driver_points[:, 1])
+
+    if excluded:
+        order_index = {order_id: index for index, (order_id, _, _) in enumerate(orders)}
+        driver_index = {driver_id: index for index, (driver_id, _, _) in enumerate(drivers)}
+        for order_id, driver_id in excluded:
+            if order_id in order_index and driver_id in driver_index:
+                distances[order_index[order_id], driver_index[driver_id]] = np.inf
+
+    return [
+        (orders[row][0], drivers[col][0], distance)
+        for row, col, distance in match(distances, max_km)
+    ]
+
+class Dispatcher:
+    def __init__(self, interval: float, max_km: float, offer_ttl: float, driver_max_age: float):
+        self.interval = interval
+        self.max_km = max_km
+        self.offer_ttl = offer_ttl
+        self.driver_max_age = driver_max_age
+        self._offers: Dict[int, Offer] = {} # by driver
+        self._offered_orders: Dict[int, int] = {} # order -> driver
+        self._declined: Dict[Tuple[int, int], float] = {} # (order, driver) -> until
+        self._task: Optional[asyncio.Task] = None
+
+    def offer_for(self, driver_id: int) -> Optional[Offer]:
+        offer = self._offers.get(driver_id)
+        if offer is None or offer.expires_at <= time.monotonic():
+            return None
+        return offer
+
+    def decline(self, driver_id: int, order_id: int) -> bool:
+        # The same pair is not offered again until the offer would have expired twice over
+        offer = self._offers.get(driver_id)
+        if offer is None or offer.order_id != order_id:
+            return False
+        self._drop(offer)
+        self._declined[(order_id, driver_id)] = time.monotonic() + 2 * self.offer_ttl
+        return True
+
+    def _drop(self, offer: Offer):
+        self._offers.pop(offer.driver_id, None)
+        if self._offered_orders.get(offer.order_id) == offer.driver_id:
+            del self._offered_orders[offer.order_id]
+
+    def _expire(self, now: float):
+        for offer in list(self._offers.values()):
+            if offer.expires_at <= now or offer.order_id not in geo.pending_orders:
+                self._drop(offer)
+        self._declined = {pair: until for pair, until in self._declined.items() if until > now}
+
+    async def _available_drivers(self) -> List[Tuple[int, float, float]]:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.driver_max_age)
+        async with database.SessionLocal() as db:
+            await geo.ensure_pending_orders(db)
+            result = await db.execute(
+                select(models.User.id, models.User.current_lat, models.User.current_lng)
+                .where(models.User.role == models.UserRole.DRIVER)
+                .where(models.User.is_active == True)
+                .where(models.User.current_lat.isnot(None), models.User.current_lng.isnot(None))
+                .where(models.User.last_location_update >= cutoff)
+            )
+            positions = {driver_id: (lat, lng) for driver_id, lat, lng in result.all()}
+            busy = await db.execute(
+                select(models.Order.driver_id)
+                .where(models.Order.status.in_([models.OrderStatus.ACCEPTED, models.OrderStatus.IN_PROGRESS]))
+                .distinct()
+            )
+            busy_ids = set(busy.scalars().all())
+
+        # Fixes buffered in this process are newer than what has been flushed
+        for driver_id, (lat, lng, updated_at) in locations.driver_locations.items():
+            if updated_at >= cutoff and driver_id in positions:
+                positions[driver_id] = (lat, lng)
+
+        return [
+            (driver_id, lat, lng)
+            for driver_id, (lat, lng) in positions.items()
+            if driver_id not in busy_ids and driver_id not in self._offers
+        ]
+
+    async def tick(self) -> List[Offer]:
+        # Expired offers go first, so their drivers are available again this tick
+        self._expire(time.monotonic())
+        drivers = await self._available_drivers()
+
+        orders = [
+            (order_id, lat, lng)
+            for order_id, (lat, lng) in geo.pending_orders.items()
+            if order_id not in self._offered_orders
+        ]
+        if not orders or not drivers:
+            return []
+
+        # The matrix work releases the GIL, keep it off the event loop
+        pairs = await asyncio.to_thread(assign, orders, drivers, self.max_km, set(self._declined))
+
+        offers = []
+        expires_at = time.monotonic() + self.offer_ttl
+        for order_id, driver_id, distance in pairs:
+            offer = Offer(order_id, driver_id, round(distance, 3), expires_at)
+            self._offers[driver_id] = offer
+            self._offered_orders[order_id] = driver_id
+            events.publish_order_offer(order_id, driver_id, offer.distance_km, self.offer_ttl)
+            offers.append(offer)
+        return offers
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                started = time.perf_counter()
+                offers = await self.tick()
+                if offers:
+                    logger.info("Dispatched %d offers in %.1f ms", len(offers), (time.perf_counter() - started) * 1000)
+            except Exception:
+                logger.exception("Dispatch tick failed")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+dispatcher = Dispatcher(
+    settings.DISPATCH_INTERVAL_SECONDS,
+    settings.DISPATCH_MAX_PICKUP_KM,
+    settings.DISPATCH_OFFER_TTL_SECONDS,
+    settings.DISPATCH_DRIVER_MAX_AGE_SECONDS,
+)
+metrics.registry.gauge("dot_dispatch_open_offers", "Dispatch offers waiting for the driver", function=lambda: len(dispatcher._offers))
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import math
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.config import settings
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+# In-process pub/sub for pushing order and driver updates to WebSocket clients.
+# Topics:
+#   order:<id>        status changes of one order
+#   driver:<id>       position of one driver
+#   offers:<id>       dispatch offers made to one driver
+#   area:<row>:<col>  pending orders appearing/disappearing in a map cell
+# Each worker has its own hub, so a client only sees events published by the
+# worker it is connected to.
+
+def order_topic(order_id: int) -> str:
+    return f"order:{order_id}"
+
+def driver_topic(driver_id: int) -> str:
+    return f"driver:{driver_id}"
+
+def offers_topic(driver_id: int) -> str:
+    return f"offers:{driver_id}"
+
+def _area_cell(lat: float, lng: float):
+    cell = settings.EVENTS_AREA_CELL_DEGREES
+    return math.floor(lat / cell), math.floor(lng / cell)
+
+def area_topic(lat: float, lng: float) -> str:
+    return "area:%d:%d" % _area_cell(lat, lng)
+
+def area_topics_around(lat: float, lng: float) -> Set[str]:
+    # The cell containing the point plus its eight neighbours
+    row, col = _area_cell(lat, lng)
+    return {f"area:{row + d_row}:{col + d_col}" for d_row in (-1, 0, 1) for d_col in (-1, 0, 1)}
+
+class Subscription:
+    def __init__(self, hub: "EventHub", queue_size: int):
+        self.hub = hub
+        self.topics: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def deliver(self, event: dict):
+        # Slow consumers lose their oldest events rather than blocking publishers
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def subscribe(self, *topics: str):
+        self.hub._attach(self, topics)
+
+    def unsubscribe(self, *topics: str):
+        self.hub._detach(self, topics)
+
+    def set_topics(self, prefix: str, topics: Iterable[str]):
+        # Replaces every current topic starting with `prefix`
+        wanted = set(topics)
+        current = {topic for topic in self.topics if topic.startswith(prefix)}
+        self.unsubscribe(*(current - wanted))
+        self.subscribe(*(wanted - current))
+
+    def close(self):
+        self.hub._detach(self, set(self.topics))
+
+class EventHub:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, *topics: str) -> Subscription:
+        subscription = Subscription(self, self.queue_size)
+        subscription.subscribe(*topics)
+        return subscription
+
+    def publish(self, topic: str, event: dict) -> int:
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return 0
+        for subscription in list(subscribers):
+            subscription.deliver(event)
+        return len(subscribers)
+
+    def has_subscribers(self, topic: str) -> bool:
+        return topic in self._subscribers
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _attach(self, subscription: Subscription, topics: Iterable[str]):
+        for topic in topics:
+            self._subscribers[topic].add(subscription)
+            subscription.topics.add(topic)
+
+    def _detach(self, subscription: Subscription, topics: Iterable[str]):
+        for topic in topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+            subscription.topics.discard(topic)
+
+hub = EventHub(settings.EVENTS_QUEUE_SIZE)
+metrics.registry.gauge("dot_ws_topic_subscriptions", "WebSocket topic subscriptions in this worker", function=hub.subscriber_count)
+
+def publish_order_status(order_id: int, status: str, driver_id: Optional[int] = None):
+    hub.publish(order_topic(order_id), {
+        "type": "order.status",
+        "order_id": order_id,
+        "status": status,
+        "driver_id": driver_id,
+    })
+
+def publish_order_available(order_id: int, order_type: str, lat: float, lng: float, estimated_price: float):
+    hub.publish(area_topic(lat, lng), {
+        "type": "order.available",
+        "order_id": order_id,
+        "order_type": order_type,
+        "pickup_lat": lat,
+        "pickup_lng": lng,
+        "estimated_price": estimated_price,
+    })
+
+def publish_order_unavailable(order_id: int, lat: float, lng: float):
+    hub.publish(area_topic(lat, lng), {"type": "order.unavailable", "order_id": order_id})
+
+def publish_order_offer(order_id: int, driver_id: int, distance_km: float, expires_in: float):
+    hub.publish(offers_topic(driver_id), {
+        "type": "order.offer",
+        "order_id": order_id,
+        "distance_km": distance_km,
+        "expires_in": expires_in,
+    })
+
+def publish_driver_location(driver_id: int, lat: float, lng: float):
+    # Called on every ping, so skip building the event when nobody listens
+    topic = driver_topic(driver_id)
+    if hub.has_subscribers(topic):
+        hub.publish(topic, {"type": "driver.location", "driver_id": driver_id, "lat": lat, "lng": lng})
+
+async def pump(
+    websocket: WebSocket,
+    subscription: Subscription,
+    on_event: Optional[Callable[[dict], None]] = None,
+    on_message: Optional[Callable[[dict], Awaitable[None]]] = None,
+):
+    # Forwards hub events to the socket until the client disconnects.
+    # Incoming JSON messages are handed to on_message.
+    async def forward():
+        while True:
+            event = await subscription.get()
+            if on_event is not None:
+                on_event(event)
+            await websocket.send_json(event)
+
+    async def receive():
+        while True:
+            message = await websocket.receive_json()
+            if on_message is not None:
+                await on_message(message)
+
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(receive())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            exc = task.exception()
+            if exc is not None and not isinstance(exc, WebSocketDisconnect):
+                logger.warning("WebSocket stream ended with error: %r", exc)
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
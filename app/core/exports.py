@@ -0,0 +1,178 @@
+import csv
+import io
+import logging
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.core import archive, database, ledger, pagination
+
+logger = logging.getLogger(__name__)
+
+# Streaming CSV/NDJSON exports for admins. Rows are fetched, encoded and
+# optionally gzipped EXPORT_CHUNK_ROWS at a time, so memory use does not grow
+# with the size of the export.
+#
+# With a read replica the whole export is one server-side cursor on the
+# replica (yield_per). Without one it reads the primary in keyset chunks by
+# id, each in its own short transaction, so a long export never holds a
+# transaction (and old row versions) open on the primary. Rows written
+# while a chunked export runs may or may not be included.
+#
+# The response starts before the first row is read and the request's
+# sessions are closed by then, so exports open their own.
+
+# A filtered SELECT for one table, without ORDER BY or LIMIT, plus the
+# integer primary key column it is ordered and chunked by
+Source = Tuple[Callable[[AsyncSession], object], object]
+
+async def _chunks(sources: Sequence[Source]) -> AsyncIterator[List]:
+    chunk_rows = settings.EXPORT_CHUNK_ROWS
+    session = await database.replica_session()
+    if session is not None:
+        async with session:
+            for build, id_column in sources:
+                query = build(session).order_by(id_column).execution_options(yield_per=chunk_rows)
+                result = await session.stream(query)
+                async for rows in result.partitions():
+                    yield rows
+        return
+
+    for build, id_column in sources:
+        after_id = None
+        while True:
+            async with database.SessionLocal() as db:
+                query = build(db)
+                if after_id is not None:
+                    query = query.where(id_column > after_id)
+                result = await db.execute(query.order_by(id_column).limit(chunk_rows))
+                rows = result.all()
+            if rows:
+                yield rows
+            if len(rows) < chunk_rows:
+                break
+            after_id = getattr(rows[-1], id_column.key)
+
+def _utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes; they are UTC
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+def _csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return _utc(value).isoformat()
+    return value
+
+def _encode_csv(records: Iterable[dict], columns: Sequence[str]) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for record in records:
+        writer.writerow([_csv_cell(record[column]) for column in columns])
+    return out.getvalue().encode()
+
+def _encode_ndjson(records: Iterable[dict]) -> bytes:
+    option = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+    return b"".join(orjson.dumps(record, option=option) for record in records)
+
+async def _body(
+    sources: Sequence[Source], columns: Sequence[str], to_record: Callable, format: str, compress: bool
+) -> AsyncIterator[bytes]:
+    gzip = zlib.compressobj(settings.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+    exported = 0
+
+    def emit(data: bytes) -> bytes:
+        return gzip.compress(data) if gzip is not None else data
+
+    if format == "csv":
+        header = io.StringIO()
+        csv.writer(header).writerow(columns)
+        yield emit(header.getvalue().encode())
+    try:
+        async for rows in _chunks(sources):
+            records = [to_record(row) for row in rows]
+            data = _encode_csv(records, columns) if format == "csv" else _encode_ndjson(records)
+            exported += len(rows)
+            data = emit(data)
+            if data:
+                yield data
+    except Exception:
+        # Headers are already sent; the client sees a truncated file (and
+        # gzip readers a missing trailer)
+        logger.exception("Export failed after %d rows", exported)
+        raise
+    if gzip is not None:
+        yield gzip.flush()
+
+def response(
+    name: str, sources: Sequence[Source], columns: Sequence[str], to_record: Callable, format: str, compress: bool
+) -> StreamingResponse:
+    filename = f"{name}-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.{format}"
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        _body(sources, columns, to_record, format, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+def order_sources(
+    names: Sequence[str],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    status: Optional[str],
+    driver_id: Optional[int],
+) -> List[Source]:
+    # Archived orders first, then live ones, each by id
+    tables = (models.ArchivedOrder, models.Order) if archive.includes_archive(status) else (models.Order,)
+
+    def source(model) -> Source:
+        def build(db: AsyncSession):
+            query = select(*(getattr(model, name) for name in names))
+            if status:
+                query = query.where(model.status == status)
+            if driver_id is not None:
+                query = query.where(model.driver_id == driver_id)
+            return pagination.filter_created(db, query, model.created_at, created_from, created_to)
+        return build, model.id
+
+    return [source(model) for model in tables]
+
+def order_record(row) -> dict:
+    return dict(row._mapping)
+
+TRANSACTION_COLUMNS = ("id", "wallet_id", "driver_id", "amount", "description", "created_at")
+
+def transaction_sources(created_from: Optional[datetime], created_to: Optional[datetime], driver_id: Optional[int]) -> List[Source]:
+    def build(db: AsyncSession):
+        query = select(
+            models.Transaction.id,
+            models.Transaction.wallet_id,
+            models.Wallet.driver_id,
+            models.Transaction.amount_minor,
+            models.Transaction.description,
+            models.Transaction.created_at,
+        ).join(models.Wallet, models.Wallet.id == models.Transaction.wallet_id)
+        if driver_id is not None:
+            query = query.where(models.Wallet.driver_id == driver_id)
+        return pagination.filter_created(db, query, models.Transaction.created_at, created_from, created_to)
+    return [(build, models.Transaction.id)]
+
+def transaction_record(row) -> dict:
+    return {
+        "id": row.id,
+        "wallet_id": row.wallet_id,
+        "driver_id": row.driver_id,
+        "amount": ledger.to_major(row.amount_minor),
+        "description": row.description,
+        "created_at": row.created_at,
+    }
@@ -0,0 +1,147 @@
+import heapq
+import math
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.core import metrics
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def haversine_km_pairs(lat1, lng1, lat2, lng2) -> np.ndarray:
+    # Element-wise haversine_km over equal-length arrays
+    phi1 = np.radians(np.asarray(lat1, dtype=np.float64))
+    phi2 = np.radians(np.asarray(lat2, dtype=np.float64))
+    dlmb = np.radians(np.asarray(lng2, dtype=np.float64) - np.asarray(lng1, dtype=np.float64))
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def _half_angle_terms(degrees, dtype):
+    half = np.radians(np.asarray(degrees, dtype=np.float64)) / 2
+    return np.sin(half).astype(dtype), np.cos(half).astype(dtype)
+
+def haversine_km_matrix(lat_a, lng_a, lat_b, lng_b, dtype=np.float32) -> np.ndarray:
+    # Distances from every point of `a` (rows) to every point of `b` (columns).
+    # Trig runs once per point; sin((y - x) / 2) is expanded as
+    # sin(y/2)cos(x/2) - cos(y/2)sin(x/2) so the len(a) * len(b) part is only
+    # products and sums.
+    sin_phi_a, cos_phi_a = _half_angle_terms(lat_a, dtype)
+    sin_phi_b, cos_phi_b = _half_angle_terms(lat_b, dtype)
+    sin_lmb_a, cos_lmb_a = _half_angle_terms(lng_a, dtype)
+    sin_lmb_b, cos_lmb_b = _half_angle_terms(lng_b, dtype)
+    cos_lat_a = cos_phi_a * cos_phi_a - sin_phi_a * sin_phi_a
+    cos_lat_b = cos_phi_b * cos_phi_b - sin_phi_b * sin_phi_b
+
+    sin_dphi = np.outer(cos_phi_a, sin_phi_b)
+    sin_dphi -= np.outer(sin_phi_a, cos_phi_b)
+    sin_dlmb = np.outer(cos_lmb_a, sin_lmb_b)
+    sin_dlmb -= np.outer(sin_lmb_a, cos_lmb_b)
+
+    a = np.square(sin_dphi, out=sin_dphi)
+    sin_dlmb *= sin_dlmb
+    sin_dlmb *= np.outer(cos_lat_a, cos_lat_b)
+    a += sin_dlmb
+    np.clip(a, 0.0, 1.0, out=a)
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * EARTH_RADIUS_KM
+    return a
+
+class GridIndex:
+    # Buckets points into fixed lat/lng cells so a radius query only looks at
+    # the handful of cells around the query point instead of every point.
+
+    def __init__(self, cell_degrees: float):
+        self.cell_degrees = cell_degrees
+        self.loaded_at: Optional[float] = None
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float]]] = {}
+        self._points: Dict[int, Tuple[float, float]] = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def get(self, key: int) -> Optional[Tuple[float, float]]:
+        return self._points.get(key)
+
+    def items(self) -> Iterator[Tuple[int, Tuple[float, float]]]:
+        return iter(list(self._points.items()))
+
+    def add(self, key: int, lat: float, lng: float):
+        self.remove(key)
+        self._points[key] = (lat, lng)
+        self._cells.setdefault(self._cell(lat, lng), {})[key] = (lat, lng)
+
+    def remove(self, key: int):
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def replace(self, points: Iterable[Tuple[int, float, float]]):
+        self._cells = {}
+        self._points = {}
+        for key, lat, lng in points:
+            self.add(key, lat, lng)
+        self.loaded_at = time.monotonic()
+
+    def nearby(self, lat: float, lng: float, radius_km: float, limit: int) -> List[Tuple[int, float]]:
+        # Returns up to `limit` (key, distance_km) pairs within radius, nearest first
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        lng_span = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+        row_min, col_min = self._cell(lat - lat_span, lng - lng_span)
+        row_max, col_max = self._cell(lat + lat_span, lng + lng_span)
+
+        candidates = []
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                bucket = self._cells.get((row, col))
+                if not bucket:
+                    continue
+                for key, (p_lat, p_lng) in bucket.items():
+                    distance = haversine_km(lat, lng, p_lat, p_lng)
+                    if distance <= radius_km:
+                        candidates.append((distance, key))
+
+        return [(key, distance) for distance, key in heapq.nsmallest(limit, candidates)]
+
+# Pending orders keyed by order id, positioned at their pickup point
+pending_orders = GridIndex(settings.GEO_CELL_DEGREES)
+metrics.registry.gauge("dot_pending_orders", "Pending orders in this worker's geo index", function=lambda: len(pending_orders))
+
+async def refresh_pending_orders(db: AsyncSession):
+    result = await db.execute(
+        select(models.Order.id, models.Order.pickup_lat, models.Order.pickup_lng)
+        .where(models.Order.status == models.OrderStatus.PENDING)
+    )
+    pending_orders.replace(result.all())
+
+async def ensure_pending_orders(db: AsyncSession):
+    # Orders created or taken through other workers only reach this process on resync
+    loaded_at = pending_orders.loaded_at
+    if loaded_at is None or time.monotonic() - loaded_at > settings.GEO_INDEX_REFRESH_SECONDS:
+        await refresh_pending_orders(db)
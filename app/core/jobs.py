@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from app.core import database, metrics
+
+logger = logging.getLogger(__name__)
+
+# Durable background jobs for follow-up work that does not need to finish
+# before the response (stats counters, audit entries).
+#
+# enqueue() inserts an outbox_jobs row in the caller's transaction, so a job
+# exists if and only if the change that caused it committed. Every worker
+# process runs a JobQueue: a poller claims due rows by pushing their run_at_ms
+# one lease ahead (a single UPDATE ... RETURNING, so two claimers never get
+# the same row) and hands them to a pool of worker tasks. A handler's writes
+# and the deletion of its job rows commit in one transaction, so each job takes
+# effect once. Failures are retried with exponential backoff; after
+# JOBS_MAX_ATTEMPTS the row is marked dead and left for inspection. When a
+# batch fails its jobs are rerun one by one, so only a bad payload ends up
+# dead. Jobs of a kind without a handler (e.g. enqueued by a newer release
+# during a rolling deploy) are retried the same way. A worker that dies
+# mid-job leaves its claim to expire after JOBS_LEASE_SECONDS.
+
+Handler = Callable[[AsyncSession, object], Awaitable[None]]
+
+_handlers: Dict[str, Tuple[Handler, bool]] = {}
+
+def handler(kind: str, batch: bool = False):
+    # Registers the coroutine that runs jobs of this kind. Batch handlers get
+    # the list of payloads of every claimed job of the kind at once.
+    def register(func: Handler) -> Handler:
+        if kind in _handlers:
+            raise ValueError(f"Job handler for {kind} already registered")
+        _handlers[kind] = (func, batch)
+        return func
+    return register
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+def enqueue(db: AsyncSession, kind: str, payload: dict, delay_seconds: float = 0.0):
+    # Does not commit; the job is picked up once the caller's transaction does
+    db.add(models.OutboxJob(kind=kind, payload=payload, run_at_ms=_now_ms() + int(delay_seconds * 1000), attempts=0, dead=False))
+    db.info["jobs_enqueued"] = True
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session):
+    if session.info.pop("jobs_enqueued", False):
+        queue.wake()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session):
+    session.info.pop("jobs_enqueued", None)
+
+processed = metrics.registry.counter("dot_jobs", "Background jobs by kind and outcome", ("kind", "outcome"))
+
+class JobQueue:
+    def __init__(self, workers: int, batch_size: int, poll_interval: float):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._work: Optional[asyncio.Queue] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def depth(self) -> int:
+        return self._work.qsize() if self._work is not None else 0
+
+    async def claim(self) -> list:
+        now = _now_ms()
+        due = (
+            select(models.OutboxJob.id)
+            .where(models.OutboxJob.dead == False, models.OutboxJob.run_at_ms <= now)
+            .order_by(models.OutboxJob.run_at_ms)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with database.SessionLocal() as db:
+            result = await db.execute(
+                update(models.OutboxJob)
+                .where(
+                    models.OutboxJob.id.in_(due.scalar_subquery()),
+                    models.OutboxJob.dead == False,
+                    models.OutboxJob.run_at_ms <= now,
+                )
+                .values(run_at_ms=now + settings.JOBS_LEASE_SECONDS * 1000, attempts=models.OutboxJob.attempts + 1)
+                .returning(
+                    models.OutboxJob.id, models.OutboxJob.kind, models.OutboxJob.payload,
+                    models.OutboxJob.attempts, models.OutboxJob.run_at_ms,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            jobs = result.all()
+            await db.commit()
+        return jobs
+
+    async def run_jobs(self, kind: str, jobs: list):
+        # Jobs come from one claim and share its lease. Deleting them first,
+        # guarded by that lease, confirms nobody re-claimed them after it
+        # expired, and on PostgreSQL keeps them locked while the handler runs.
+        func, batch = _handlers[kind]
+        ids = [job.id for job in jobs]
+        try:
+            async with database.SessionLocal() as db:
+                deleted = await db.execute(
+                    delete(models.OutboxJob)
+                    .where(models.OutboxJob.id.in_(ids), models.OutboxJob.run_at_ms == jobs[0].run_at_ms)
+                    .execution_options(synchronize_session=False)
+                )
+                if deleted.rowcount != len(ids):
+                    await db.rollback()
+                    logger.warning("Lease on %s jobs %s expired, leaving them to their new claimer", kind, ids)
+                    return
+                if batch:
+                    await func(db, [job.payload for job in jobs])
+                else:
+                    await func(db, jobs[0].payload)
+                await db.commit()
+        except Exception as error:
+            if len(jobs) > 1:
+                # Still claimed under the same lease; find the payload that fails
+                logger.warning("Batch of %d %s jobs failed (%r), running them one by one", len(jobs), kind, error)
+                for job in jobs:
+                    await self.run_jobs(kind, [job])
+                return
+            logger.exception("Job %s failed (ids %s)", kind, ids)
+            await self._retry(kind, jobs, error)
+            return
+        processed.labels(kind, "done").inc(len(jobs))
+
+    async def _retry(self, kind: str, jobs: list, error: Exception):
+        now = _now_ms()
+        async with database.SessionLocal() as db:
+            for job in jobs:
+                dead = job.attempts >= settings.JOBS_MAX_ATTEMPTS
+                backoff_ms = int(settings.JOBS_RETRY_BASE_SECONDS * 1000 * 2 ** (job.attempts - 1))
+                await db.execute(
+                    update(models.OutboxJob)
+                    .where(models.OutboxJob.id == job.id)
+                    .values(dead=dead, run_at_ms=now + backoff_ms, last_error=repr(error)[:1000])
+                    .execution_options(synchronize_session=False)
+                )
+                processed.labels(kind, "dead" if dead else "retry").inc()
+            await db.commit()
+
+    async def _group(self, jobs: list) -> Dict[str, list]:
+        # Claimed jobs by kind. Jobs without a handler are retried later
+        # rather than left claimed, so they too end up dead eventually.
+        by_kind = defaultdict(list)
+        for job in jobs:
+            if job.kind not in _handlers:
+                logger.error("No handler for job kind %s (id %s)", job.kind, job.id)
+                await self._retry(job.kind, [job], LookupError(f"No handler for job kind {job.kind}"))
+                continue
+            by_kind[job.kind].append(job)
+        return by_kind
+
+    async def _poll(self):
+        while True:
+            # Cleared before claiming, so a commit landing meanwhile still wakes the next wait
+            self._wake.clear()
+            try:
+                jobs = await self.claim()
+                by_kind = await self._group(jobs)
+            except Exception:
+                logger.exception("Claiming jobs failed")
+                jobs, by_kind = [], {}
+
+            for kind, kind_jobs in by_kind.items():
+                if _handlers[kind][1]:
+                    await self._work.put((kind, kind_jobs))
+                else:
+                    for job in kind_jobs:
+                        await self._work.put((kind, [job]))
+
+            if len(jobs) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _worker(self):
+        while True:
+            kind, jobs = await self._work.get()
+            try:
+                await self.run_jobs(kind, jobs)
+            finally:
+                self._work.task_done()
+
+    def start(self):
+        if self._tasks or self.workers <= 0:
+            return
+        self._work = asyncio.Queue(maxsize=self.workers * 2)
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._poll())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Claimed but unfinished jobs are picked up again once their lease expires
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._work = None
+        self._wake = None
+
+    async def drain(self):
+        # Runs every due job now, in this task. For tests, benchmarks and CLIs.
+        while True:
+            jobs = await self.claim()
+            if not jobs:
+                return
+            for kind, kind_jobs in (await self._group(jobs)).items():
+                if _handlers[kind][1]:
+                    await self.run_jobs(kind, kind_jobs)
+                else:
+                    for job in kind_jobs:
+                        await self.run_jobs(kind, [job])
+
+queue = JobQueue(settings.JOBS_WORKERS, settings.JOBS_BATCH_SIZE, settings.JOBS_POLL_SECONDS)
+metrics.registry.gauge("dot_jobs_queue_depth", "Claimed jobs waiting for a worker in this process", function=queue.depth)
@@ -0,0 +1,89 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app import models
+
+# Money is stored as integer minor units (halalas/cents). Balances change only
+# through atomic `balance_minor = balance_minor + delta` UPDATEs written in the
+# same transaction as their Transaction rows, so wallets.balance_minor is a
+# cached running total that must always equal the sum of its transactions.
+# Nothing here commits; callers commit with the rest of their unit of work.
+
+MINOR_UNITS = 100
+BATCH_SIZE = 1000
+
+def to_minor(amount) -> int:
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def to_major(amount_minor: int) -> float:
+    return float(Decimal(amount_minor) / MINOR_UNITS)
+
+@dataclass(frozen=True)
+class Posting:
+    wallet_id: int
+    amount_minor: int
+    description: Optional[str] = None
+
+async def post(db: AsyncSession, wallet_id: int, amount_minor: int, description: Optional[str] = None):
+    await post_many(db, [Posting(wallet_id, amount_minor, description)])
+
+async def post_many(db: AsyncSession, postings: Sequence[Posting]):
+    # Nets postings per wallet and applies each chunk as a single
+    # UPDATE ... SET balance_minor = balance_minor + CASE id WHEN .. END
+    # plus one multi-row INSERT into transactions.
+    totals: Dict[int, int] = defaultdict(int)
+    for posting in postings:
+        totals[posting.wallet_id] += posting.amount_minor
+
+    wallet_ids = sorted(wallet_id for wallet_id, total in totals.items() if total)
+    for start in range(0, len(wallet_ids), BATCH_SIZE):
+        chunk = wallet_ids[start:start + BATCH_SIZE]
+        delta = case({wallet_id: totals[wallet_id] for wallet_id in chunk}, value=models.Wallet.id)
+        await db.execute(
+            update(models.Wallet)
+            .where(models.Wallet.id.in_(chunk))
+            .values(balance_minor=models.Wallet.balance_minor + delta)
+            .execution_options(synchronize_session=False)
+        )
+
+    rows = [
+        {"wallet_id": posting.wallet_id, "amount_minor": posting.amount_minor, "description": posting.description}
+        for posting in postings
+    ]
+    for start in range(0, len(rows), BATCH_SIZE):
+        await db.execute(insert(models.Transaction), rows[start:start + BATCH_SIZE])
+
+async def wallet_ids_for_drivers(db: AsyncSession, driver_ids: Sequence[int]) -> Dict[int, int]:
+    result = await db.execute(
+        select(models.Wallet.driver_id, models.Wallet.id).where(models.Wallet.driver_id.in_(set(driver_ids)))
+    )
+    return {driver_id: wallet_id for driver_id, wallet_id in result.all()}
+
+async def audit(db: AsyncSession, wallet_id: Optional[int] = None) -> List[dict]:
+    # Wallets whose cached balance disagrees with the sum of their transactions
+    ledger_total = func.coalesce(func.sum(models.Transaction.amount_minor), 0)
+    query = (
+        select(models.Wallet.id, models.Wallet.driver_id, models.Wallet.balance_minor, ledger_total.label("ledger_minor"))
+        .outerjoin(models.Transaction, models.Transaction.wallet_id == models.Wallet.id)
+        .group_by(models.Wallet.id, models.Wallet.driver_id, models.Wallet.balance_minor)
+        .having(models.Wallet.balance_minor != ledger_total)
+    )
+    if wallet_id is not None:
+        query = query.where(models.Wallet.id == wallet_id)
+
+    result = await db.execute(query)
+    return [
+        {
+            "wallet_id": row.id,
+            "driver_id": row.driver_id,
+            "balance": to_major(row.balance_minor),
+            "ledger_balance": to_major(row.ledger_minor),
+        }
+        for row in result.all()
+    ]
@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.core import database, geo, metrics
+
+logger = logging.getLogger(__name__)
+
+# Append-only trail of driver location pings, kept out of the users table.
+# Pings are buffered per process and appended every LOCATION_HISTORY_FLUSH_SECONDS
+# as one location_chunks row per driver holding that interval's points.
+# Chunks older than LOCATION_HISTORY_RAW_HOURS are merged per driver and
+# LOCATION_HISTORY_WINDOW_SECONDS window and thinned to one point per
+# LOCATION_HISTORY_DOWNSAMPLE_SECONDS.
+#
+# Chunk encoding: (ms since chunk start, lat, lng) per point, coordinates in
+# 1e-6 degree units (~0.1 m). Every field is stored as the difference to the
+# previous point, zigzagged and written as a varint, so a ping a few seconds
+# and metres after the previous one takes 6-8 bytes.
+
+Point = Tuple[int, float, float] # epoch milliseconds, lat, lng
+
+COORD_SCALE = 1_000_000
+
+def epoch_ms(value: datetime) -> int:
+    # SQLite hands back naive datetimes; they are UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+def from_epoch_ms(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+def encode(points: Sequence[Point]) -> bytes:
+    # Points must be sorted by time; the first one is the chunk's start_ms
+    out = bytearray()
+    prev_ts, prev_lat, prev_lng = points[0][0], 0, 0
+    for ts, lat, lng in points:
+        lat_units = round(lat * COORD_SCALE)
+        lng_units = round(lng * COORD_SCALE)
+        for delta in (ts - prev_ts, lat_units - prev_lat, lng_units - prev_lng):
+            value = delta * 2 if delta >= 0 else -delta * 2 - 1
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+        prev_ts, prev_lat, prev_lng = ts, lat_units, lng_units
+    return bytes(out)
+
+def decode(data: bytes, start_ms: int) -> List[Point]:
+    deltas = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        deltas.append((value >> 1) ^ -(value & 1))
+        value = shift = 0
+
+    points = []
+    ts, lat, lng = start_ms, 0, 0
+    for index in range(0, len(deltas), 3):
+        ts += deltas[index]
+        lat += deltas[index + 1]
+        lng += deltas[index + 2]
+        points.append((ts, lat / COORD_SCALE, lng / COORD_SCALE))
+    return points
+
+def thin(points: Sequence[Point], spacing_ms: int) -> List[Point]:
+    # Keeps the first point, then every point at least spacing_ms after the
+    # last kept one, and always the last point
+    if len(points) <= 2:
+        return list(points)
+    kept = [points[0]]
+    for point in points[1:-1]:
+        if point[0] - kept[-1][0] >= spacing_ms:
+            kept.append(point)
+    kept.append(points[-1])
+    return kept
+
+def driven_km(points: Sequence[Point]) -> float:
+    # Sum of great-circle legs between consecutive fixes
+    if len(points) < 2:
+        return 0.0
+    coords = np.array([(lat, lng) for _, lat, lng in points], dtype=np.float64)
+    legs = geo.haversine_km_pairs(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+    return float(legs.sum())
+
+def split_by_window(points: Sequence[Point], window_ms: int) -> List[List[Point]]:
+    # Sorted points in runs spanning less than window_ms each. path() relies
+    # on no chunk starting long before its points, also for the backlog a
+    # flush re-sends after the DB was unreachable.
+    runs: List[List[Point]] = []
+    for point in points:
+        if not runs or point[0] - runs[-1][0][0] >= window_ms:
+            runs.append([])
+        runs[-1].append(point)
+    return runs
+
+def _chunk_row(driver_id: int, points: Sequence[Point], resolution_seconds: int) -> dict:
+    return {
+        "driver_id": driver_id,
+        "start_ms": points[0][0],
+        "end_ms": points[-1][0],
+        "point_count": len(points),
+        "resolution_seconds": resolution_seconds,
+        "data": encode(points),
+    }
+
+async def append_many(db: AsyncSession, pings: Iterable[Tuple[int, int, float, float]]) -> int:
+    # (driver_id, epoch ms, lat, lng) pings in any order, one chunk row per
+    # driver and window in a single executemany INSERT. Does not commit.
+    by_driver: Dict[int, List[Point]] = defaultdict(list)
+    for driver_id, ts, lat, lng in pings:
+        by_driver[driver_id].append((ts, lat, lng))
+    if not by_driver:
+        return 0
+    # Encoding thousands of chunks is pure Python work, keep it off the event loop
+    window_ms = settings.LOCATION_HISTORY_WINDOW_SECONDS * 1000
+    rows = await asyncio.to_thread(lambda: [
+        _chunk_row(driver_id, run, 0)
+        for driver_id, points in by_driver.items()
+        for run in split_by_window(sorted(points), window_ms)
+    ])
+    await db.execute(insert(models.LocationChunk), rows)
+    return len(rows)
+
+def _merge(points: Iterable[Point], start_ms: int, end_ms: int) -> List[Point]:
+    # Several workers can hold chunks for the same driver and time span
+    merged = {}
+    for point in points:
+        if start_ms <= point[0] <= end_ms:
+            merged[point[0]] = point
+    return [merged[ts] for ts in sorted(merged)]
+
+async def path(db: AsyncSession, driver_id: int, start_ms: int, end_ms: int) -> List[Point]:
+    # No chunk starts two windows or more before its last point (raw chunks
+    # are split per window, thinned ones merge raw chunks starting in one
+    # window), which bounds the index range scan
+    earliest = start_ms - 2 * settings.LOCATION_HISTORY_WINDOW_SECONDS * 1000
+    result = await db.execute(
+        select(models.LocationChunk.start_ms, models.LocationChunk.data)
+        .where(
+            models.LocationChunk.driver_id == driver_id,
+            models.LocationChunk.start_ms >= earliest,
+            models.LocationChunk.start_ms <= end_ms,
+            models.LocationChunk.end_ms >= start_ms,
+        )
+        .order_by(models.LocationChunk.start_ms)
+    )
+    points: List[Point] = []
+    for chunk_start, data in result.all():
+        points.extend(decode(data, chunk_start))
+    # Pings this process has not flushed yet
+    points.extend(recorder.pending(driver_id))
+    return _merge(points, start_ms, end_ms)
+
+async def downsample(db: AsyncSession, cutoff_ms: int, batch_size: int) -> int:
+    # Merges up to batch_size raw chunks that ended before cutoff_ms into one
+    # thinned chunk per driver and window. Deleting the originals is checked,
+    # so a concurrent run on another worker makes this one roll back instead
+    # of writing the points twice. Returns the number of chunks merged.
+    window_ms = settings.LOCATION_HISTORY_WINDOW_SECONDS * 1000
+    resolution = settings.LOCATION_HISTORY_DOWNSAMPLE_SECONDS
+    result = await db.execute(
+        select(
+            models.LocationChunk.id,
+            models.LocationChunk.driver_id,
+            models.LocationChunk.start_ms,
+            models.LocationChunk.data,
+        )
+        .where(
+            models.LocationChunk.resolution_seconds < resolution,
+            models.LocationChunk.end_ms < cutoff_ms,
+        )
+        .order_by(models.LocationChunk.end_ms)
+        .limit(batch_size)
+    )
+    chunks = result.all()
+    if not chunks:
+        return 0
+
+    groups: Dict[Tuple[int, int], List[Point]] = defaultdict(list)
+    for chunk in chunks:
+        groups[(chunk.driver_id, chunk.start_ms // window_ms)].extend(decode(chunk.data, chunk.start_ms))
+
+    ids = [chunk.id for chunk in chunks]
+    deleted = await db.execute(
+        delete(models.LocationChunk)
+        .where(models.LocationChunk.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    if deleted.rowcount != len(ids):
+        await db.rollback()
+        return 0
+
+    rows = []
+    for (driver_id, _), points in groups.items():
+        points = thin(_merge(points, 0, cutoff_ms), resolution * 1000)
+        rows.append(_chunk_row(driver_id, points, resolution))
+    await db.execute(insert(models.LocationChunk), rows)
+    await db.commit()
+    return len(chunks)
+
+class LocationRecorder:
+    # Buffers every ping per driver and appends them as chunks in one batched
+    # INSERT per flush interval. Complements LocationStore, which only keeps
+    # the latest fix for dispatch and the users table.
+
+    def __init__(self, flush_interval: float, max_buffered: int):
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._points: Dict[int, List[Point]] = defaultdict(list)
+        self._buffered = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return self._buffered
+
+    def record(self, driver_id: int, lat: float, lng: float, ts_ms: Optional[int] = None):
+        if self._buffered >= self.max_buffered:
+            return # the DB has been unreachable for a while; drop rather than grow
+        self._points[driver_id].append((ts_ms if ts_ms is not None else int(time.time() * 1000), lat, lng))
+        self._buffered += 1
+
+    def pending(self, driver_id: int) -> List[Point]:
+        return list(self._points.get(driver_id, ()))
+
+    async def flush(self) -> int:
+        if not self._points:
+            return 0
+
+        # Swap the buffer first so pings arriving mid-flush land in the next batch
+        points, self._points = self._points, defaultdict(list)
+        count, self._buffered = self._buffered, 0
+        pings = [(driver_id, *point) for driver_id, driver_points in points.items() for point in driver_points]
+        try:
+            async with database.SessionLocal() as db:
+                await append_many(db, pings)
+                await db.commit()
+        except Exception:
+            logger.exception("Failed to append %d location pings", count)
+            for driver_id, driver_points in points.items():
+                self._points[driver_id][:0] = driver_points
+            self._buffered += count
+            return 0
+        return count
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+class LocationDownsampler:
+    # Periodically thins raw chunks older than LOCATION_HISTORY_RAW_HOURS
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        cutoff_ms = int(time.time() * 1000) - settings.LOCATION_HISTORY_RAW_HOURS * 3600 * 1000
+        total = 0
+        while True:
+            async with database.SessionLocal() as db:
+                merged = await downsample(db, cutoff_ms, self.batch_size)
+            total += merged
+            if merged < self.batch_size:
+                return total
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Location history downsampling failed")
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+recorder = LocationRecorder(settings.LOCATION_HISTORY_FLUSH_SECONDS, settings.LOCATION_HISTORY_MAX_BUFFERED)
+downsampler = LocationDownsampler(settings.LOCATION_HISTORY_DOWNSAMPLE_INTERVAL_SECONDS, settings.LOCATION_HISTORY_DOWNSAMPLE_BATCH)
+metrics.registry.gauge("dot_location_history_buffered", "Location pings waiting for the next history append", function=lambda: len(recorder))
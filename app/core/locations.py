@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, or_, update
+
+from app import models
+from app.config import settings
+from app.core import database, metrics
+
+logger = logging.getLogger(__name__)
+
+class LocationStore:
+    # Keeps only the latest fix per driver and writes the dirty ones back to
+    # the users table in one batched UPDATE per flush interval.
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._latest: Dict[int, Tuple[float, float, datetime]] = {}
+        self._dirty: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._latest)
+
+    def update(self, driver_id: int, lat: float, lng: float):
+        self._latest[driver_id] = (lat, lng, datetime.now(timezone.utc))
+        self._dirty.add(driver_id)
+
+    def get(self, driver_id: int) -> Optional[Tuple[float, float, datetime]]:
+        return self._latest.get(driver_id)
+
+    def online(self, max_age_seconds: float) -> int:
+        # Drivers whose latest fix reached this process within max_age_seconds
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+        return sum(1 for _, _, updated_at in self._latest.values() if updated_at >= cutoff)
+
+    def items(self) -> Iterator[Tuple[int, Tuple[float, float, datetime]]]:
+        return iter(list(self._latest.items()))
+
+    async def flush(self) -> int:
+        if not self._dirty:
+            return 0
+
+        # Swap the dirty set first so pings arriving mid-flush land in the next batch
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        for driver_id in dirty:
+            lat, lng, updated_at = self._latest[driver_id]
+            rows.append({"driver_id": driver_id, "lat": lat, "lng": lng, "updated_at": updated_at})
+
+        # A driver's pings can reach several workers; a worker holding an
+        # older fix must not overwrite a newer one flushed by another
+        users = models.User.__table__
+        statement = (
+            update(users)
+            .where(users.c.id == bindparam("driver_id"))
+            .where(or_(users.c.last_location_update.is_(None), users.c.last_location_update < bindparam("updated_at")))
+            .values(current_lat=bindparam("lat"), current_lng=bindparam("lng"), last_location_update=bindparam("updated_at"))
+        )
+        try:
+            async with database.SessionLocal() as db:
+                await db.execute(statement, rows)
+                await db.commit()
+        except Exception:
+            logger.exception("Failed to flush %d driver locations", len(rows))
+            self._dirty |= dirty
+            return 0
+        return len(rows)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+driver_locations = LocationStore(settings.LOCATION_FLUSH_INTERVAL_SECONDS)
+metrics.registry.gauge(
+    "dot_online_drivers", "Drivers with a location fix newer than DISPATCH_DRIVER_MAX_AGE_SECONDS",
+    function=lambda: driver_locations.online(settings.DISPATCH_DRIVER_MAX_AGE_SECONDS),
+)
+metrics.registry.gauge("dot_location_updates_unflushed", "Driver locations waiting for the next batch write", function=lambda: len(driver_locations._dirty))
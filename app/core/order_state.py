@@ -0,0 +1,106 @@
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+
+from app import models
+from app.core import analytics, audit, stats
+
+# Order status changes are single compare-and-set UPDATEs guarded by the
+# expected status or row version. Exactly one of several concurrent callers
+# matches the row; the others get a 409 instead of overwriting the winner.
+# Functions here do not commit, the caller commits together with its other writes.
+# Stats, audit entries and analytics rollups are queued as background jobs in
+# the same transaction.
+
+OrderStatus = models.OrderStatus
+
+ACTIVE_STATUSES = (OrderStatus.ACCEPTED, OrderStatus.IN_PROGRESS)
+FINAL_STATUSES = (OrderStatus.COMPLETED, OrderStatus.CANCELLED)
+
+async def _compare_and_set(db: AsyncSession, order_id: int, guards, values) -> bool:
+    result = await db.execute(
+        update(models.Order)
+        .where(models.Order.id == order_id, *guards)
+        .values(version=models.Order.version + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+async def _load_state(db: AsyncSession, order_id: int):
+    result = await db.execute(
+        select(
+            models.Order.status,
+            models.Order.version,
+            models.Order.customer_id,
+            models.Order.driver_id,
+            models.Order.estimated_price,
+            models.Order.actual_price,
+            models.Order.type,
+            models.Order.distance_km,
+            models.Order.created_at,
+        ).where(models.Order.id == order_id)
+    )
+    state = result.first()
+    if state is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return state
+
+def _conflict(detail: str = "Order was modified concurrently, please retry"):
+    return HTTPException(status_code=409, detail=detail)
+
+async def accept(db: AsyncSession, order_id: int, driver_id: int):
+    # No read first: the status guard alone decides the winner
+    accepted = await _compare_and_set(
+        db, order_id,
+        [models.Order.status == OrderStatus.PENDING],
+        {"status": OrderStatus.ACCEPTED, "driver_id": driver_id, "accepted_at": func.now()},
+    )
+    if not accepted:
+        await _load_state(db, order_id) # 404 if it does not exist
+        raise _conflict("Order already taken or cancelled")
+
+    stats.enqueue(db, stats.order_transition(OrderStatus.PENDING, OrderStatus.ACCEPTED))
+    audit.record(db, "order.accepted", driver_id, "order", order_id)
+
+async def complete(db: AsyncSession, order_id: int, driver_id: int) -> float:
+    # Returns the amount to credit the driver
+    state = await _load_state(db, order_id)
+    if state.driver_id != driver_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if state.status not in ACTIVE_STATUSES:
+        raise _conflict(f"Order is {state.status}, cannot complete")
+
+    earnings = state.actual_price if state.actual_price else state.estimated_price
+    completed = await _compare_and_set(
+        db, order_id,
+        [models.Order.version == state.version],
+        {"status": OrderStatus.COMPLETED, "actual_price": earnings, "completed_at": func.now()},
+    )
+    if not completed:
+        raise _conflict()
+
+    stats.enqueue(db, stats.order_transition(state.status, OrderStatus.COMPLETED, revenue=earnings))
+    audit.record(db, "order.completed", driver_id, "order", order_id, earnings=earnings)
+    analytics.record(db, state.type, OrderStatus.COMPLETED, state.created_at, earnings, state.distance_km)
+    return earnings
+
+async def cancel(db: AsyncSession, order_id: int, customer_id: int):
+    state = await _load_state(db, order_id)
+    if state.customer_id != customer_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if state.status in FINAL_STATUSES:
+        raise HTTPException(status_code=400, detail="Cannot cancel completed order")
+
+    cancelled = await _compare_and_set(
+        db, order_id,
+        [models.Order.version == state.version],
+        {"status": OrderStatus.CANCELLED},
+    )
+    if not cancelled:
+        raise _conflict()
+
+    stats.enqueue(db, stats.order_transition(state.status, OrderStatus.CANCELLED))
+    audit.record(db, "order.cancelled", customer_id, "order", order_id, previous_status=state.status)
+    analytics.record(db, state.type, OrderStatus.CANCELLED, state.created_at, state.estimated_price, state.distance_km)
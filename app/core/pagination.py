@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Keyset pagination over (created_at, id), newest first. Cursors are opaque
+# url-safe tokens holding the sort key of the last row of the previous page.
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _timestamp(db: AsyncSession, value):
+    # SQLite stores server-side CURRENT_TIMESTAMP as text without fractional
+    # seconds, which never compares equal to a bound datetime. Normalise both sides.
+    if db.bind.dialect.name == "sqlite":
+        return func.datetime(value)
+    return value
+
+def filter_created(db: AsyncSession, query, column, created_from: Optional[datetime], created_to: Optional[datetime]):
+    if created_from is not None:
+        query = query.where(_timestamp(db, column) >= _timestamp(db, created_from))
+    if created_to is not None:
+        query = query.where(_timestamp(db, column) < _timestamp(db, created_to))
+    return query
+
+def apply_keyset(db: AsyncSession, query, created_at_column, id_column, cursor: Optional[str], limit: int):
+    created_at_key = _timestamp(db, created_at_column)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        after = _timestamp(db, created_at)
+        query = query.where(or_(created_at_key < after, and_(created_at_key == after, id_column < row_id)))
+    # One extra row tells us whether there is a next page
+    return query.order_by(created_at_key.desc(), id_column.desc()).limit(limit + 1)
+
+def split_page(rows: Sequence, limit: int) -> Tuple[List, Optional[str]]:
+    # Rows may be ORM entities or result rows, both expose .created_at and .id
+    items = list(rows[:limit])
+    next_cursor = None
+    if len(rows) > limit and items:
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    return items, next_cursor
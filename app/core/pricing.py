@@ -0,0 +1,88 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.core import database
+
+# Immutable copy of the pricing row; `version` is bumped on every admin update
+@dataclass(frozen=True)
+class PricingSnapshot:
+    id: int
+    version: int
+    taxi_base_price: float
+    taxi_price_per_km: float
+    delivery_base_price: float
+    delivery_price_per_km: float
+
+def snapshot_from_row(pricing: models.Pricing) -> PricingSnapshot:
+    return PricingSnapshot(
+        id=pricing.id,
+        version=pricing.version,
+        taxi_base_price=float(pricing.taxi_base_price),
+        taxi_price_per_km=float(pricing.taxi_price_per_km),
+        delivery_base_price=float(pricing.delivery_base_price),
+        delivery_price_per_km=float(pricing.delivery_price_per_km),
+    )
+
+class PricingCache:
+    # Serves the pricing row from memory. After `ttl` seconds the next reader
+    # compares the stored version with the DB and reloads only if it moved,
+    # which is how workers pick up updates made through another worker.
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshot: Optional[PricingSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> PricingSnapshot:
+        if self._snapshot is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self._snapshot
+
+        async with self._lock:
+            if self._snapshot is None or time.monotonic() - self._checked_at >= self.ttl:
+                await self._revalidate()
+        return self._snapshot
+
+    def set(self, snapshot: PricingSnapshot):
+        self._snapshot = snapshot
+        self._checked_at = time.monotonic()
+
+    def clear(self):
+        self._snapshot = None
+
+    async def _revalidate(self):
+        async with database.SessionLocal() as db:
+            if self._snapshot is not None:
+                version = await db.scalar(
+                    select(models.Pricing.version).where(models.Pricing.id == self._snapshot.id)
+                )
+                if version == self._snapshot.version:
+                    self._checked_at = time.monotonic()
+                    return
+
+            pricing = await load_pricing_row(db)
+            self.set(snapshot_from_row(pricing))
+
+async def load_pricing_row(db) -> models.Pricing:
+    result = await db.execute(select(models.Pricing).order_by(models.Pricing.id).limit(1))
+    pricing = result.scalars().first()
+    if pricing:
+        return pricing
+
+    # Default row under a fixed id, so concurrent first loads cannot create two
+    try:
+        db.add(models.Pricing(id=1, version=1))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+    result = await db.execute(select(models.Pricing).order_by(models.Pricing.id).limit(1))
+    return result.scalars().first()
+
+pricing_cache = PricingCache(settings.PRICING_CACHE_TTL_SECONDS)
@@ -0,0 +1,26 @@
+from typing import Tuple, Type
+
+from pydantic import BaseModel
+from sqlalchemy.orm import ColumnProperty, InstrumentedAttribute
+
+from app import models, schemas
+
+# Column lists for the response schemas. Selecting exactly these columns
+# instead of whole entities skips identity-map bookkeeping and can never
+# trigger a lazy relationship load while a response is serialized.
+
+def columns_for(schema: Type[BaseModel], model) -> Tuple[InstrumentedAttribute, ...]:
+    # The model columns named like the schema's fields, in field order
+    columns = []
+    for name in schema.model_fields:
+        attribute = getattr(model, name, None)
+        if isinstance(attribute, InstrumentedAttribute) and isinstance(attribute.property, ColumnProperty):
+            columns.append(attribute)
+    return tuple(columns)
+
+ORDER_COLUMNS = columns_for(schemas.OrderResponse, models.Order)
+# The same by name, for queries over live and archived orders (app/core/archive.py)
+ORDER_FIELDS = tuple(column.key for column in ORDER_COLUMNS)
+USER_COLUMNS = columns_for(schemas.UserResponse, models.User)
+DRIVER_SUMMARY_COLUMNS = columns_for(schemas.DriverSummary, models.User)
+AUDIT_COLUMNS = columns_for(schemas.AuditEntryResponse, models.AuditEntry)
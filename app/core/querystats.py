@@ -0,0 +1,107 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Counts statements and DB time per HTTP request. A cursor event listener adds
+# to whatever RequestQueryStats is in the current context; the middleware
+# creates one per request, reports it in X-DB-Queries / X-DB-Time-ms headers
+# and logs requests that look like N+1 patterns.
+
+class RequestQueryStats:
+    __slots__ = ("queries", "seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+_current: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+def current() -> Optional[RequestQueryStats]:
+    return _current.get()
+
+def _short(statement: str, limit: int = 300) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    if elapsed * 1000 >= settings.DB_SLOW_QUERY_MS:
+        logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, _short(statement))
+
+def _handle_error(exception_context):
+    # The cursor never finished, drop its start time
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+def instrument(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+class QueryStatsMiddleware:
+    # Plain ASGI middleware, so it adds no task or body buffering per request.
+    # Statements issued after the response headers went out (e.g. session
+    # cleanup) are counted in the log line but not in the headers.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _current.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.queries).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.seconds * 1000:.1f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            _report(scope, stats)
+
+def _report(scope, stats: RequestQueryStats):
+    if not stats.queries:
+        return
+    route = scope.get("route")
+    path = getattr(route, "path", scope.get("path"))
+    statement, repeats = stats.statements.most_common(1)[0]
+    if repeats >= settings.DB_REPEATED_QUERY_WARN:
+        logger.warning(
+            "Possible N+1 in %s %s: same statement ran %d times (%d queries, %.1f ms): %s",
+            scope["method"], path, repeats, stats.queries, stats.seconds * 1000, _short(statement),
+        )
+    elif stats.queries >= settings.DB_REQUEST_QUERY_WARN:
+        logger.warning("%s %s ran %d queries (%.1f ms)", scope["method"], path, stats.queries, stats.seconds * 1000)
+    else:
+        logger.debug("%s %s ran %d queries (%.1f ms)", scope["method"], path, stats.queries, stats.seconds * 1000)
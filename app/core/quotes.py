@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.core import geo
+from app.core.cache import TTLCache
+from app.core.pricing import PricingSnapshot, pricing_cache
+
+# Fares are always computed here from the trip coordinates, never from a
+# client-supplied distance. Both ends are snapped to QUOTE_CELL_DEGREES cells
+# and the distance is measured between cell centres, so every trip within the
+# same pair of cells gets the same quote and the cache can serve it. The
+# pricing version is part of the key, an admin price change starts fresh.
+
+@dataclass(frozen=True)
+class Quote:
+    pricing_version: int
+    distance_km: float
+    taxi_price: float
+    delivery_price: float
+
+    def price(self, order_type: str) -> float:
+        return self.taxi_price if order_type == "taxi" else self.delivery_price
+
+Trip = Tuple[float, float, float, float] # pickup lat/lng, dropoff lat/lng
+
+_quote_cache = TTLCache(settings.QUOTE_CACHE_MAX_SIZE, settings.QUOTE_CACHE_TTL_SECONDS)
+
+def _snap(value: float) -> int:
+    return round(value / settings.QUOTE_CELL_DEGREES)
+
+def _cache_key(version: int, trip: Trip) -> tuple:
+    return (version, *(_snap(value) for value in trip))
+
+def _compute(pricing: PricingSnapshot, keys: Sequence[tuple]) -> List[Quote]:
+    cells = np.array([key[1:] for key in keys], dtype=np.float64) * settings.QUOTE_CELL_DEGREES
+    distances = geo.haversine_km_pairs(cells[:, 0], cells[:, 1], cells[:, 2], cells[:, 3])
+    distances = np.round(distances * settings.QUOTE_ROAD_FACTOR, 2)
+    taxi = np.round(pricing.taxi_base_price + distances * pricing.taxi_price_per_km, 2)
+    delivery = np.round(pricing.delivery_base_price + distances * pricing.delivery_price_per_km, 2)
+    return [
+        Quote(pricing.version, distance, taxi_price, delivery_price)
+        for distance, taxi_price, delivery_price in zip(distances.tolist(), taxi.tolist(), delivery.tolist())
+    ]
+
+async def quote_many(trips: Sequence[Trip]) -> List[Quote]:
+    pricing = await pricing_cache.get()
+    keys = [_cache_key(pricing.version, trip) for trip in trips]
+
+    found: Dict[tuple, Quote] = {}
+    for key in dict.fromkeys(keys):
+        cached = _quote_cache.get(key)
+        if cached is not None:
+            found[key] = cached
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+
+    if missing:
+        for key, computed in zip(missing, _compute(pricing, missing)):
+            _quote_cache.set(key, computed)
+            found[key] = computed
+
+    return [found[key] for key in keys]
+
+async def quote(pickup_lat: float, pickup_lng: float, dropoff_lat: float, dropoff_lng: float) -> Quote:
+    return (await quote_many([(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng)]))[0]
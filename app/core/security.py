@@ -1,14 +1,19 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, WebSocket, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.config import settings
 from app import models
-from app.core import database
+from app.core import database, metrics
+from app.core.cache import TTLCache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -18,6 +23,44 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# bcrypt takes 100ms+ per call, so it runs on a small dedicated pool instead of
+# the event loop. The semaphore bounds how many calls may be running or queued.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = asyncio.Semaphore(settings.PASSWORD_HASH_MAX_CONCURRENCY)
+
+_hash_in_flight = metrics.registry.gauge("dot_password_hash_in_flight", "Password hash calls waiting for a slot, queued or running")
+_hash_rejected = metrics.registry.counter("dot_password_hash_rejected", "Password hash calls rejected with 503 after waiting for a slot")
+metrics.registry.gauge(
+    "dot_password_hash_queue_depth", "Password hash calls queued for a bcrypt worker thread",
+    function=lambda: _hash_executor._work_queue.qsize(),
+)
+
+async def _run_password_hash(func, *args):
+    _hash_in_flight.inc()
+    try:
+        try:
+            await asyncio.wait_for(_hash_slots.acquire(), timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            _hash_rejected.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_hash_executor, func, *args)
+        finally:
+            _hash_slots.release()
+    finally:
+        _hash_in_flight.dec()
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_password_hash(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_password_hash(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -30,7 +73,71 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
+# Resolved identity of an authenticated request, cached by token subject (phone)
+@dataclass(frozen=True)
+class CurrentUser:
+    id: int
+    phone: str
+    role: str
+    is_active: bool
+
+# Look-back on every status check, covering clock skew between workers and
+# the time between stamping a change and committing it
+STATUS_CHANGE_LOOKBACK_MS = 10_000
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+class UserCache:
+    # Each worker caches users on its own. Admin status changes stamp
+    # users.status_changed_ms; at most every `revalidate_interval` seconds
+    # the next lookup evicts the users stamped since the previous check, so a
+    # deactivation made through another worker applies within that interval.
+
+    def __init__(self, max_size: int, ttl: float, revalidate_interval: float):
+        self.revalidate_interval = revalidate_interval
+        self._users = TTLCache(max_size=max_size, ttl=ttl)
+        self._checked_ms = _now_ms()
+        self._lock = asyncio.Lock()
+
+    def get(self, phone: str) -> Optional[CurrentUser]:
+        return self._users.get(phone)
+
+    def set(self, phone: str, user: CurrentUser):
+        self._users.set(phone, user)
+
+    def pop(self, phone: str):
+        self._users.pop(phone)
+
+    def clear(self):
+        self._users.clear()
+
+    def _due(self) -> bool:
+        return _now_ms() - self._checked_ms >= self.revalidate_interval * 1000
+
+    async def evict_changed(self, db: AsyncSession):
+        if not self._due():
+            return
+        async with self._lock:
+            if not self._due():
+                return
+            now_ms = _now_ms()
+            if len(self._users):
+                result = await db.execute(
+                    select(models.User.phone)
+                    .where(models.User.status_changed_ms >= self._checked_ms - STATUS_CHANGE_LOOKBACK_MS)
+                )
+                for phone in result.scalars().all():
+                    self._users.pop(phone)
+            self._checked_ms = now_ms
+
+_user_cache = UserCache(settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS, settings.USER_CACHE_REVALIDATE_SECONDS)
+
+def invalidate_user(phone: str):
+    # This worker only; the others pick the change up from status_changed_ms
+    _user_cache.pop(phone)
+
+async def authenticate_token(token: str, db: AsyncSession) -> CurrentUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -43,9 +150,35 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-        
-    result = await db.execute(select(models.User).where(models.User.phone == phone))
-    user = result.scalars().first()
+
+    await _user_cache.evict_changed(db)
+    user = _user_cache.get(phone)
     if user is None:
-        raise credentials_exception
+        result = await db.execute(
+            select(models.User.id, models.User.phone, models.User.role, models.User.is_active)
+            .where(models.User.phone == phone)
+        )
+        row = result.first()
+        if row is None:
+            raise credentials_exception
+        user = CurrentUser(id=row.id, phone=row.phone, role=row.role, is_active=row.is_active)
+        _user_cache.set(phone, user)
+
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Account is inactive")
     return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
+    return await authenticate_token(token, db)
+
+async def get_websocket_user(websocket: WebSocket) -> Optional[CurrentUser]:
+    # Browsers cannot set headers on WebSocket requests, so the token comes as ?token=.
+    # Uses a short-lived session so no connection is held for the socket's lifetime.
+    token = websocket.query_params.get("token")
+    if not token:
+        return None
+    async with database.SessionLocal() as db:
+        try:
+            return await authenticate_token(token, db)
+        except HTTPException:
+            return None
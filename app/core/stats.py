@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app import models
+from app.config import settings
+from app.core import archive, database, jobs
+
+logger = logging.getLogger(__name__)
+
+REVENUE_COMPLETED = "revenue.completed"
+STATS_JOB = "stats.increment"
+# Revenue is a float sum; it differs from the SQL SUM by rounding noise well
+# below half a minor unit, which is not drift
+DRIFT_TOLERANCE = 0.005
+
+def _plain(value) -> str:
+    # Role/status may arrive as str-enum members; use the stored value in counter names
+    return getattr(value, "value", value)
+
+def user_counter(role: str) -> str:
+    return f"users.{_plain(role)}"
+
+def order_counter(status: str) -> str:
+    return f"orders.{_plain(status)}"
+
+def order_transition(from_status: Optional[str], to_status: str, revenue: float = 0.0) -> Dict[str, float]:
+    deltas = {order_counter(to_status): 1}
+    if from_status is not None:
+        deltas[order_counter(from_status)] = deltas.get(order_counter(from_status), 0) - 1
+    if revenue:
+        deltas[REVENUE_COMPLETED] = revenue
+    return deltas
+
+def enqueue(db: AsyncSession, deltas: Dict[str, float]):
+    # Queued in the caller's transaction, so the deltas are applied if and
+    # only if the change they describe commits, but by a background job: the
+    # request no longer waits on the shared counter rows every order write
+    # used to lock. /admin/stats trails the writes by the job latency.
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if deltas:
+        jobs.enqueue(db, STATS_JOB, deltas)
+
+@jobs.handler(STATS_JOB, batch=True)
+async def apply_queued(db: AsyncSession, payloads: List[Dict[str, float]]):
+    # Sums every claimed job into one update per counter
+    totals: Dict[str, float] = defaultdict(float)
+    for deltas in payloads:
+        for name, delta in deltas.items():
+            totals[name] += delta
+    await increment(db, totals)
+
+async def increment(db: AsyncSession, deltas: Dict[str, float]):
+    # Applies deltas in the caller's transaction as one upsert, so two workers
+    # creating the same counter do not collide. Rows are in sorted name order
+    # so concurrent transactions always lock counter rows the same way.
+    rows = [{"name": name, "value": deltas[name]} for name in sorted(deltas) if deltas[name]]
+    if not rows:
+        return
+    # Both dialects spell the upsert the same way
+    insert = (sqlite if db.bind.dialect.name == "sqlite" else postgresql).insert
+    statement = insert(models.StatsCounter).values(rows)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[models.StatsCounter.name],
+        set_={"value": models.StatsCounter.value + statement.excluded.value, "updated_at": func.now()},
+    ))
+
+async def read_counters(db: AsyncSession) -> Dict[str, float]:
+    result = await db.execute(select(models.StatsCounter.name, models.StatsCounter.value))
+    return {name: value for name, value in result.all()}
+
+async def reconcile(db: AsyncSession) -> Dict[str, float]:
+    # Recomputes every counter from the source tables and overwrites drifted values.
+    # Writes that commit while this runs can be missed, so schedule it off-peak.
+    actual: Dict[str, float] = {}
+
+    users = await db.execute(select(models.User.role, func.count(models.User.id)).group_by(models.User.role))
+    for role, count in users.all():
+        actual[user_counter(role)] = count
+
+    for status, count in (await archive.count_by_status(db)).items():
+        actual[order_counter(status)] = count
+
+    actual[REVENUE_COMPLETED] = 0.0
+    for model in (models.Order, models.ArchivedOrder):
+        actual[REVENUE_COMPLETED] += await db.scalar(
+            select(func.coalesce(func.sum(model.actual_price), 0.0))
+            .where(model.status == models.OrderStatus.COMPLETED)
+        )
+
+    # Deltas still waiting in the outbox get added on top of what is written here
+    queued = await db.execute(
+        select(models.OutboxJob.payload).where(models.OutboxJob.kind == STATS_JOB, models.OutboxJob.dead == False)
+    )
+    for (deltas,) in queued.all():
+        for name, delta in deltas.items():
+            actual[name] = actual.get(name, 0) - delta
+
+    stored = await read_counters(db)
+    for name in stored.keys() - actual.keys():
+        actual[name] = 0.0
+
+    for name in sorted(actual):
+        value = actual[name]
+        if name not in stored:
+            db.add(models.StatsCounter(name=name, value=value))
+        elif not math.isclose(stored[name], value, rel_tol=0, abs_tol=DRIFT_TOLERANCE):
+            logger.warning("Stats counter %s drifted: stored=%s actual=%s", name, stored[name], value)
+            await db.execute(
+                update(models.StatsCounter).where(models.StatsCounter.name == name).values(value=value)
+            )
+
+    await db.commit()
+    return actual
+
+class StatsReconciler:
+    # Periodically re-runs reconcile() to repair counter drift
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self):
+        async with database.SessionLocal() as db:
+            return await reconcile(db)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Stats reconcile failed")
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+reconciler = StatsReconciler(settings.STATS_RECONCILE_INTERVAL_SECONDS)
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import uuid
+from typing import Optional
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+
+from app.config import settings
+
+# Leading bytes of the image formats we accept for ID photos. The stored
+# extension comes from here, never from the client's filename.
+IMAGE_SIGNATURES = (
+    (0, b"\xff\xd8\xff", ".jpg"),
+    (0, b"\x89PNG\r\n\x1a\n", ".png"),
+    (8, b"WEBP", ".webp"),
+    (4, b"ftypheic", ".heic"),
+    (4, b"ftypheix", ".heic"),
+    (4, b"ftypmif1", ".heic"),
+)
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    for offset, signature, extension in IMAGE_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if extension == ".webp" and not head.startswith(b"RIFF"):
+                continue
+            return extension
+    return None
+
+async def save_upload_file(file: UploadFile) -> Optional[str]:
+    # Streams the upload to disk in UPLOAD_CHUNK_SIZE pieces while hashing it,
+    # then stores it under its SHA-256 so a re-submitted photo is kept once.
+    if not file:
+        return None
+
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+    temp_path = os.path.join(settings.UPLOAD_DIR, f".{uuid.uuid4().hex}.part")
+
+    try:
+        async with aiofiles.open(temp_path, 'wb') as out_file:
+            while True:
+                chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if extension is None:
+                    extension = sniff_extension(chunk)
+                    if extension is None:
+                        raise HTTPException(status_code=400, detail="Unsupported image type")
+                size += len(chunk)
+                if size > settings.UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="File too large")
+                digest.update(chunk)
+                await out_file.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty file")
+
+        filename = f"{digest.hexdigest()}{extension}"
+        file_path = os.path.join(settings.UPLOAD_DIR, filename)
+        if os.path.exists(file_path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return f"/uploads/{filename}"
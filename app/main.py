@@ -1,10 +1,17 @@
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+
+from app.config import settings
 from app.routers import auth, admin, orders, driver
-from app.core import database
-from app import models
+from app.core import archive, database, dispatch, geo, jobs, location_history, locations, metrics, querystats, stats
+from app import migrate
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=ORJSONResponse,
 )
 
 # CORS
@@ -14,8 +21,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "X-DB-Time-ms"],
 )
 
+# Per-request query count and DB time
+app.add_middleware(querystats.QueryStatsMiddleware)
+# Outermost, so its latency covers the other middleware too
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Static Files (for uploads)
 app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
 
@@ -27,8 +40,33 @@ app.include_router(driver.router)
 
 @app.on_event("startup")
 async def startup():
-    async with database.engine.begin() as conn:
-        await conn.run_sync(models.Base.metadata.create_all)
+    # Tables are managed by `python -m app.migrate`, run before the workers start
+    await migrate.check(database.engine)
+
+    async with database.SessionLocal() as db:
+        await geo.refresh_pending_orders(db)
+        if not await stats.read_counters(db):
+            await stats.reconcile(db)
+
+    locations.driver_locations.start()
+    location_history.recorder.start()
+    location_history.downsampler.start()
+    jobs.queue.start()
+    archive.archiver.start()
+    stats.reconciler.start()
+    if settings.DISPATCH_ENABLED:
+        dispatch.dispatcher.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Final flush so buffered driver locations are not lost
+    await locations.driver_locations.stop()
+    await location_history.recorder.stop()
+    await location_history.downsampler.stop()
+    await stats.reconciler.stop()
+    await dispatch.dispatcher.stop()
+    await jobs.queue.stop()
+    await archive.archiver.stop()
 
 
 @app.get("/")
@@ -38,3 +76,11 @@ def root():
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    # Rendered on the event loop: the registry and the gauge callbacks are
+    # only ever touched from it, never from the threadpool
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,120 @@
+"""Apply database schema migrations.
+
+    python -m app.migrate            apply every pending migration
+    python -m app.migrate status     list applied and pending migrations
+
+Migrations live in app/migrations as vNNN_<name>.py modules exposing
+`async def upgrade(conn)`. Each runs in its own transaction and is recorded
+in the schema_migrations table. Run this once per deploy before starting
+the workers; the app refuses to start while migrations are pending.
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import re
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.sql import func
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^v(\d{3})_(\w+)\.py$")
+# Serializes concurrent runs on PostgreSQL (e.g. two instances deploying at once)
+ADVISORY_LOCK_ID = 728_110_014
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+def discover() -> List[Tuple[int, str]]:
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), filename[:-3]))
+    migrations.sort()
+    versions = [version for version, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+async def applied_versions(conn: AsyncConnection) -> Set[int]:
+    if not await conn.run_sync(lambda sync_conn: sync_conn.dialect.has_table(sync_conn, "schema_migrations")):
+        return set()
+    result = await conn.execute(select(schema_migrations.c.version))
+    return set(result.scalars().all())
+
+async def pending(conn: AsyncConnection) -> List[Tuple[int, str]]:
+    applied = await applied_versions(conn)
+    return [(version, name) for version, name in discover() if version not in applied]
+
+async def upgrade(engine: AsyncEngine, target: Optional[int] = None) -> List[str]:
+    applied_names = []
+    async with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            await conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+            await conn.commit()
+        try:
+            async with conn.begin():
+                await conn.run_sync(schema_migrations.metadata.create_all)
+
+            todo = await pending(conn)
+            await conn.commit()
+            for version, name in todo:
+                if target is not None and version > target:
+                    break
+                module = importlib.import_module(f"app.migrations.{name}")
+                logger.info("Applying migration %s", name)
+                async with conn.begin():
+                    await module.upgrade(conn)
+                    await conn.execute(insert(schema_migrations).values(version=version, name=name))
+                applied_names.append(name)
+        finally:
+            if postgres:
+                await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+                await conn.commit()
+    return applied_names
+
+async def check(engine: AsyncEngine):
+    # Called at app startup instead of creating tables
+    async with engine.connect() as conn:
+        missing = await pending(conn)
+    if missing:
+        names = ", ".join(name for _, name in missing)
+        raise RuntimeError(f"Database schema is out of date ({names}), run `python -m app.migrate`")
+
+async def _status(engine: AsyncEngine):
+    async with engine.connect() as conn:
+        applied = await applied_versions(conn)
+    for version, name in discover():
+        print(f"{'applied' if version in applied else 'pending':<10}{name}")
+
+async def _main(args):
+    from app.core import database
+
+    try:
+        if args.command == "status":
+            await _status(database.engine)
+        else:
+            applied = await upgrade(database.engine, args.target)
+            print(f"Applied {len(applied)} migration(s)" + (": " + ", ".join(applied) if applied else ""))
+    finally:
+        await database.engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=["upgrade", "status"], default="upgrade")
+    parser.add_argument("--target", type=int, help="stop after this migration version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(_main(args))
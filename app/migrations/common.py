@@ -0,0 +1,29 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Introspection helpers so a migration can run against databases that were
+# created by the old startup create_all and may already have some changes.
+
+async def _inspect(conn: AsyncConnection, probe):
+    return await conn.run_sync(lambda sync_conn: probe(inspect(sync_conn)))
+
+async def has_table(conn: AsyncConnection, table: str) -> bool:
+    return await _inspect(conn, lambda inspector: inspector.has_table(table))
+
+async def has_column(conn: AsyncConnection, table: str, column: str) -> bool:
+    columns = await _inspect(conn, lambda inspector: inspector.get_columns(table))
+    return any(info["name"] == column for info in columns)
+
+async def add_column(conn: AsyncConnection, table: str, column: str, definition: str) -> bool:
+    # Returns False when the column was already there
+    if await has_column(conn, table, column):
+        return False
+    await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+    return True
+
+async def drop_column(conn: AsyncConnection, table: str, column: str):
+    if await has_column(conn, table, column):
+        await conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+
+async def create_index(conn: AsyncConnection, name: str, table: str, *columns: str):
+    await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
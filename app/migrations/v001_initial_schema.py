@@ -0,0 +1,84 @@
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import func
+
+# The schema as the original create_all left it. Tables that already exist are
+# left alone, so databases created before migrations pass through unchanged.
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("phone", String, unique=True, index=True, nullable=False),
+    Column("email", String, nullable=True),
+    Column("name", String, nullable=False),
+    Column("hashed_password", String, nullable=False),
+    Column("role", String),
+    Column("is_active", Boolean),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("id_name", String, nullable=True),
+    Column("national_id", String, nullable=True),
+    Column("birth_date", DateTime, nullable=True),
+    Column("id_photo_url", String, nullable=True),
+    Column("current_lat", Float, nullable=True),
+    Column("current_lng", Float, nullable=True),
+    Column("last_location_update", DateTime(timezone=True), nullable=True),
+)
+
+Table(
+    "wallets", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("driver_id", Integer, ForeignKey("users.id")),
+    Column("balance", Float),
+)
+
+Table(
+    "transactions", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("wallet_id", Integer, ForeignKey("wallets.id")),
+    Column("amount", Float, nullable=False),
+    Column("description", String, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "pricing", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("taxi_base_price", Float),
+    Column("taxi_price_per_km", Float),
+    Column("delivery_base_price", Float),
+    Column("delivery_price_per_km", Float),
+)
+
+Table(
+    "orders", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("customer_id", Integer, ForeignKey("users.id")),
+    Column("driver_id", Integer, ForeignKey("users.id"), nullable=True),
+    Column("type", String, nullable=False),
+    Column("status", String),
+    Column("pickup_lat", Float, nullable=False),
+    Column("pickup_lng", Float, nullable=False),
+    Column("pickup_address", String, nullable=True),
+    Column("dropoff_lat", Float, nullable=False),
+    Column("dropoff_lng", Float, nullable=False),
+    Column("dropoff_address", String, nullable=True),
+    Column("estimated_price", Float, nullable=False),
+    Column("actual_price", Float, nullable=True),
+    Column("distance_km", Float, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("completed_at", DateTime(timezone=True), nullable=True),
+)
+
+Table(
+    "ratings", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_id", Integer, ForeignKey("orders.id")),
+    Column("rating", Integer, nullable=False),
+    Column("comment", String, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+async def upgrade(conn: AsyncConnection):
+    await conn.run_sync(metadata.create_all)
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, DateTime, Float, MetaData, String, Table, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import func
+
+from app.migrations.common import add_column, drop_column, has_column
+
+# Row versions for pricing and orders, integer minor-unit money columns
+# (backfilled from the old float columns, which are then dropped) and the
+# stats counters table.
+
+metadata = MetaData()
+
+Table(
+    "stats_counters", metadata,
+    Column("name", String, primary_key=True),
+    Column("value", Float, nullable=False),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+async def _to_minor_units(conn: AsyncConnection, table: str, old: str, new: str):
+    added = await add_column(conn, table, new, "BIGINT NOT NULL DEFAULT 0")
+    if added and await has_column(conn, table, old):
+        await conn.execute(text(f"UPDATE {table} SET {new} = CAST(ROUND(COALESCE({old}, 0) * 100) AS BIGINT)"))
+    await drop_column(conn, table, old)
+
+async def upgrade(conn: AsyncConnection):
+    await add_column(conn, "pricing", "version", "INTEGER NOT NULL DEFAULT 1")
+    await add_column(conn, "orders", "version", "INTEGER NOT NULL DEFAULT 1")
+    await _to_minor_units(conn, "wallets", "balance", "balance_minor")
+    await _to_minor_units(conn, "transactions", "amount", "amount_minor")
+    await conn.run_sync(metadata.create_all)
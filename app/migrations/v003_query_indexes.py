@@ -0,0 +1,22 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.migrations.common import create_index
+
+# Indexes matching the hot query shapes, equality columns first:
+#   pending orders / admin status filter   status = ? ORDER BY created_at
+#   driver stats, busy drivers              driver_id = ? AND status = ?
+#   my-orders                               customer_id = ? ORDER BY created_at
+#   admin order list                        ORDER BY created_at
+#   driver transactions                     wallet_id = ? ORDER BY created_at
+#   wallet lookup                           driver_id = ?
+#   admin users/drivers                     role = ? ORDER BY created_at
+# Keep in sync with __table_args__ in app/models.py.
+
+async def upgrade(conn: AsyncConnection):
+    await create_index(conn, "ix_orders_status_created_at", "orders", "status", "created_at")
+    await create_index(conn, "ix_orders_driver_id_status", "orders", "driver_id", "status")
+    await create_index(conn, "ix_orders_customer_id_created_at", "orders", "customer_id", "created_at")
+    await create_index(conn, "ix_orders_created_at", "orders", "created_at")
+    await create_index(conn, "ix_transactions_wallet_id_created_at", "transactions", "wallet_id", "created_at")
+    await create_index(conn, "ix_wallets_driver_id", "wallets", "driver_id")
+    await create_index(conn, "ix_users_role_created_at", "users", "role", "created_at")
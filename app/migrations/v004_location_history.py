@@ -0,0 +1,28 @@
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, LargeBinary, MetaData, Table
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.migrations.common import add_column
+
+# Append-only driver location history (app/core/location_history.py) and the
+# order acceptance time that bounds an order's path.
+
+metadata = MetaData()
+
+Table("users", metadata, Column("id", Integer, primary_key=True))
+
+Table(
+    "location_chunks", metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+    Column("driver_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("start_ms", BigInteger, nullable=False),
+    Column("end_ms", BigInteger, nullable=False),
+    Column("point_count", Integer, nullable=False),
+    Column("resolution_seconds", Integer, nullable=False),
+    Column("data", LargeBinary, nullable=False),
+    Index("ix_location_chunks_driver_id_start_ms", "driver_id", "start_ms"),
+    Index("ix_location_chunks_end_ms", "end_ms"),
+)
+
+async def upgrade(conn: AsyncConnection):
+    await add_column(conn, "orders", "accepted_at", DateTime(timezone=True).compile(dialect=conn.dialect))
+    await conn.run_sync(lambda sync_conn: metadata.tables["location_chunks"].create(sync_conn, checkfirst=True))
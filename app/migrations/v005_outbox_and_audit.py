@@ -0,0 +1,40 @@
+from sqlalchemy import JSON, BigInteger, Boolean, Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import func
+
+# Outbox table for background jobs (app/core/jobs.py) and the audit trail
+# they write (app/core/audit.py).
+
+metadata = MetaData()
+
+Table("users", metadata, Column("id", Integer, primary_key=True))
+
+Table(
+    "outbox_jobs", metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+    Column("kind", String, nullable=False),
+    Column("payload", JSON, nullable=False),
+    Column("run_at_ms", BigInteger, nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("dead", Boolean, nullable=False),
+    Column("last_error", Text, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_outbox_jobs_dead_run_at_ms", "dead", "run_at_ms"),
+)
+
+Table(
+    "audit_entries", metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+    Column("actor_id", Integer, ForeignKey("users.id"), nullable=True),
+    Column("action", String, nullable=False),
+    Column("subject_type", String, nullable=False),
+    Column("subject_id", Integer, nullable=True),
+    Column("details", JSON, nullable=True),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Index("ix_audit_entries_created_at", "created_at"),
+    Index("ix_audit_entries_subject", "subject_type", "subject_id"),
+)
+
+async def upgrade(conn: AsyncConnection):
+    tables = [metadata.tables["outbox_jobs"], metadata.tables["audit_entries"]]
+    await conn.run_sync(lambda sync_conn: metadata.create_all(sync_conn, tables=tables, checkfirst=True))
@@ -0,0 +1,37 @@
+from sqlalchemy import Column, DateTime, Float, Index, Integer, MetaData, String, Table
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import func
+
+# Cold storage for finished orders, filled by app/core/archive.py. Mirrors the
+# orders columns as of v004, without foreign keys.
+
+metadata = MetaData()
+
+Table(
+    "orders_archive", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("customer_id", Integer),
+    Column("driver_id", Integer, nullable=True),
+    Column("type", String, nullable=False),
+    Column("status", String),
+    Column("pickup_lat", Float, nullable=False),
+    Column("pickup_lng", Float, nullable=False),
+    Column("pickup_address", String, nullable=True),
+    Column("dropoff_lat", Float, nullable=False),
+    Column("dropoff_lng", Float, nullable=False),
+    Column("dropoff_address", String, nullable=True),
+    Column("estimated_price", Float, nullable=False),
+    Column("actual_price", Float, nullable=True),
+    Column("distance_km", Float, nullable=True),
+    Column("created_at", DateTime(timezone=True)),
+    Column("accepted_at", DateTime(timezone=True), nullable=True),
+    Column("completed_at", DateTime(timezone=True), nullable=True),
+    Column("version", Integer, nullable=False),
+    Column("archived_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_orders_archive_customer_id_created_at", "customer_id", "created_at"),
+    Index("ix_orders_archive_driver_id_status", "driver_id", "status"),
+    Index("ix_orders_archive_created_at", "created_at"),
+)
+
+async def upgrade(conn: AsyncConnection):
+    await conn.run_sync(lambda sync_conn: metadata.create_all(sync_conn, checkfirst=True))
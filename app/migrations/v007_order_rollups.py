@@ -0,0 +1,23 @@
+from sqlalchemy import BigInteger, Column, Float, Integer, MetaData, String, Table
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Hourly and daily order rollups maintained by app/core/analytics.py. Fill
+# them for existing orders with `python -m app.backfill`.
+
+metadata = MetaData()
+
+Table(
+    "order_rollups", metadata,
+    Column("granularity", String, primary_key=True),
+    Column("bucket_ms", BigInteger, primary_key=True, autoincrement=False),
+    Column("type", String, primary_key=True),
+    Column("status", String, primary_key=True),
+    Column("orders", Integer, nullable=False),
+    Column("revenue", Float, nullable=False),
+    Column("price_sum", Float, nullable=False),
+    Column("distance_km_sum", Float, nullable=False),
+    Column("distance_orders", Integer, nullable=False),
+)
+
+async def upgrade(conn: AsyncConnection):
+    await conn.run_sync(lambda sync_conn: metadata.create_all(sync_conn, checkfirst=True))
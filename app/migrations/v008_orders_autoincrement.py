@@ -0,0 +1,62 @@
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import func
+
+from app.migrations.common import create_index
+
+# Without AUTOINCREMENT SQLite hands out max(id) + 1, so once the newest
+# orders are archived their ids are given to new orders and find_order()
+# and the archiver mix the two up. SQLite cannot add AUTOINCREMENT to an
+# existing table: rebuild orders (create, copy, drop, rename) and start the
+# id sequence after every live and archived id. PostgreSQL sequences never
+# reuse ids, nothing to do there.
+
+metadata = MetaData()
+
+Table("users", metadata, Column("id", Integer, primary_key=True))
+
+# orders as of v004, built under a temporary name
+orders_new = Table(
+    "orders_new", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("customer_id", Integer, ForeignKey("users.id")),
+    Column("driver_id", Integer, ForeignKey("users.id"), nullable=True),
+    Column("type", String, nullable=False),
+    Column("status", String),
+    Column("pickup_lat", Float, nullable=False),
+    Column("pickup_lng", Float, nullable=False),
+    Column("pickup_address", String, nullable=True),
+    Column("dropoff_lat", Float, nullable=False),
+    Column("dropoff_lng", Float, nullable=False),
+    Column("dropoff_address", String, nullable=True),
+    Column("estimated_price", Float, nullable=False),
+    Column("actual_price", Float, nullable=True),
+    Column("distance_km", Float, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("completed_at", DateTime(timezone=True), nullable=True),
+    Column("version", Integer, nullable=False, server_default=text("1")),
+    Column("accepted_at", DateTime(timezone=True), nullable=True),
+    sqlite_autoincrement=True,
+)
+
+async def upgrade(conn: AsyncConnection):
+    if conn.dialect.name != "sqlite":
+        return
+    ddl = await conn.scalar(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'orders'"))
+    if "AUTOINCREMENT" not in ddl.upper():
+        columns = ", ".join(column.name for column in orders_new.columns)
+        await conn.run_sync(lambda sync_conn: orders_new.create(sync_conn))
+        await conn.execute(text(f"INSERT INTO orders_new ({columns}) SELECT {columns} FROM orders"))
+        await conn.execute(text("DROP TABLE orders"))
+        await conn.execute(text("ALTER TABLE orders_new RENAME TO orders"))
+        await create_index(conn, "ix_orders_id", "orders", "id")
+        await create_index(conn, "ix_orders_created_at", "orders", "created_at")
+        await create_index(conn, "ix_orders_status_created_at", "orders", "status", "created_at")
+        await create_index(conn, "ix_orders_driver_id_status", "orders", "driver_id", "status")
+        await create_index(conn, "ix_orders_customer_id_created_at", "orders", "customer_id", "created_at")
+
+    last_id = await conn.scalar(text(
+        "SELECT MAX(COALESCE((SELECT MAX(id) FROM orders), 0), COALESCE((SELECT MAX(id) FROM orders_archive), 0))"
+    ))
+    await conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'orders'"))
+    await conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('orders', :seq)"), {"seq": last_id})
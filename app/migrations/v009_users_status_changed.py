@@ -0,0 +1,10 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.migrations.common import add_column, create_index
+
+# Stamp of the last admin status change per user. Workers poll it to drop
+# deactivated users from their in-memory caches (app/core/security.py).
+
+async def upgrade(conn: AsyncConnection):
+    await add_column(conn, "users", "status_changed_ms", "BIGINT")
+    await create_index(conn, "ix_users_status_changed_ms", "users", "status_changed_ms")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Float, ForeignKey, Enum, Text, Index, LargeBinary, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -18,6 +18,9 @@ class OrderStatus(str, enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_role_created_at", "role", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     phone = Column(String, unique=True, index=True, nullable=False)
@@ -27,6 +30,7 @@ class User(Base):
     role = Column(String, default=UserRole.CUSTOMER)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    status_changed_ms = Column(BigInteger, nullable=True, index=True) # last admin status change, epoch ms
 
     # Driver Specific Fields
     id_name = Column(String, nullable=True)
@@ -48,18 +52,22 @@ class Wallet(Base):
     __tablename__ = "wallets"
 
     id = Column(Integer, primary_key=True, index=True)
-    driver_id = Column(Integer, ForeignKey("users.id"))
-    balance = Column(Float, default=0.0)
+    driver_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # Integer minor units, only changed through app/core/ledger.py
+    balance_minor = Column(BigInteger, nullable=False, default=0)
 
     driver = relationship("User", back_populates="wallet")
     transactions = relationship("Transaction", back_populates="wallet")
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_wallet_id_created_at", "wallet_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     wallet_id = Column(Integer, ForeignKey("wallets.id"))
-    amount = Column(Float, nullable=False)
+    amount_minor = Column(BigInteger, nullable=False)
     description = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -73,9 +81,18 @@ class Pricing(Base):
     taxi_price_per_km = Column(Float, default=2.0)
     delivery_base_price = Column(Float, default=15.0)
     delivery_price_per_km = Column(Float, default=2.5)
+    version = Column(Integer, default=1, nullable=False) # bumped on every update
 
 class Order(Base):
     __tablename__ = "orders"
+    # Indexes are created by app/migrations/v003_query_indexes.py. Ids are
+    # never reused (v008), archived orders keep theirs in orders_archive.
+    __table_args__ = (
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        Index("ix_orders_driver_id_status", "driver_id", "status"),
+        Index("ix_orders_customer_id_created_at", "customer_id", "created_at"),
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("users.id"))
@@ -96,13 +113,62 @@ class Order(Base):
     actual_price = Column(Float, nullable=True)
     distance_km = Column(Float, nullable=True)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    accepted_at = Column(DateTime(timezone=True), nullable=True)
     completed_at = Column(DateTime(timezone=True), nullable=True)
 
+    # Bumped by every status transition, see app/core/order_state.py
+    version = Column(Integer, nullable=False, default=1)
+
     customer = relationship("User", foreign_keys=[customer_id], back_populates="orders_as_customer")
     driver = relationship("User", foreign_keys=[driver_id], back_populates="orders_as_driver")
     rating = relationship("Rating", back_populates="order", uselist=False)
 
+class ArchivedOrder(Base):
+    __tablename__ = "orders_archive"
+    # Finished orders moved out of orders by app/core/archive.py. Same columns
+    # as Order (keep in sync), no foreign keys, plus the time of the move.
+    __table_args__ = (
+        Index("ix_orders_archive_customer_id_created_at", "customer_id", "created_at"),
+        Index("ix_orders_archive_driver_id_status", "driver_id", "status"),
+        Index("ix_orders_archive_created_at", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer)
+    driver_id = Column(Integer, nullable=True)
+    type = Column(String, nullable=False)
+    status = Column(String)
+    pickup_lat = Column(Float, nullable=False)
+    pickup_lng = Column(Float, nullable=False)
+    pickup_address = Column(String, nullable=True)
+    dropoff_lat = Column(Float, nullable=False)
+    dropoff_lng = Column(Float, nullable=False)
+    dropoff_address = Column(String, nullable=True)
+    estimated_price = Column(Float, nullable=False)
+    actual_price = Column(Float, nullable=True)
+    distance_km = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    accepted_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    version = Column(Integer, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class OrderRollup(Base):
+    __tablename__ = "order_rollups"
+    # Hourly and daily totals of finished orders, see app/core/analytics.py.
+    # Averages are stored as sums so buckets can be added up.
+
+    granularity = Column(String, primary_key=True) # 'hour' or 'day'
+    bucket_ms = Column(BigInteger, primary_key=True, autoincrement=False) # bucket start, epoch ms UTC
+    type = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0) # actual price of completed orders
+    price_sum = Column(Float, nullable=False, default=0.0)
+    distance_km_sum = Column(Float, nullable=False, default=0.0)
+    distance_orders = Column(Integer, nullable=False, default=0) # orders with a distance_km
+
 class Rating(Base):
     __tablename__ = "ratings"
 
@@ -113,3 +179,60 @@ class Rating(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     order = relationship("Order", back_populates="rating")
+
+class StatsCounter(Base):
+    __tablename__ = "stats_counters"
+
+    # e.g. "users.driver", "orders.pending", "revenue.completed"
+    name = Column(String, primary_key=True)
+    value = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class LocationChunk(Base):
+    __tablename__ = "location_chunks"
+    # Append-only, see app/core/location_history.py
+    __table_args__ = (
+        Index("ix_location_chunks_driver_id_start_ms", "driver_id", "start_ms"),
+        Index("ix_location_chunks_end_ms", "end_ms"),
+    )
+
+    # SQLite only autoincrements INTEGER primary keys
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    driver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    start_ms = Column(BigInteger, nullable=False) # epoch milliseconds of the first point
+    end_ms = Column(BigInteger, nullable=False)
+    point_count = Column(Integer, nullable=False)
+    resolution_seconds = Column(Integer, nullable=False, default=0) # 0 = every ping
+    data = Column(LargeBinary, nullable=False) # delta/varint encoded points
+
+class OutboxJob(Base):
+    __tablename__ = "outbox_jobs"
+    # Durable background jobs, see app/core/jobs.py
+    __table_args__ = (
+        Index("ix_outbox_jobs_dead_run_at_ms", "dead", "run_at_ms"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    run_at_ms = Column(BigInteger, nullable=False) # due time, or end of the lease while claimed
+    attempts = Column(Integer, nullable=False, default=0)
+    dead = Column(Boolean, nullable=False, default=False) # gave up after JOBS_MAX_ATTEMPTS
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AuditEntry(Base):
+    __tablename__ = "audit_entries"
+    # Written by a background job, see app/core/audit.py
+    __table_args__ = (
+        Index("ix_audit_entries_created_at", "created_at"),
+        Index("ix_audit_entries_subject", "subject_type", "subject_id"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    actor_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    action = Column(String, nullable=False) # e.g. "order.completed"
+    subject_type = Column(String, nullable=False) # "order", "user", "wallet", "pricing"
+    subject_id = Column(Integer, nullable=True)
+    details = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False) # when it happened, not when the job ran
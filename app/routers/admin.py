@@ -1,116 +1,314 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, update
+from typing import List, Optional
+from datetime import datetime
+import time
 
 from app import models, schemas
-from app.core import database, security
+from app.core import analytics, archive, audit, database, exports, ledger, pagination, projections, security, stats
+from app.config import settings
+from app.core.location_history import epoch_ms, from_epoch_ms
+from app.core.pricing import load_pricing_row, pricing_cache, snapshot_from_row
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 # Dependency to check if user is admin
-async def get_current_admin(current_user: models.User = Depends(security.get_current_user)):
+async def get_current_admin(current_user: security.CurrentUser = Depends(security.get_current_user)):
     if current_user.role != models.UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Not authorized")
     return current_user
 
+def stats_summary(counters: dict):
+    orders_by_status = {
+        name.split(".", 1)[1]: int(value)
+        for name, value in counters.items()
+        if name.startswith("orders.")
+    }
+    return {
+        "total_users": int(counters.get(stats.user_counter(models.UserRole.CUSTOMER), 0)),
+        "total_drivers": int(counters.get(stats.user_counter(models.UserRole.DRIVER), 0)),
+        "total_orders": sum(orders_by_status.values()),
+        "total_revenue": counters.get(stats.REVENUE_COMPLETED, 0.0),
+        "orders_by_status": orders_by_status
+    }
+
 @router.get("/stats")
-async def get_stats(db: AsyncSession = Depends(database.get_db), admin: models.User = Depends(get_current_admin)):
-    # Simple stats
-    total_users = await db.scalar(select(func.count(models.User.id)).where(models.User.role == models.UserRole.CUSTOMER))
-    total_drivers = await db.scalar(select(func.count(models.User.id)).where(models.User.role == models.UserRole.DRIVER))
-    total_orders = await db.scalar(select(func.count(models.Order.id)))
-    
-    # Revenue (sum of completed orders actual_price)
-    revenue_q = select(func.sum(models.Order.actual_price)).where(models.Order.status == models.OrderStatus.COMPLETED)
-    total_revenue = await db.scalar(revenue_q) or 0.0
-    
+async def get_stats(db: AsyncSession = Depends(database.get_read_db), admin: security.CurrentUser = Depends(get_current_admin)):
+    # Counters are maintained by the write paths, see app/core/stats.py
+    return stats_summary(await stats.read_counters(db))
+
+def analytics_range(start: datetime, end: Optional[datetime]):
+    start_ms = epoch_ms(start)
+    end_ms = epoch_ms(end) if end is not None else int(time.time() * 1000)
+    if end_ms <= start_ms:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    return start_ms, end_ms
+
+@router.get("/analytics/orders", response_model=schemas.OrderAnalyticsSeries)
+async def order_analytics(
+    start: datetime,
+    end: Optional[datetime] = None,
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_read_db),
+    admin: security.CurrentUser = Depends(get_current_admin)
+):
+    # Finished orders per hour or day bucket of created_at (UTC), from the rollups
+    start_ms, end_ms = analytics_range(start, end)
+    size_ms = analytics.GRANULARITIES[granularity]
+    if (end_ms - analytics.floor_ms(start_ms, size_ms)) / size_ms > settings.ANALYTICS_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail="Range too long for this granularity")
+    buckets = await analytics.series(db, granularity, start_ms, end_ms, type, status)
+    return {"granularity": granularity, "buckets": buckets}
+
+@router.get("/analytics/orders/summary", response_model=schemas.OrderAnalyticsSummary)
+async def order_analytics_summary(
+    start: datetime,
+    end: Optional[datetime] = None,
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_read_db),
+    admin: security.CurrentUser = Depends(get_current_admin)
+):
+    # Totals per type and status; the range is widened to whole hours
+    start_ms, end_ms = analytics_range(start, end)
+    groups = await analytics.summary(db, start_ms, end_ms, type, status)
     return {
-        "total_users": total_users,
-        "total_drivers": total_drivers,
-        "total_orders": total_orders,
-        "total_revenue": total_revenue
+        "start": from_epoch_ms(analytics.floor_ms(start_ms, analytics.HOUR_MS)),
+        "end": from_epoch_ms(analytics.ceil_ms(end_ms, analytics.HOUR_MS)),
+        "groups": groups,
     }
 
-@router.get("/users", response_model=List[schemas.UserAuthResponse])
-async def get_users(db: AsyncSession = Depends(database.get_db), admin: models.User = Depends(get_current_admin)):
-    result = await db.execute(select(models.User).where(models.User.role == models.UserRole.CUSTOMER))
-    return result.scalars().all()
+@router.post("/stats/reconcile")
+async def reconcile_stats(db: AsyncSession = Depends(database.get_db), admin: security.CurrentUser = Depends(get_current_admin)):
+    return stats_summary(await stats.reconcile(db))
+
+async def list_users(
+    db: AsyncSession,
+    role: str,
+    is_active: Optional[bool],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    cursor: Optional[str],
+    limit: int
+):
+    query = select(*projections.USER_COLUMNS).where(models.User.role == role)
+    if is_active is not None:
+        query = query.where(models.User.is_active == is_active)
+    query = pagination.filter_created(db, query, models.User.created_at, created_from, created_to)
+    query = pagination.apply_keyset(db, query, models.User.created_at, models.User.id, cursor, limit)
+
+    result = await db.execute(query)
+    items, next_cursor = pagination.split_page(result.all(), limit)
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/users", response_model=schemas.Page[schemas.UserResponse])
+async def get_users(
+    is_active: Optional[bool] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+    db: AsyncSession = Depends(database.get_read_db),
+    admin: security.CurrentUser = Depends(get_current_admin)
+):
+    return await list_users(db, models.UserRole.CUSTOMER, is_active, created_from, created_to, cursor, limit)
 
-@router.get("/drivers", response_model=List[schemas.UserAuthResponse])
-async def get_drivers(db: AsyncSession = Depends(database.get_db), admin: models.User = Depends(get_current_admin)):
-    result = await db.execute(select(models.User).where(models.User.role == models.UserRole.DRIVER))
-    return result.scalars().all()
+@router.get("/drivers", response_model=schemas.Page[schemas.UserResponse])
+async def get_drivers(
+    is_active: Optional[bool] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+    db: AsyncSession = Depends(database.get_read_db),
+    admin: security.CurrentUser = Depends(get_current_admin)
+):
+    return await list_users(db, models.UserRole.DRIVER, is_active, created_from, created_to, cursor, limit)
 
-@router.get("/orders")
-async def get_orders(db: AsyncSession = Depends(database.get_db), admin: models.User = Depends(get_current_admin)):
-    result = await db.execute(select(models.Order))
-    return result.scalars().all()
+@router.get("/orders", response_model=schemas.Page[schemas.OrderResponse])
+async def get_orders(
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    driver_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+    db: AsyncSession = Depends(database.get_read_db),
+    admin: security.CurrentUser = Depends(get_current_admin)
+):
+    def where(model):
+        conditions = []
+        if status:
+            conditions.append(model.status == status)
+        if type:
+            conditions.append(model.type == type)
+        if customer_id is not None:
+            conditions.append(model.customer_id == customer_id)
+        if driver_id is not None:
+            conditions.append(model.driver_id == driver_id)
+        return conditions
+
+    query = archive.order_history_page(
+        db, projections.ORDER_FIELDS, where, created_from, created_to, cursor, limit,
+        include_archive=archive.includes_archive(status),
+    )
+    result = await db.execute(query)
+    items, next_cursor = pagination.split_page(result.all(), limit)
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.get("/pricing")
-async def get_pricing(db: AsyncSession = Depends(database.get_db), admin: models.User = Depends(get_current_admin)):
-    result = await db.execute(select(models.Pricing).limit(1))
-    pricing = result.scalars().first()
-    if not pricing:
-        # Create default if not exists
-        pricing = models.Pricing()
-        db.add(pricing)
-        await db.commit()
-        await db.refresh(pricing)
-    return pricing
+async def get_pricing(admin: security.CurrentUser = Depends(get_current_admin)):
+    return await pricing_cache.get()
 
 @router.put("/pricing")
-async def update_pricing(pricing_update: schemas.PricingUpdate, db: AsyncSession = Depends(database.get_db), admin: models.User = Depends(get_current_admin)):
-    result = await db.execute(select(models.Pricing).limit(1))
-    pricing = result.scalars().first()
-    if not pricing:
-        pricing = models.Pricing()
-        db.add(pricing)
-    
-    pricing.taxi_base_price = pricing_update.taxi_base_price
-    pricing.taxi_price_per_km = pricing_update.taxi_price_per_km
-    pricing.delivery_base_price = pricing_update.delivery_base_price
-    pricing.delivery_price_per_km = pricing_update.delivery_price_per_km
+async def update_pricing(pricing_update: schemas.PricingUpdate, db: AsyncSession = Depends(database.get_db), admin: security.CurrentUser = Depends(get_current_admin)):
+    pricing_id = (await load_pricing_row(db)).id
+
+    # Version bumped in SQL, so concurrent updates each get their own version
+    # and a worker caching either snapshot notices the other
+    result = await db.execute(
+        update(models.Pricing)
+        .where(models.Pricing.id == pricing_id)
+        .values(version=models.Pricing.version + 1, **pricing_update.model_dump())
+        .returning(
+            models.Pricing.id,
+            models.Pricing.version,
+            models.Pricing.taxi_base_price,
+            models.Pricing.taxi_price_per_km,
+            models.Pricing.delivery_base_price,
+            models.Pricing.delivery_price_per_km,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    snapshot = snapshot_from_row(result.one())
+    audit.record(db, "pricing.updated", admin.id, "pricing", pricing_id, version=snapshot.version, **pricing_update.model_dump())
     
     await db.commit()
-    return {"message": "Pricing updated"}
+    pricing_cache.set(snapshot)
+    return {"message": "Pricing updated", "version": snapshot.version}
 
 @router.patch("/users/{user_id}/status")
-async def toggle_user_status(user_id: int, status_data: dict, db: AsyncSession = Depends(database.get_db), admin: models.User = Depends(get_current_admin)):
+async def toggle_user_status(user_id: int, status_data: dict, db: AsyncSession = Depends(database.get_db), admin: security.CurrentUser = Depends(get_current_admin)):
     result = await db.execute(select(models.User).where(models.User.id == user_id))
     user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     user.is_active = status_data.get('is_active', True)
+    user.status_changed_ms = int(time.time() * 1000)
+    phone = user.phone
+    audit.record(db, "user.status_changed", admin.id, "user", user_id, is_active=user.is_active)
     await db.commit()
+    security.invalidate_user(phone)
     return {"message": "Status updated"}
 
 @router.patch("/drivers/{driver_id}/status")
-async def toggle_driver_status(driver_id: int, status_data: dict, db: AsyncSession = Depends(database.get_db), admin: models.User = Depends(get_current_admin)):
+async def toggle_driver_status(driver_id: int, status_data: dict, db: AsyncSession = Depends(database.get_db), admin: security.CurrentUser = Depends(get_current_admin)):
     # Same as user, but specific endpoint for semantic clarity
     return await toggle_user_status(driver_id, status_data, db, admin)
 
 @router.post("/wallet/top-up")
-async def top_up_wallet(data: dict, db: AsyncSession = Depends(database.get_db), admin: models.User = Depends(get_current_admin)):
+async def top_up_wallet(data: dict, db: AsyncSession = Depends(database.get_db), admin: security.CurrentUser = Depends(get_current_admin)):
     driver_id = data.get('driver_id')
     amount = data.get('amount')
+    if not isinstance(amount, (int, float)) or isinstance(amount, bool):
+        raise HTTPException(status_code=400, detail="amount must be a number")
     
-    result = await db.execute(select(models.Wallet).where(models.Wallet.driver_id == driver_id))
-    wallet = result.scalars().first()
-    if not wallet:
+    wallet_id = await db.scalar(select(models.Wallet.id).where(models.Wallet.driver_id == driver_id))
+    if wallet_id is None:
         raise HTTPException(status_code=404, detail="Wallet not found")
         
-    wallet.balance += amount
-    
-    # Record transaction
-    trx = models.Transaction(
-        wallet_id=wallet.id,
-        amount=amount,
-        description="Admin Top-up"
-    )
-    db.add(trx)
+    # Balance increment and transaction record in one transaction
+    await ledger.post(db, wallet_id, ledger.to_minor(amount), "Admin Top-up")
+    audit.record(db, "wallet.top_up", admin.id, "wallet", wallet_id, driver_id=driver_id, amount=amount)
     await db.commit()
     
     return {"message": "Wallet topped up"}
+
+@router.post("/wallet/bulk-top-up")
+async def bulk_top_up_wallets(data: schemas.BulkWalletPosting, db: AsyncSession = Depends(database.get_db), admin: security.CurrentUser = Depends(get_current_admin)):
+    # Mass top-ups / end-of-day payouts, applied all-or-nothing
+    wallet_ids = await ledger.wallet_ids_for_drivers(db, [posting.driver_id for posting in data.postings])
+    missing = sorted({posting.driver_id for posting in data.postings} - wallet_ids.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Wallet not found for drivers: {missing}")
+
+    await ledger.post_many(db, [
+        ledger.Posting(wallet_ids[posting.driver_id], ledger.to_minor(posting.amount), posting.description or "Admin Top-up")
+        for posting in data.postings
+    ])
+    audit.record(
+        db, "wallet.bulk_top_up", admin.id, "wallet", None,
+        postings=len(data.postings), total=sum(posting.amount for posting in data.postings),
+    )
+    await db.commit()
+    return {"message": "Wallets topped up", "postings": len(data.postings)}
+
+@router.get("/audit", response_model=schemas.Page[schemas.AuditEntryResponse])
+async def list_audit_entries(
+    action: Optional[str] = None,
+    actor_id: Optional[int] = None,
+    subject_type: Optional[str] = None,
+    subject_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+    db: AsyncSession = Depends(database.get_read_db),
+    admin: security.CurrentUser = Depends(get_current_admin)
+):
+    query = select(*projections.AUDIT_COLUMNS)
+    if action:
+        query = query.where(models.AuditEntry.action == action)
+    if actor_id is not None:
+        query = query.where(models.AuditEntry.actor_id == actor_id)
+    if subject_type:
+        query = query.where(models.AuditEntry.subject_type == subject_type)
+    if subject_id is not None:
+        query = query.where(models.AuditEntry.subject_id == subject_id)
+    query = pagination.filter_created(db, query, models.AuditEntry.created_at, created_from, created_to)
+    query = pagination.apply_keyset(db, query, models.AuditEntry.created_at, models.AuditEntry.id, cursor, limit)
+
+    result = await db.execute(query)
+    items, next_cursor = pagination.split_page(result.all(), limit)
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/exports/orders")
+async def export_orders(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    status: Optional[str] = None,
+    driver_id: Optional[int] = None,
+    admin: security.CurrentUser = Depends(get_current_admin)
+):
+    # Live and archived orders, streamed; see app/core/exports.py
+    sources = exports.order_sources(projections.ORDER_FIELDS, created_from, created_to, status, driver_id)
+    return exports.response("orders", sources, projections.ORDER_FIELDS, exports.order_record, format, gzip)
+
+@router.get("/exports/transactions")
+async def export_transactions(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    driver_id: Optional[int] = None,
+    admin: security.CurrentUser = Depends(get_current_admin)
+):
+    sources = exports.transaction_sources(created_from, created_to, driver_id)
+    return exports.response(
+        "transactions", sources, exports.TRANSACTION_COLUMNS, exports.transaction_record, format, gzip
+    )
+
+@router.get("/wallets/audit")
+async def audit_wallets(db: AsyncSession = Depends(database.get_read_db), admin: security.CurrentUser = Depends(get_current_admin)):
+    # Wallets whose cached balance does not match their transaction history
+    mismatches = await ledger.audit(db)
+    return {"mismatched": mismatches}
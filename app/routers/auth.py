@@ -2,31 +2,13 @@ from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File,
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from typing import Optional
-import aiofiles
-import os
-import uuid
 from datetime import datetime
 
-from app.core import security, database
+from app.core import security, database, stats, uploads
 from app import models, schemas
-from app.config import settings
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-async def save_upload_file(file: UploadFile) -> str:
-    if not file:
-        return None
-    
-    file_extension = os.path.splitext(file.filename)[1]
-    filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(settings.UPLOAD_DIR, filename)
-    
-    async with aiofiles.open(file_path, 'wb') as out_file:
-        content = await file.read()
-        await out_file.write(content)
-    
-    return f"/uploads/{filename}"
-
 @router.post("/register", response_model=schemas.UserAuthResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     phone: str = Form(...),
@@ -48,7 +30,7 @@ async def register(
     # Handle file upload
     id_photo_url = None
     if id_photo:
-        id_photo_url = await save_upload_file(id_photo)
+        id_photo_url = await uploads.save_upload_file(id_photo)
 
     # Parse date
     parsed_birth_date = None
@@ -58,7 +40,7 @@ async def register(
         except ValueError:
             pass 
 
-    hashed_password = security.get_password_hash(password)
+    hashed_password = await security.get_password_hash_async(password)
     
     db_user = models.User(
         phone=phone,
@@ -75,14 +57,16 @@ async def register(
     )
     
     db.add(db_user)
-    await db.commit()
-    await db.refresh(db_user)
+    await db.flush()
 
     # Create Wallet for Driver
     if role == models.UserRole.DRIVER:
         wallet = models.Wallet(driver_id=db_user.id)
         db.add(wallet)
-        await db.commit()
+
+    stats.enqueue(db, {stats.user_counter(role): 1})
+    await db.commit()
+    await db.refresh(db_user)
     
     access_token = security.create_access_token(data={"sub": db_user.phone, "role": db_user.role})
     
@@ -106,7 +90,7 @@ async def login(request: schemas.LoginRequest, db: AsyncSession = Depends(databa
     result = await db.execute(select(models.User).where(models.User.phone == request.phone))
     user = result.scalars().first()
     
-    if not user or not security.verify_password(request.password, user.hashed_password):
+    if not user or not await security.verify_password_async(request.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
     if not user.is_active:
@@ -117,27 +101,32 @@ async def login(request: schemas.LoginRequest, db: AsyncSession = Depends(databa
 
 @router.get("/profile", response_model=schemas.UserAuthResponse)
 async def get_profile(
-    current_user: models.User = Depends(security.get_current_user)
+    db: AsyncSession = Depends(database.get_db),
+    current_user: security.CurrentUser = Depends(security.get_current_user)
 ):
     # If user is a driver, ensure we return the token as well if needed by the frontend re-auth flow
     # For now, just return the user object, PyDantic will handle the mapping except for access_token
     # Since UserAuthResponse requires access_token, we generate a fresh one or handle it differently
     # But usually /profile just returns user details. Let's adjust schemas if needed or generate a new token.
     # Refetching a token on profile view is weird but harmless.
-    
-    access_token = security.create_access_token(data={"sub": current_user.phone, "role": current_user.role})
+    result = await db.execute(select(models.User).where(models.User.id == current_user.id))
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    access_token = security.create_access_token(data={"sub": user.phone, "role": user.role})
     
     return schemas.UserAuthResponse(
-        id=current_user.id,
-        name=current_user.name,
-        phone=current_user.phone,
-        email=current_user.email,
-        role=current_user.role,
-        is_active=current_user.is_active,
-        created_at=current_user.created_at,
-        id_name=current_user.id_name,
-        national_id=current_user.national_id,
-        birth_date=current_user.birth_date,
-        id_photo_url=current_user.id_photo_url,
+        id=user.id,
+        name=user.name,
+        phone=user.phone,
+        email=user.email,
+        role=user.role,
+        is_active=user.is_active,
+        created_at=user.created_at,
+        id_name=user.id_name,
+        national_id=user.national_id,
+        birth_date=user.birth_date,
+        id_photo_url=user.id_photo_url,
         access_token=access_token
     )
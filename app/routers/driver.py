@@ -1,116 +1,224 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, status
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import func
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timezone
+import time
 
 from app import models, schemas
-from app.core import database, security
+from app.core import database, dispatch, events, geo, ledger, location_history, locations, order_state, pagination, projections, security
+from app.config import settings
 
 router = APIRouter(prefix="/driver", tags=["driver"])
 
 # Dependency to check if user is driver
-async def get_current_driver(current_user: models.User = Depends(security.get_current_user)):
+async def get_current_driver(current_user: security.CurrentUser = Depends(security.get_current_user)):
     if current_user.role != models.UserRole.DRIVER:
         raise HTTPException(status_code=403, detail="Not authorized, driver access only")
     return current_user
 
-@router.get("/orders")
-async def get_available_orders(db: AsyncSession = Depends(database.get_db), driver: models.User = Depends(get_current_driver)):
-    # Get all pending taxi and delivery orders
-    # Optionally filter by location radius if geo libraries were available
-    result = await db.execute(select(models.Order).where(models.Order.status == models.OrderStatus.PENDING))
-    return result.scalars().all()
-
-@router.put("/orders/{order_id}/accept")
-async def accept_order(order_id: int, db: AsyncSession = Depends(database.get_db), driver: models.User = Depends(get_current_driver)):
-    result = await db.execute(select(models.Order).where(models.Order.id == order_id))
-    order = result.scalars().first()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-        
-    if order.status != models.OrderStatus.PENDING:
-        raise HTTPException(status_code=400, detail="Order already taken or cancelled")
-        
-    order.status = models.OrderStatus.ACCEPTED
-    order.driver_id = driver.id
-    
+@router.get("/orders", response_model=List[schemas.OrderResponse])
+async def get_available_orders(
+    radius_km: float = Query(settings.DRIVER_ORDERS_RADIUS_KM, gt=0, le=100),
+    limit: int = Query(settings.DRIVER_ORDERS_LIMIT, ge=1, le=100),
+    db: AsyncSession = Depends(database.get_db),
+    driver: security.CurrentUser = Depends(get_current_driver)
+):
+    # Pings may have gone through other workers since this one saw the
+    # driver, so use whichever of the in-memory and flushed fixes is newer
+    result = await db.execute(
+        select(models.User.current_lat, models.User.current_lng, models.User.last_location_update)
+        .where(models.User.id == driver.id)
+    )
+    lat, lng, flushed_at = result.one()
+    fix = locations.driver_locations.get(driver.id)
+    if fix is not None:
+        # SQLite hands back naive datetimes; they are UTC
+        if flushed_at is not None and flushed_at.tzinfo is None:
+            flushed_at = flushed_at.replace(tzinfo=timezone.utc)
+        if flushed_at is None or fix[2] > flushed_at:
+            lat, lng, _ = fix
+
+    if lat is None or lng is None:
+        # No location fix yet, fall back to the newest pending orders
+        result = await db.execute(
+            select(*projections.ORDER_COLUMNS)
+            .where(models.Order.status == models.OrderStatus.PENDING)
+            .order_by(models.Order.created_at.desc())
+            .limit(limit)
+        )
+        return result.all()
+
+    # Nearest pending orders by pickup point, from the in-memory index
+    await geo.ensure_pending_orders(db)
+    nearest = geo.pending_orders.nearby(lat, lng, radius_km, limit)
+    if not nearest:
+        return []
+
+    result = await db.execute(
+        select(*projections.ORDER_COLUMNS)
+        .where(models.Order.id.in_([order_id for order_id, _ in nearest]))
+        .where(models.Order.status == models.OrderStatus.PENDING)
+    )
+    orders = {order.id: order for order in result.all()}
+
+    # Drop entries that were taken or cancelled through another worker
+    for order_id, _ in nearest:
+        if order_id not in orders:
+            geo.pending_orders.remove(order_id)
+
+    return [orders[order_id] for order_id, _ in nearest if order_id in orders]
+
+@router.put("/orders/{order_id}/accept", response_model=schemas.OrderAcceptedResponse)
+async def accept_order(order_id: int, db: AsyncSession = Depends(database.get_db), driver: security.CurrentUser = Depends(get_current_driver)):
+    await order_state.accept(db, order_id, driver.id)
     await db.commit()
-    await db.refresh(order)
-    return {"message": "Order accepted", "order": order}
+    pickup = geo.pending_orders.get(order_id)
+    if pickup is not None:
+        geo.pending_orders.remove(order_id)
+        events.publish_order_unavailable(order_id, *pickup)
+    events.publish_order_status(order_id, models.OrderStatus.ACCEPTED, driver.id)
+
+    result = await db.execute(select(*projections.ORDER_COLUMNS).where(models.Order.id == order_id))
+    return {"message": "Order accepted", "order": result.one()}
 
 @router.put("/orders/{order_id}/complete")
-async def complete_order(order_id: int, db: AsyncSession = Depends(database.get_db), driver: models.User = Depends(get_current_driver)):
-    result = await db.execute(select(models.Order).where(models.Order.id == order_id))
-    order = result.scalars().first()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if order.driver_id != driver.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-        
-    order.status = models.OrderStatus.COMPLETED
-    order.completed_at = func.now()
+async def complete_order(order_id: int, db: AsyncSession = Depends(database.get_db), driver: security.CurrentUser = Depends(get_current_driver)):
+    earnings = await order_state.complete(db, order_id, driver.id)
     
     # Calculate revenue split if needed
     # For now, just credit wallet
-    # Check if driver has wallet
-    wallet_res = await db.execute(select(models.Wallet).where(models.Wallet.driver_id == driver.id))
-    wallet = wallet_res.scalars().first()
-    
-    if wallet:
-        earnings = order.actual_price if order.actual_price else order.estimated_price
-        wallet.balance += earnings
-        
-        # Add transaction
-        trx = models.Transaction(
-            wallet_id=wallet.id,
-            amount=earnings,
-            description=f"Earnings for Order #{order.id}"
-        )
-        db.add(trx)
+    wallet_id = await db.scalar(select(models.Wallet.id).where(models.Wallet.driver_id == driver.id))
+    if wallet_id is not None:
+        await ledger.post(db, wallet_id, ledger.to_minor(earnings), f"Earnings for Order #{order_id}")
     
     await db.commit()
+    events.publish_order_status(order_id, models.OrderStatus.COMPLETED, driver.id)
     return {"message": "Order completed"}
 
+def record_location(driver_id: int, lat: float, lng: float):
+    # Buffered in memory, persisted by the periodic batch flush
+    locations.driver_locations.update(driver_id, lat, lng)
+    location_history.recorder.record(driver_id, lat, lng)
+    events.publish_driver_location(driver_id, lat, lng)
+
 @router.post("/location")
-async def update_location(location: dict, db: AsyncSession = Depends(database.get_db), driver: models.User = Depends(get_current_driver)):
-    driver.current_lat = location.get('latitude')
-    driver.current_lng = location.get('longitude')
-    driver.last_location_update = func.now()
-    await db.commit()
+async def update_location(location: schemas.DriverLocation, driver: security.CurrentUser = Depends(get_current_driver)):
+    record_location(driver.id, location.latitude, location.longitude)
     return {"message": "Location updated"}
 
+@router.websocket("/ws")
+async def driver_updates(websocket: WebSocket):
+    # Pushes pending orders appearing/disappearing around the driver and the
+    # dispatcher's offers to this driver. The driver may also stream
+    # {"type": "location", "latitude": .., "longitude": ..} messages here
+    # instead of calling POST /driver/location.
+    user = await security.get_websocket_user(websocket)
+    if user is None or user.role != models.UserRole.DRIVER:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscription = events.hub.subscribe(events.offers_topic(user.id))
+    fix = locations.driver_locations.get(user.id)
+    if fix is not None:
+        subscription.set_topics("area:", events.area_topics_around(fix[0], fix[1]))
+
+    async def on_message(message: dict):
+        if message.get("type") != "location":
+            return
+        try:
+            location = schemas.DriverLocation.model_validate(message)
+        except ValidationError:
+            return
+        record_location(user.id, location.latitude, location.longitude)
+        subscription.set_topics("area:", events.area_topics_around(location.latitude, location.longitude))
+
+    await events.pump(websocket, subscription, on_message=on_message)
+
+@router.get("/offer")
+async def get_offer(driver: security.CurrentUser = Depends(get_current_driver)):
+    # The order the dispatcher currently suggests for this driver, if any
+    offer = dispatch.dispatcher.offer_for(driver.id)
+    if offer is None:
+        return {"offer": None}
+    pickup = geo.pending_orders.get(offer.order_id)
+    return {"offer": {
+        "order_id": offer.order_id,
+        "distance_km": offer.distance_km,
+        "pickup_lat": pickup[0] if pickup else None,
+        "pickup_lng": pickup[1] if pickup else None,
+        "expires_in": max(0.0, round(offer.expires_at - time.monotonic(), 1)),
+    }}
+
+@router.post("/offer/{order_id}/decline")
+async def decline_offer(order_id: int, driver: security.CurrentUser = Depends(get_current_driver)):
+    if not dispatch.dispatcher.decline(driver.id, order_id):
+        raise HTTPException(status_code=404, detail="No such offer")
+    return {"message": "Offer declined"}
+
 @router.get("/stats")
-async def get_driver_stats(db: AsyncSession = Depends(database.get_db), driver: models.User = Depends(get_current_driver)):
+async def get_driver_stats(db: AsyncSession = Depends(database.get_read_db), driver: security.CurrentUser = Depends(get_current_driver)):
     # Completed orders
-    completed_count = await db.scalar(
-        select(func.count(models.Order.id))
-        .where(models.Order.driver_id == driver.id)
-        .where(models.Order.status == models.OrderStatus.COMPLETED)
-    )
+    completed_count = 0
+    for model in (models.Order, models.ArchivedOrder):
+        completed_count += await db.scalar(
+            select(func.count(model.id))
+            .where(model.driver_id == driver.id)
+            .where(model.status == models.OrderStatus.COMPLETED)
+        ) or 0
     
     return {
-        "completed_orders": completed_count or 0,
+        "completed_orders": completed_count,
         "rating": 5.0 # Placeholder
     }
 
-@router.get("/wallet")
-async def get_wallet(db: AsyncSession = Depends(database.get_db), driver: models.User = Depends(get_current_driver)):
-    result = await db.execute(select(models.Wallet).where(models.Wallet.driver_id == driver.id))
-    wallet = result.scalars().first()
+@router.get("/wallet", response_model=schemas.WalletResponse)
+async def get_wallet(db: AsyncSession = Depends(database.get_read_db), driver: security.CurrentUser = Depends(get_current_driver)):
+    result = await db.execute(
+        select(models.Wallet.id, models.Wallet.driver_id, models.Wallet.balance_minor)
+        .where(models.Wallet.driver_id == driver.id)
+    )
+    wallet = result.first()
     if not wallet:
         return {"balance": 0.0}
-    return wallet
+    return {"id": wallet.id, "driver_id": wallet.driver_id, "balance": ledger.to_major(wallet.balance_minor)}
 
-@router.get("/transactions")
-async def get_transactions(db: AsyncSession = Depends(database.get_db), driver: models.User = Depends(get_current_driver)):
-    result = await db.execute(select(models.Wallet).where(models.Wallet.driver_id == driver.id))
-    wallet = result.scalars().first()
-    if not wallet:
-        return []
-        
-    trx_res = await db.execute(select(models.Transaction).where(models.Transaction.wallet_id == wallet.id).order_by(models.Transaction.created_at.desc()))
-    return trx_res.scalars().all()
+@router.get("/transactions", response_model=schemas.Page[schemas.TransactionResponse])
+async def get_transactions(
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+    db: AsyncSession = Depends(database.get_read_db),
+    driver: security.CurrentUser = Depends(get_current_driver)
+):
+    wallet_id = await db.scalar(select(models.Wallet.id).where(models.Wallet.driver_id == driver.id))
+    if wallet_id is None:
+        return {"items": [], "next_cursor": None}
+
+    query = select(
+        models.Transaction.id,
+        models.Transaction.wallet_id,
+        models.Transaction.amount_minor,
+        models.Transaction.description,
+        models.Transaction.created_at,
+    ).where(models.Transaction.wallet_id == wallet_id)
+    query = pagination.filter_created(db, query, models.Transaction.created_at, created_from, created_to)
+    query = pagination.apply_keyset(db, query, models.Transaction.created_at, models.Transaction.id, cursor, limit)
+
+    trx_res = await db.execute(query)
+    rows, next_cursor = pagination.split_page(trx_res.all(), limit)
+    items = [
+        {
+            "id": row.id,
+            "wallet_id": row.wallet_id,
+            "amount": ledger.to_major(row.amount_minor),
+            "description": row.description,
+            "created_at": row.created_at,
+        }
+        for row in rows
+    ]
+    return {"items": items, "next_cursor": next_cursor}
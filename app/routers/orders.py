@@ -1,33 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, status
+from pydantic import ValidationError
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from typing import List
+from typing import List, Optional
+from datetime import datetime
+import time
 
 from app import models, schemas
-from app.core import database, security
+from app.core import archive, database, events, geo, location_history, order_state, pagination, projections, quotes, security, stats
+from app.config import settings
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
-async def get_pricing(db: AsyncSession):
-    result = await db.execute(select(models.Pricing).limit(1))
-    pricing = result.scalars().first()
-    if not pricing:
-        pricing = models.Pricing()
-        db.add(pricing)
-        await db.commit()
-    return pricing
-
-@router.post("/taxi", response_model=schemas.BaseModel) # Using generic for now or define OrderResponse
+@router.post("/taxi", response_model=schemas.OrderCreatedResponse)
 async def create_taxi_order(
     order: schemas.OrderCreate, 
     db: AsyncSession = Depends(database.get_db), 
-    current_user: models.User = Depends(security.get_current_user)
+    current_user: security.CurrentUser = Depends(security.get_current_user)
 ):
-    pricing = await get_pricing(db)
-    
-    # Recalculate estimated price to be safe
-    calculated_price = pricing.taxi_base_price + (order.distance_km * pricing.taxi_price_per_km)
+    # Price and distance come from the coordinates, not from the client
+    quote = await quotes.quote(order.pickup_lat, order.pickup_lng, order.dropoff_lat, order.dropoff_lng)
+    calculated_price = quote.taxi_price
     
     db_order = models.Order(
         customer_id=current_user.id,
@@ -39,25 +33,27 @@ async def create_taxi_order(
         dropoff_lng=order.dropoff_lng,
         dropoff_address=order.dropoff_address,
         estimated_price=calculated_price, # Use server calculated price
-        distance_km=order.distance_km,
+        distance_km=quote.distance_km,
         status=models.OrderStatus.PENDING
     )
     
     db.add(db_order)
+    stats.enqueue(db, stats.order_transition(None, models.OrderStatus.PENDING))
     await db.commit()
     await db.refresh(db_order)
+    geo.pending_orders.add(db_order.id, db_order.pickup_lat, db_order.pickup_lng)
+    events.publish_order_available(db_order.id, db_order.type, db_order.pickup_lat, db_order.pickup_lng, db_order.estimated_price)
     
-    return {"id": db_order.id, "message": "Order created"}
+    return {"id": db_order.id, "message": "Order created", "estimated_price": calculated_price, "distance_km": quote.distance_km}
 
-@router.post("/delivery", response_model=schemas.BaseModel)
+@router.post("/delivery", response_model=schemas.OrderCreatedResponse)
 async def create_delivery_order(
     order: schemas.OrderCreate, 
     db: AsyncSession = Depends(database.get_db), 
-    current_user: models.User = Depends(security.get_current_user)
+    current_user: security.CurrentUser = Depends(security.get_current_user)
 ):
-    pricing = await get_pricing(db)
-    
-    calculated_price = pricing.delivery_base_price + (order.distance_km * pricing.delivery_price_per_km)
+    quote = await quotes.quote(order.pickup_lat, order.pickup_lng, order.dropoff_lat, order.dropoff_lng)
+    calculated_price = quote.delivery_price
     
     db_order = models.Order(
         customer_id=current_user.id,
@@ -69,57 +65,236 @@ async def create_delivery_order(
         dropoff_lng=order.dropoff_lng,
         dropoff_address=order.dropoff_address,
         estimated_price=calculated_price,
-        distance_km=order.distance_km,
+        distance_km=quote.distance_km,
         status=models.OrderStatus.PENDING
     )
     
     db.add(db_order)
+    stats.enqueue(db, stats.order_transition(None, models.OrderStatus.PENDING))
     await db.commit()
     await db.refresh(db_order)
+    geo.pending_orders.add(db_order.id, db_order.pickup_lat, db_order.pickup_lng)
+    events.publish_order_available(db_order.id, db_order.type, db_order.pickup_lat, db_order.pickup_lng, db_order.estimated_price)
     
-    return {"id": db_order.id, "message": "Order created"}
+    return {"id": db_order.id, "message": "Order created", "estimated_price": calculated_price, "distance_km": quote.distance_km}
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" if item["loc"] else item["msg"]
+        for item in error.errors()
+    )
+
+@router.post("/delivery/bulk", response_model=schemas.BulkOrderCreatedResponse)
+async def create_delivery_orders(
+    request: schemas.BulkOrderCreate,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: security.CurrentUser = Depends(security.get_current_user)
+):
+    # For merchants creating many deliveries at once: every valid item is
+    # priced against one pricing snapshot and inserted with a single
+    # multi-row INSERT ... RETURNING in one transaction. Invalid items get an
+    # error in their result and do not block the rest.
+    if len(request.orders) > settings.BULK_ORDER_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BULK_ORDER_MAX_ITEMS} orders per request")
+
+    results: List[dict] = []
+    valid = []
+    for index, item in enumerate(request.orders):
+        try:
+            order = schemas.OrderCreate.model_validate(item)
+        except ValidationError as error:
+            results.append({"index": index, "error": _validation_message(error)})
+            continue
+        valid.append((index, order))
+
+    if not valid:
+        return {"created": 0, "pricing_version": None, "results": results}
+
+    trip_quotes = await quotes.quote_many([
+        (order.pickup_lat, order.pickup_lng, order.dropoff_lat, order.dropoff_lng) for _, order in valid
+    ])
+    rows = [
+        {
+            "customer_id": current_user.id,
+            "type": "delivery",
+            "pickup_lat": order.pickup_lat,
+            "pickup_lng": order.pickup_lng,
+            "pickup_address": order.pickup_address,
+            "dropoff_lat": order.dropoff_lat,
+            "dropoff_lng": order.dropoff_lng,
+            "dropoff_address": order.dropoff_address,
+            "estimated_price": quote.delivery_price,
+            "distance_km": quote.distance_km,
+            "status": models.OrderStatus.PENDING,
+        }
+        for (_, order), quote in zip(valid, trip_quotes)
+    ]
+
+    # sort_by_parameter_order keeps the returned ids in item order. PostgreSQL
+    # batches this into multi-row statements; SQLite cannot order RETURNING
+    # and runs one statement per row, still in this single transaction.
+    inserted = await db.execute(
+        insert(models.Order).returning(models.Order.id, sort_by_parameter_order=True),
+        rows,
+    )
+    order_ids = inserted.scalars().all()
+    deltas = stats.order_transition(None, models.OrderStatus.PENDING)
+    stats.enqueue(db, {name: delta * len(order_ids) for name, delta in deltas.items()})
+    await db.commit()
+
+    for order_id, row, (index, _), quote in zip(order_ids, rows, valid, trip_quotes):
+        geo.pending_orders.add(order_id, row["pickup_lat"], row["pickup_lng"])
+        events.publish_order_available(order_id, row["type"], row["pickup_lat"], row["pickup_lng"], row["estimated_price"])
+        results.append({"index": index, "id": order_id, "estimated_price": quote.delivery_price, "distance_km": quote.distance_km})
+
+    results.sort(key=lambda result: result["index"])
+    return {"created": len(order_ids), "pricing_version": trip_quotes[0].pricing_version, "results": results}
+
+@router.post("/quote")
+async def quote_trips(
+    request: schemas.QuoteRequest,
+    current_user: security.CurrentUser = Depends(security.get_current_user)
+):
+    # Taxi and delivery fares for every trip in one call, e.g. for a fare preview
+    if len(request.trips) > settings.QUOTE_MAX_TRIPS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.QUOTE_MAX_TRIPS} trips per request")
+
+    results = await quotes.quote_many([
+        (trip.pickup_lat, trip.pickup_lng, trip.dropoff_lat, trip.dropoff_lng) for trip in request.trips
+    ])
+    return {
+        "pricing_version": results[0].pricing_version if results else None,
+        "quotes": [
+            {"distance_km": quote.distance_km, "taxi": quote.taxi_price, "delivery": quote.delivery_price}
+            for quote in results
+        ],
+    }
 
 @router.post("/cancel")
-async def cancel_order(order_data: dict, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(security.get_current_user)):
+async def cancel_order(order_data: dict, db: AsyncSession = Depends(database.get_db), current_user: security.CurrentUser = Depends(security.get_current_user)):
     order_id = order_data.get('order_id')
-    result = await db.execute(select(models.Order).where(models.Order.id == order_id))
-    order = result.scalars().first()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-        
-    if order.customer_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-        
-    if order.status in [models.OrderStatus.COMPLETED, models.OrderStatus.CANCELLED]:
-        raise HTTPException(status_code=400, detail="Cannot cancel completed order")
-        
-    order.status = models.OrderStatus.CANCELLED
+    await order_state.cancel(db, order_id, current_user.id)
     await db.commit()
+    pickup = geo.pending_orders.get(order_id)
+    if pickup is not None:
+        geo.pending_orders.remove(order_id)
+        events.publish_order_unavailable(order_id, *pickup)
+    events.publish_order_status(order_id, models.OrderStatus.CANCELLED)
     return {"message": "Order cancelled"}
 
-@router.get("/my-orders")
-async def get_my_orders(db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(security.get_current_user)):
-    result = await db.execute(
-        select(models.Order)
-        .where(models.Order.customer_id == current_user.id)
-        .order_by(models.Order.created_at.desc())
-    )
-    return result.scalars().all()
-
-@router.get("/{order_id}")
-async def get_order_details(order_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(security.get_current_user)):
-    result = await db.execute(
-        select(models.Order)
-        .options(selectinload(models.Order.driver))
-        .where(models.Order.id == order_id)
+@router.get("/my-orders", response_model=schemas.Page[schemas.OrderResponse])
+async def get_my_orders(
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+    db: AsyncSession = Depends(database.get_read_db),
+    current_user: security.CurrentUser = Depends(security.get_current_user)
+):
+    def where(model):
+        conditions = [model.customer_id == current_user.id]
+        if status:
+            conditions.append(model.status == status)
+        if type:
+            conditions.append(model.type == type)
+        return conditions
+
+    query = archive.order_history_page(
+        db, projections.ORDER_FIELDS, where, created_from, created_to, cursor, limit,
+        include_archive=archive.includes_archive(status),
     )
-    order = result.scalars().first()
+    result = await db.execute(query)
+    items, next_cursor = pagination.split_page(result.all(), limit)
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/{order_id}", response_model=schemas.OrderDetailResponse)
+async def get_order_details(order_id: int, db: AsyncSession = Depends(database.get_read_db), current_user: security.CurrentUser = Depends(security.get_current_user)):
+    order = await archive.find_order(db, projections.ORDER_FIELDS, order_id)
     
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
         
     if order.customer_id != current_user.id and order.driver_id != current_user.id:
          raise HTTPException(status_code=403, detail="Not authorized")
-         
-    return order
+
+    detail = schemas.OrderDetailResponse.model_validate(order)
+    if order.driver_id is not None:
+        driver_res = await db.execute(
+            select(*projections.DRIVER_SUMMARY_COLUMNS).where(models.User.id == order.driver_id)
+        )
+        driver = driver_res.first()
+        if driver:
+            detail.driver = schemas.DriverSummary.model_validate(driver)
+    return detail
+
+@router.get("/{order_id}/path", response_model=schemas.OrderPathResponse)
+async def get_order_path(order_id: int, db: AsyncSession = Depends(database.get_read_db), current_user: security.CurrentUser = Depends(security.get_current_user)):
+    # The driver's recorded trail from acceptance to completion (or to now
+    # while the order is active), for checking distance_km and disputes
+    order = await archive.find_order(
+        db, ("customer_id", "driver_id", "status", "distance_km", "accepted_at", "completed_at"), order_id
+    )
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if current_user.id not in (order.customer_id, order.driver_id) and current_user.role != models.UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    completed = order.status == models.OrderStatus.COMPLETED and order.completed_at is not None
+    if order.driver_id is None or order.accepted_at is None or not (completed or order.status in order_state.ACTIVE_STATUSES):
+        raise HTTPException(status_code=404, detail="No trip recorded for this order")
+
+    start_ms = location_history.epoch_ms(order.accepted_at)
+    end_ms = location_history.epoch_ms(order.completed_at) if completed else int(time.time() * 1000)
+    points = await location_history.path(db, order.driver_id, start_ms, end_ms)
+    return {
+        "order_id": order_id,
+        "driver_id": order.driver_id,
+        "started_at": location_history.from_epoch_ms(start_ms),
+        "ended_at": location_history.from_epoch_ms(end_ms),
+        "completed": completed,
+        "driven_km": round(location_history.driven_km(points), 3),
+        "quoted_distance_km": order.distance_km,
+        "points": [
+            {"ts": location_history.from_epoch_ms(ts), "lat": lat, "lng": lng} for ts, lat, lng in points
+        ],
+    }
+
+@router.websocket("/{order_id}/ws")
+async def order_updates(websocket: WebSocket, order_id: int):
+    # Pushes status changes of the order and, once assigned, its driver's position
+    user = await security.get_websocket_user(websocket)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Subscribe before reading the snapshot so no transition falls in between
+    subscription = events.hub.subscribe(events.order_topic(order_id))
+    async with database.SessionLocal() as db:
+        result = await db.execute(
+            select(models.Order.status, models.Order.customer_id, models.Order.driver_id)
+            .where(models.Order.id == order_id)
+        )
+        order = result.first()
+
+    if order is None or user.id not in (order.customer_id, order.driver_id):
+        subscription.close()
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    if order.driver_id is not None:
+        subscription.subscribe(events.driver_topic(order.driver_id))
+    await websocket.send_json({
+        "type": "order.status",
+        "order_id": order_id,
+        "status": order.status,
+        "driver_id": order.driver_id,
+    })
+
+    def follow_driver(event: dict):
+        if event["type"] == "order.status" and event.get("driver_id") is not None:
+            subscription.subscribe(events.driver_topic(event["driver_id"]))
+
+    await events.pump(websocket, subscription, on_event=follow_driver)
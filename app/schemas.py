@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Dict, Generic, Optional, List, TypeVar
 from datetime import datetime
 from enum import Enum
 
@@ -12,7 +12,9 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
-class UserAuthResponse(BaseModel):
+class UserResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     name: str
     phone: str
@@ -25,14 +27,42 @@ class UserAuthResponse(BaseModel):
     national_id: Optional[str] = None
     birth_date: Optional[datetime] = None
     id_photo_url: Optional[str] = None
+
+class UserAuthResponse(UserResponse):
     access_token: str
 
+T = TypeVar("T")
+
+# One page of a keyset-paginated listing; pass next_cursor back as ?cursor=
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
 class LoginRequest(BaseModel):
     phone: str
     password: str
 
 class OrderCreate(BaseModel):
     type: str # taxi or delivery
+    pickup_lat: float = Field(ge=-90, le=90)
+    pickup_lng: float = Field(ge=-180, le=180)
+    pickup_address: Optional[str] = None
+    dropoff_lat: float = Field(ge=-90, le=90)
+    dropoff_lng: float = Field(ge=-180, le=180)
+    dropoff_address: Optional[str] = None
+    estimated_price: Optional[float] = None # ignored, the server quotes the price
+    distance_km: Optional[float] = None # ignored, the server measures the trip
+
+# Order responses are validated from selected column rows (see
+# app/core/projections.py), never from ORM entities with relationships
+class OrderResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    customer_id: int
+    driver_id: Optional[int] = None
+    type: str
+    status: str
     pickup_lat: float
     pickup_lng: float
     pickup_address: Optional[str] = None
@@ -40,14 +70,136 @@ class OrderCreate(BaseModel):
     dropoff_lng: float
     dropoff_address: Optional[str] = None
     estimated_price: float
+    actual_price: Optional[float] = None
+    distance_km: Optional[float] = None
+    created_at: Optional[datetime] = None
+    accepted_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+class DriverSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    phone: str
+    current_lat: Optional[float] = None
+    current_lng: Optional[float] = None
+
+class OrderDetailResponse(OrderResponse):
+    driver: Optional[DriverSummary] = None
+
+class OrderCreatedResponse(BaseModel):
+    id: int
+    message: str
+    estimated_price: float
     distance_km: float
 
+# Items are validated one at a time by the endpoint, so an invalid item is
+# reported in its own result instead of rejecting the whole batch
+class BulkOrderCreate(BaseModel):
+    orders: List[Dict[str, Any]]
+
+class BulkOrderResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    estimated_price: Optional[float] = None
+    distance_km: Optional[float] = None
+    error: Optional[str] = None
+
+class BulkOrderCreatedResponse(BaseModel):
+    created: int
+    pricing_version: Optional[int] = None
+    results: List[BulkOrderResult]
+
+class OrderAcceptedResponse(BaseModel):
+    message: str
+    order: OrderResponse
+
+class PathPoint(BaseModel):
+    ts: datetime
+    lat: float
+    lng: float
+
+class OrderPathResponse(BaseModel):
+    order_id: int
+    driver_id: int
+    started_at: datetime
+    ended_at: datetime
+    completed: bool
+    driven_km: float
+    quoted_distance_km: Optional[float] = None
+    points: List[PathPoint]
+
+class WalletResponse(BaseModel):
+    id: Optional[int] = None
+    driver_id: Optional[int] = None
+    balance: float
+
+class TransactionResponse(BaseModel):
+    id: int
+    wallet_id: int
+    amount: float
+    description: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class AuditEntryResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    actor_id: Optional[int] = None
+    action: str
+    subject_type: str
+    subject_id: Optional[int] = None
+    details: Optional[Dict[str, Any]] = None
+    created_at: datetime
+
+class OrderRollupStats(BaseModel):
+    type: str
+    status: str
+    orders: int
+    revenue: float
+    avg_price: Optional[float] = None
+    avg_distance_km: Optional[float] = None
+
+class OrderRollupBucket(OrderRollupStats):
+    start: datetime
+
+class OrderAnalyticsSeries(BaseModel):
+    granularity: str
+    buckets: List[OrderRollupBucket]
+
+class OrderAnalyticsSummary(BaseModel):
+    start: datetime
+    end: datetime
+    groups: List[OrderRollupStats]
+
+class TripQuote(BaseModel):
+    pickup_lat: float = Field(ge=-90, le=90)
+    pickup_lng: float = Field(ge=-180, le=180)
+    dropoff_lat: float = Field(ge=-90, le=90)
+    dropoff_lng: float = Field(ge=-180, le=180)
+
+class QuoteRequest(BaseModel):
+    trips: List[TripQuote]
+
 class LocationUpdate(BaseModel):
     current_lat: float
     current_lng: float
 
+class DriverLocation(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
 class PricingUpdate(BaseModel):
     taxi_base_price: int
     taxi_price_per_km: int
     delivery_base_price: int
     delivery_price_per_km: int
+
+class WalletPosting(BaseModel):
+    driver_id: int
+    amount: float
+    description: Optional[str] = None
+
+class BulkWalletPosting(BaseModel):
+    postings: List[WalletPosting]
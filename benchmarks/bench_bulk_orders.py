@@ -0,0 +1,108 @@
+"""Delivery order creation: one request per order vs POST /orders/delivery/bulk.
+
+    python benchmarks/bench_bulk_orders.py --orders 2000 --batch-size 100 500
+
+One merchant account creates --orders deliveries, first with POST
+/orders/delivery calls (--concurrency in flight, the way merchants loop over
+their shipments today), then in bulk requests of each --batch-size. Reports
+orders per second and the latency of the requests themselves.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from common import print_table, prepare_environment, start_app, stop_app, summarize, write_json
+
+PHONE = "+966540000001"
+PASSWORD = "bench-password"
+
+def make_orders(rng, count, lat, lng):
+    orders = []
+    for index in range(count):
+        orders.append({
+            "type": "delivery",
+            "estimated_price": 0,
+            "pickup_lat": lat + rng.uniform(-0.05, 0.05),
+            "pickup_lng": lng + rng.uniform(-0.05, 0.05),
+            "dropoff_lat": lat + rng.uniform(-0.15, 0.15),
+            "dropoff_lng": lng + rng.uniform(-0.15, 0.15),
+            "dropoff_address": f"Shipment {index}",
+        })
+    return orders
+
+async def run(args):
+    client = await start_app()
+    rng = random.Random(args.seed)
+
+    await client.post("/auth/register", data={"phone": PHONE, "password": PASSWORD, "name": "Bench merchant", "role": "customer"})
+    response = await client.post("/auth/login", json={"phone": PHONE, "password": PASSWORD})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    rows, orders_per_second = [], {}
+
+    # One request per order
+    gate = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], 0
+
+    async def create(body):
+        nonlocal errors
+        async with gate:
+            started = time.perf_counter()
+            response = await client.post("/orders/delivery", json=body, headers=headers)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors += 1
+
+    orders = make_orders(rng, args.orders, args.lat, args.lng)
+    started = time.perf_counter()
+    await asyncio.gather(*(create(body) for body in orders))
+    elapsed = time.perf_counter() - started
+    rows.append(summarize("POST /orders/delivery", latencies, errors, elapsed))
+    orders_per_second["single"] = args.orders / elapsed
+
+    # Bulk, one request per batch, sent one after another
+    for batch_size in args.batch_size:
+        orders = make_orders(rng, args.orders, args.lat, args.lng)
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for start in range(0, len(orders), batch_size):
+            batch = orders[start:start + batch_size]
+            request_started = time.perf_counter()
+            response = await client.post("/orders/delivery/bulk", json={"orders": batch}, headers=headers)
+            latencies.append(time.perf_counter() - request_started)
+            if response.status_code != 200 or response.json()["created"] != len(batch):
+                errors += 1
+        elapsed = time.perf_counter() - started
+        rows.append(summarize(f"POST /orders/delivery/bulk x{batch_size}", latencies, errors, elapsed))
+        orders_per_second[f"bulk x{batch_size}"] = args.orders / elapsed
+
+    await stop_app(client)
+
+    print_table(rows)
+    print()
+    for name, rate in orders_per_second.items():
+        print(f"{name:<20}{rate:>10.1f} orders/s  ({rate / orders_per_second['single']:.1f}x)")
+
+    if args.json:
+        write_json(args.json, {
+            "config": {key: value for key, value in vars(args).items() if key != "json"},
+            "orders_per_second": {name: round(rate, 1) for name, rate in orders_per_second.items()},
+            "results": rows,
+        })
+    return 1 if any(row["errors"] for row in rows) else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=1000, help="orders created by each method")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[50, 200, 500], help="orders per bulk request")
+    parser.add_argument("--concurrency", type=int, default=16, help="single-order requests in flight")
+    parser.add_argument("--lat", type=float, default=24.7136)
+    parser.add_argument("--lng", type=float, default=46.6753)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write machine-readable results to this path")
+    args = parser.parse_args()
+
+    prepare_environment()
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,91 @@
+"""Dispatch matching time per tick for orders x drivers.
+
+    python benchmarks/bench_dispatch.py --sizes 1000x1000 2000x2000 5000x5000
+
+Points are spread uniformly over a city-sized box. For each size it times the
+distance matrix and the matching separately, and compares the mean pickup
+distance with first-come assignment (drivers in random order each take the
+nearest order still free), which is what drivers polling /driver/orders do.
+"""
+import argparse
+import time
+
+from common import prepare_environment, write_json
+
+def first_come(distances, max_km, rng):
+    import numpy as np
+
+    taken = np.zeros(distances.shape[0], dtype=bool)
+    total, pairs = 0.0, 0
+    for col in rng.permutation(distances.shape[1]):
+        column = np.where(taken, np.inf, distances[:, col])
+        row = int(column.argmin())
+        if column[row] <= max_km:
+            taken[row] = True
+            total += float(column[row])
+            pairs += 1
+    return pairs, total
+
+def run(args):
+    import numpy as np
+    from app.core import dispatch, geo
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    print(f"{'orders x drivers':<20}{'matrix ms':>12}{'match ms':>12}{'total ms':>12}{'pairs':>8}{'mean km':>10}{'first-come km':>16}")
+    for size in args.sizes:
+        n_orders, n_drivers = (int(part) for part in size.lower().split("x"))
+        order_lat = rng.uniform(args.lat, args.lat + args.span, n_orders)
+        order_lng = rng.uniform(args.lng, args.lng + args.span, n_orders)
+        driver_lat = rng.uniform(args.lat, args.lat + args.span, n_drivers)
+        driver_lng = rng.uniform(args.lng, args.lng + args.span, n_drivers)
+
+        matrix_times, match_times = [], []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            distances = geo.haversine_km_matrix(order_lat, order_lng, driver_lat, driver_lng)
+            matrix_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            pairs = dispatch.match(distances, args.max_km)
+            match_times.append(time.perf_counter() - started)
+
+        matrix_ms = min(matrix_times) * 1000
+        match_ms = min(match_times) * 1000
+        mean_km = sum(distance for _, _, distance in pairs) / len(pairs) if pairs else 0.0
+        baseline_pairs, baseline_total = first_come(distances, args.max_km, rng)
+        baseline_km = baseline_total / baseline_pairs if baseline_pairs else 0.0
+
+        row = {
+            "orders": n_orders,
+            "drivers": n_drivers,
+            "matrix_ms": round(matrix_ms, 2),
+            "match_ms": round(match_ms, 2),
+            "total_ms": round(matrix_ms + match_ms, 2),
+            "pairs": len(pairs),
+            "mean_pickup_km": round(mean_km, 3),
+            "first_come_pairs": baseline_pairs,
+            "first_come_mean_pickup_km": round(baseline_km, 3),
+        }
+        results.append(row)
+        print(
+            f"{size:<20}{row['matrix_ms']:>12}{row['match_ms']:>12}{row['total_ms']:>12}"
+            f"{row['pairs']:>8}{row['mean_pickup_km']:>10}{row['first_come_mean_pickup_km']:>16}"
+        )
+
+    if args.json:
+        write_json(args.json, {"max_km": args.max_km, "span_degrees": args.span, "results": results})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", default=["500x500", "1000x1000", "2000x2000", "5000x3000"])
+    parser.add_argument("--max-km", type=float, default=5.0, help="DISPATCH_MAX_PICKUP_KM")
+    parser.add_argument("--lat", type=float, default=24.55, help="south edge of the box")
+    parser.add_argument("--lng", type=float, default=46.55, help="west edge of the box")
+    parser.add_argument("--span", type=float, default=0.4, help="box size in degrees (~40 km)")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write machine-readable results to this path")
+    args = parser.parse_args()
+
+    prepare_environment()
+    run(args)
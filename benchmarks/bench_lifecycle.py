@@ -0,0 +1,248 @@
+"""Order lifecycle load test: throughput and p50/p95/p99 per endpoint.
+
+    python benchmarks/bench_lifecycle.py --json run.json
+    python benchmarks/bench_lifecycle.py --baseline run.json --max-regression 0.2
+
+By default the app runs in-process against a throwaway SQLite database. Set
+DATABASE_URL (e.g. postgresql+asyncpg://...) to use a Postgres stand-in
+instead, or pass --url to drive an already running server.
+
+Phases, each with --concurrency requests in flight:
+  1. register customers, drivers and an admin
+  2. log everybody in
+  3. mixed traffic: order creation and quotes, location pings, pending-order
+     polling, my-orders and admin listings
+  4. --racers drivers race to accept every pending order (one 200, rest 409)
+  5. winners complete their orders, crediting wallets, then read them back
+
+--json writes the results; pass that file as --baseline on a later run to
+print the change per endpoint. The exit status is 1 when any endpoint's p95
+got worse than --max-regression.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import defaultdict
+
+from common import LoopLagMonitor, compare, prepare_environment, print_table, start_app, stop_app, summarize, write_json
+
+PASSWORD = "bench-password"
+ID_PHOTO = b"\xff\xd8\xff\xe0" + b"\0" * 2048
+
+class Recorder:
+    # Latency and unexpected-status counts per endpoint; throughput is taken
+    # over the phase the endpoint ran in
+
+    def __init__(self, concurrency: int):
+        self.gate = asyncio.Semaphore(concurrency)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.elapsed = defaultdict(float)
+        self._phase_names = set()
+
+    async def call(self, name, send, expected=(200,)):
+        async with self.gate:
+            started = time.perf_counter()
+            try:
+                response = await send()
+            except Exception:
+                response = None
+            self.latencies[name].append(time.perf_counter() - started)
+        self._phase_names.add(name)
+        if response is None or response.status_code not in expected:
+            self.errors[name] += 1
+        return response
+
+    async def phase(self, calls):
+        self._phase_names = set()
+        started = time.perf_counter()
+        results = await asyncio.gather(*calls)
+        elapsed = time.perf_counter() - started
+        for name in self._phase_names:
+            self.elapsed[name] += elapsed
+        return results
+
+    def rows(self):
+        return [summarize(name, self.latencies[name], self.errors[name], self.elapsed[name]) for name in self.latencies]
+
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+def around(rng, lat, lng, spread):
+    return lat + rng.uniform(-spread, spread), lng + rng.uniform(-spread, spread)
+
+async def close(client, args):
+    if args.url:
+        await client.aclose()
+    else:
+        await stop_app(client)
+
+async def run(args):
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        client = await start_app()
+
+    rng = random.Random(args.seed)
+    rec = Recorder(args.concurrency)
+    # Unique per run, so repeated runs against one --url server do not collide
+    prefix = f"+9665{time.time_ns() // 1000 % 100:02d}"
+    customers = [f"{prefix}1{index:04d}" for index in range(args.customers)]
+    drivers = [f"{prefix}2{index:04d}" for index in range(args.drivers)]
+    admin = f"{prefix}30000"
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+
+    # 1. Registration
+    def register(phone, role):
+        data = {"phone": phone, "password": PASSWORD, "name": f"Bench {role}", "role": role}
+        files = {"id_photo": ("id.jpg", ID_PHOTO + phone.encode(), "image/jpeg")} if role == "driver" else None
+        return rec.call("POST /auth/register", lambda: client.post("/auth/register", data=data, files=files), (201,))
+
+    await rec.phase(
+        [register(phone, "customer") for phone in customers]
+        + [register(phone, "driver") for phone in drivers]
+        + [register(admin, "admin")]
+    )
+
+    # 2. Login
+    def login(phone):
+        return rec.call("POST /auth/login", lambda: client.post("/auth/login", json={"phone": phone, "password": PASSWORD}))
+
+    responses = await rec.phase([login(phone) for phone in customers + drivers + [admin]])
+    tokens = [response.json()["access_token"] if response is not None and response.status_code == 200 else None for response in responses]
+    customer_headers = [auth(token) for token in tokens[:len(customers)] if token]
+    driver_headers = [auth(token) for token in tokens[len(customers):-1] if token]
+    admin_headers = auth(tokens[-1]) if tokens[-1] else None
+    if not customer_headers or not driver_headers or admin_headers is None:
+        print("Setup failed, no usable accounts", file=sys.stderr)
+        await close(client, args)
+        return 2
+
+    # 3. Mixed traffic
+    def trip():
+        pickup = around(rng, args.lat, args.lng, 0.05)
+        dropoff = around(rng, args.lat, args.lng, 0.15)
+        return {"pickup_lat": pickup[0], "pickup_lng": pickup[1], "dropoff_lat": dropoff[0], "dropoff_lng": dropoff[1]}
+
+    def create_order(headers):
+        order_type = rng.choice(("taxi", "delivery"))
+        body = {"type": order_type, "estimated_price": 0, **trip()}
+        return rec.call(f"POST /orders/{order_type}", lambda: client.post(f"/orders/{order_type}", json=body, headers=headers))
+
+    def quote(headers):
+        body = {"trips": [trip() for _ in range(5)]}
+        return rec.call("POST /orders/quote", lambda: client.post("/orders/quote", json=body, headers=headers))
+
+    def ping(headers):
+        lat, lng = around(rng, args.lat, args.lng, 0.05)
+        body = {"latitude": lat, "longitude": lng}
+        return rec.call("POST /driver/location", lambda: client.post("/driver/location", json=body, headers=headers))
+
+    def poll(headers):
+        return rec.call("GET /driver/orders", lambda: client.get("/driver/orders", headers=headers))
+
+    def my_orders(headers):
+        return rec.call("GET /orders/my-orders", lambda: client.get("/orders/my-orders", params={"limit": 20}, headers=headers))
+
+    def admin_listing(path):
+        return rec.call(f"GET {path}", lambda: client.get(path, headers=admin_headers))
+
+    mixed = [create_order(rng.choice(customer_headers)) for _ in range(args.orders)]
+    mixed += [quote(rng.choice(customer_headers)) for _ in range(args.orders // 4)]
+    mixed += [ping(headers) for headers in driver_headers for _ in range(args.pings)]
+    mixed += [poll(headers) for headers in driver_headers for _ in range(args.polls)]
+    mixed += [my_orders(rng.choice(customer_headers)) for _ in range(args.orders // 4)]
+    mixed += [admin_listing(path) for path in ("/admin/orders", "/admin/users", "/admin/stats") for _ in range(args.admin_listings)]
+    rng.shuffle(mixed)
+    await rec.phase(mixed)
+
+    # 4. Accept races on whatever is still pending
+    response = await client.get("/admin/orders", params={"status": "pending", "limit": 200}, headers=admin_headers)
+    pending = [order["id"] for order in response.json()["items"]] if response.status_code == 200 else []
+    racers = min(args.racers, len(driver_headers))
+
+    def accept(order_id, index, headers):
+        async def send():
+            response = await client.put(f"/driver/orders/{order_id}/accept", headers=headers)
+            if response.status_code == 200:
+                winners[order_id] = index
+            return response
+        return rec.call("PUT /driver/orders/{id}/accept", send, (200, 409))
+
+    winners = {}
+    races = []
+    for order_id in pending:
+        for index in rng.sample(range(len(driver_headers)), racers):
+            races.append(accept(order_id, index, driver_headers[index]))
+    rng.shuffle(races)
+    await rec.phase(races)
+    lost_races = [order_id for order_id in pending if order_id not in winners]
+
+    # 5. Completion and wallet reads
+    def complete(order_id, headers):
+        return rec.call("PUT /driver/orders/{id}/complete", lambda: client.put(f"/driver/orders/{order_id}/complete", headers=headers))
+
+    await rec.phase([complete(order_id, driver_headers[index]) for order_id, index in winners.items()])
+    await rec.phase(
+        [rec.call("GET /driver/wallet", lambda headers=headers: client.get("/driver/wallet", headers=headers)) for headers in driver_headers]
+        + [rec.call("GET /driver/transactions", lambda headers=headers: client.get("/driver/transactions", headers=headers)) for headers in driver_headers]
+    )
+
+    total_elapsed = time.perf_counter() - started
+    await monitor.stop()
+    await close(client, args)
+
+    rows = rec.rows()
+    print_table(rows)
+    total_requests = sum(row["requests"] for row in rows)
+    print(f"{total_requests} requests in {total_elapsed:.1f} s ({total_requests / total_elapsed:.1f} req/s), "
+          f"max event loop lag {monitor.max_lag * 1000:.1f} ms")
+    if lost_races:
+        print(f"warning: {len(lost_races)} pending orders had no accept winner", file=sys.stderr)
+
+    payload = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+        "total_requests": total_requests,
+        "elapsed_s": round(total_elapsed, 3),
+        "max_loop_lag_ms": round(monitor.max_lag * 1000, 2),
+        "results": rows,
+    }
+    if args.json:
+        write_json(args.json, payload)
+    if args.baseline:
+        regressions = compare(rows, args.baseline, args.max_regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--customers", type=int, default=20)
+    parser.add_argument("--drivers", type=int, default=20)
+    parser.add_argument("--orders", type=int, default=200, help="orders created in the mixed phase")
+    parser.add_argument("--pings", type=int, default=10, help="location pings per driver")
+    parser.add_argument("--polls", type=int, default=5, help="pending-order polls per driver")
+    parser.add_argument("--admin-listings", type=int, default=10, help="calls per admin listing endpoint")
+    parser.add_argument("--racers", type=int, default=5, help="drivers racing to accept each order")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight")
+    parser.add_argument("--lat", type=float, default=24.7136)
+    parser.add_argument("--lng", type=float, default=46.6753)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write machine-readable results to this path")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative p95 increase")
+    args = parser.parse_args()
+
+    if not args.url:
+        prepare_environment()
+        # Lock waits under write contention make every statement "slow"
+        logging.getLogger("app.core.querystats").setLevel(logging.ERROR)
+    sys.exit(asyncio.run(run(args)))
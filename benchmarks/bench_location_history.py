@@ -0,0 +1,105 @@
+"""Location history append throughput, storage per point and path reads.
+
+    python benchmarks/bench_location_history.py --drivers 5000 --pings 15 --flushes 5
+
+Simulates --drivers drivers each sending --pings pings per history flush
+(LOCATION_HISTORY_FLUSH_SECONDS / ping interval), records them through the
+recorder and times every flush, i.e. the encoding plus the batched INSERT.
+Then reads back the full path of a few drivers. Runs against a throwaway
+SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from common import prepare_environment, write_json
+
+async def run(args):
+    from sqlalchemy import func, select
+    from app import migrate, models
+    from app.core import database, location_history
+
+    await migrate.upgrade(database.engine)
+    async with database.SessionLocal() as db:
+        db.add_all([
+            models.User(id=index + 1, phone=f"+9665{index:08d}", name="Bench driver", hashed_password="-", role="driver")
+            for index in range(args.drivers)
+        ])
+        await db.commit()
+
+    rng = random.Random(args.seed)
+    recorder = location_history.recorder
+    positions = {
+        driver_id: (args.lat + rng.uniform(-0.2, 0.2), args.lng + rng.uniform(-0.2, 0.2))
+        for driver_id in range(1, args.drivers + 1)
+    }
+    started_ms = int(time.time() * 1000 - args.flushes * args.pings * args.interval * 1000)
+    ts = started_ms
+
+    flush_times, record_times = [], []
+    for _ in range(args.flushes):
+        started = time.perf_counter()
+        for _ in range(args.pings):
+            ts += int(args.interval * 1000)
+            for driver_id, (lat, lng) in positions.items():
+                lat += rng.uniform(-0.0003, 0.0003)
+                lng += rng.uniform(-0.0003, 0.0003)
+                positions[driver_id] = (lat, lng)
+                recorder.record(driver_id, lat, lng, ts + rng.randint(0, 999))
+        record_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await recorder.flush()
+        flush_times.append(time.perf_counter() - started)
+
+    pings = args.drivers * args.pings * args.flushes
+    async with database.SessionLocal() as db:
+        result = await db.execute(
+            select(func.count(), func.sum(models.LocationChunk.point_count), func.sum(func.length(models.LocationChunk.data)))
+        )
+        chunks, points, encoded_bytes = result.one()
+
+    path_times, path_points = [], 0
+    async with database.SessionLocal() as db:
+        for driver_id in rng.sample(range(1, args.drivers + 1), min(20, args.drivers)):
+            started = time.perf_counter()
+            trail = await location_history.path(db, driver_id, started_ms, ts + 1000)
+            location_history.driven_km(trail)
+            path_times.append(time.perf_counter() - started)
+            path_points = len(trail)
+
+    await database.engine.dispose()
+
+    flush_total = sum(flush_times)
+    result = {
+        "pings": pings,
+        "chunks": chunks,
+        "points_stored": points,
+        "bytes_per_point": round(encoded_bytes / points, 2),
+        "record_us_per_ping": round(sum(record_times) / pings * 1e6, 2),
+        "flush_ms_mean": round(flush_total / len(flush_times) * 1000, 1),
+        "flush_ms_max": round(max(flush_times) * 1000, 1),
+        "append_pings_per_s": round(pings / flush_total),
+        "path_points": path_points,
+        "path_ms_mean": round(sum(path_times) / len(path_times) * 1000, 2),
+    }
+    for key, value in result.items():
+        print(f"{key:<24}{value:>14}")
+    if args.json:
+        write_json(args.json, {"config": {key: value for key, value in vars(args).items() if key != "json"}, "results": result})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=2000)
+    parser.add_argument("--pings", type=int, default=15, help="pings per driver per flush")
+    parser.add_argument("--flushes", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between a driver's pings")
+    parser.add_argument("--lat", type=float, default=24.7136)
+    parser.add_argument("--lng", type=float, default=46.6753)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write machine-readable results to this path")
+    args = parser.parse_args()
+
+    prepare_environment()
+    asyncio.run(run(args))
@@ -0,0 +1,69 @@
+"""Login throughput vs. password hashing pool size.
+
+    python benchmarks/bench_login.py --workers 4 --concurrency 64 --logins 200
+
+Runs the app in-process against a throwaway SQLite database. Compare req/s
+and the max event-loop lag across --workers values to size PASSWORD_HASH_WORKERS.
+"""
+import argparse
+import asyncio
+import time
+
+from common import LoopLagMonitor, prepare_environment, print_table, start_app, stop_app, summarize, write_json
+
+async def run(args):
+    client = await start_app()
+    password = "bench-password"
+    phones = [f"+9665{index:08d}" for index in range(args.users)]
+
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def register(phone):
+        async with gate:
+            response = await client.post(
+                "/auth/register",
+                data={"phone": phone, "password": password, "name": "Bench User", "role": "customer"},
+            )
+            response.raise_for_status()
+
+    await asyncio.gather(*(register(phone) for phone in phones))
+
+    latencies = []
+    errors = 0
+
+    async def login(index):
+        nonlocal errors
+        async with gate:
+            started = time.perf_counter()
+            response = await client.post("/auth/login", json={"phone": phones[index % len(phones)], "password": password})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(login(index) for index in range(args.logins)))
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    await stop_app(client)
+
+    row = summarize("POST /auth/login", latencies, errors, elapsed)
+    print(f"hash workers={args.workers} concurrency={args.concurrency}")
+    print_table([row])
+    print(f"max event loop lag: {monitor.max_lag * 1000:.1f} ms")
+    if args.json:
+        write_json(args.json, {"workers": args.workers, "concurrency": args.concurrency,
+                               "max_loop_lag_ms": round(monitor.max_lag * 1000, 2), "results": [row]})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument("--concurrency", type=int, default=64, help="in-flight login requests")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--json", help="write machine-readable results to this path")
+    args = parser.parse_args()
+
+    prepare_environment(PASSWORD_HASH_WORKERS=args.workers, PASSWORD_HASH_MAX_CONCURRENCY=max(args.concurrency, 1))
+    asyncio.run(run(args))
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def prepare_environment(**overrides) -> str:
+    # Must run before anything under app/ is imported, settings are read at import time
+    workdir = tempfile.mkdtemp(prefix="dot-bench-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{workdir}/bench.db")
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(workdir, "uploads"))
+    for key, value in overrides.items():
+        os.environ[key] = str(value)
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    return workdir
+
+async def start_app():
+    import httpx
+    from app.main import app
+    from app import migrate
+    from app.core import database
+
+    await migrate.upgrade(database.engine)
+    for handler in app.router.on_startup:
+        await handler()
+
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60)
+
+async def stop_app(client):
+    from app.main import app
+
+    await client.aclose()
+    for handler in app.router.on_shutdown:
+        await handler()
+
+class LoopLagMonitor:
+    # Measures how late a periodic tick fires, i.e. how long the event loop was blocked
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.perf_counter() - started - self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float) -> Dict:
+    ordered = sorted(latencies)
+    return {
+        "name": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+    }
+
+def print_table(rows: List[Dict]):
+    print(f"{'name':<36}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in rows:
+        print(
+            f"{row['name']:<36}{row['requests']:>10}{row['errors']:>8}{row['throughput_rps']:>10}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+        )
+
+def write_json(path: str, payload: Dict):
+    with open(path, "w") as out:
+        json.dump(payload, out, indent=2)
+
+def compare(rows: List[Dict], baseline_path: str, max_regression: float) -> List[str]:
+    # Prints p50/p95/req/s against a saved run; returns endpoints whose p95
+    # grew by more than max_regression (0.2 = 20%)
+    with open(baseline_path) as baseline_file:
+        baseline = {row["name"]: row for row in json.load(baseline_file)["results"]}
+
+    regressions = []
+    print(f"\n{'vs ' + baseline_path:<40}{'p50 ms':>16}{'p95 ms':>16}{'req/s':>16}")
+    for row in rows:
+        old = baseline.get(row["name"])
+        if old is None:
+            print(f"{row['name']:<40}{'(new)':>16}")
+            continue
+
+        cells = []
+        for key in ("p50_ms", "p95_ms", "throughput_rps"):
+            change = (row[key] - old[key]) / old[key] if old[key] else 0.0
+            cells.append(f"{row[key]} ({change:+.0%})")
+        p95_change = (row["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        flag = ""
+        if p95_change > max_regression:
+            regressions.append(row["name"])
+            flag = "  REGRESSION"
+        print(f"{row['name']:<40}{cells[0]:>16}{cells[1]:>16}{cells[2]:>16}{flag}")
+    return regressions
@@ -0,0 +1,39 @@
+import random
+
+from app.core import analytics
+
+HOUR, DAY = analytics.HOUR_MS, analytics.DAY_MS
+
+def covered_hours(ranges):
+    hours = []
+    for granularity, low, high in ranges:
+        hours.extend(range(low, high, HOUR))
+    return hours
+
+def test_summary_ranges_cover_each_overlapping_hour_once():
+    rng = random.Random(21)
+    for _ in range(500):
+        start = rng.randint(0, 10 * DAY)
+        end = start + rng.randint(1, 5 * DAY)
+        ranges = analytics.summary_ranges(start, end)
+
+        hours = covered_hours(ranges)
+        assert hours == list(range(start - start % HOUR, end, HOUR))
+        for granularity, low, high in ranges:
+            size = analytics.GRANULARITIES[granularity]
+            assert low % size == 0 and high % size == 0 and low < high
+
+def test_summary_ranges_use_days_for_whole_days():
+    ranges = analytics.summary_ranges(DAY - 2 * HOUR, 3 * DAY + 30 * 60 * 1000)
+    assert ranges == [("hour", DAY - 2 * HOUR, DAY), ("day", DAY, 3 * DAY), ("hour", 3 * DAY, 3 * DAY + HOUR)]
+
+def test_add_and_remove_cancel_out():
+    totals = analytics._totals()
+    payload = {"type": "taxi", "status": "completed", "created_ms": DAY + 90 * 60 * 1000, "price": 42.5, "distance_km": 12.0}
+    analytics._add(totals, payload)
+
+    assert totals[("hour", DAY + HOUR, "taxi", "completed")]["revenue"] == 42.5
+    assert totals[("day", DAY, "taxi", "completed")]["distance_orders"] == 1
+
+    analytics._add(totals, payload, sign=-1)
+    assert all(value == 0 for measures in totals.values() for value in measures.values())
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.core import archive, pagination
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+ORDERS = 9
+
+async def setup_database():
+    path = os.path.join(tempfile.mkdtemp(), "archive.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+    Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with Session() as db:
+        customer = models.User(phone="+966500000200", name="Customer", hashed_password="x", role=models.UserRole.CUSTOMER)
+        db.add(customer)
+        await db.flush()
+        # One order a day; every other one finished
+        db.add_all([
+            models.Order(
+                customer_id=customer.id, type="taxi",
+                status=models.OrderStatus.COMPLETED if index % 2 == 0 else models.OrderStatus.PENDING,
+                pickup_lat=24.7, pickup_lng=46.7, dropoff_lat=24.8, dropoff_lng=46.8, estimated_price=20.0,
+                created_at=START + timedelta(days=index), version=1,
+            )
+            for index in range(ORDERS)
+        ])
+        await db.commit()
+        return engine, Session, customer.id
+
+async def history(Session, customer_id, limit, status=None):
+    def where(model):
+        conditions = [model.customer_id == customer_id]
+        if status:
+            conditions.append(model.status == status)
+        return conditions
+
+    pages, cursor = [], None
+    while True:
+        async with Session() as db:
+            query = archive.order_history_page(
+                db, ("id", "status", "created_at"), where, None, None, cursor, limit,
+                include_archive=archive.includes_archive(status),
+            )
+            items, cursor = pagination.split_page((await db.execute(query)).all(), limit)
+        pages.append([item.id for item in items])
+        if cursor is None:
+            return pages
+
+async def archive_and_page():
+    engine, Session, customer_id = await setup_database()
+    async with Session() as db:
+        ids_by_day = {row.created_at.day: row.id for row in (await db.execute(select(models.Order.id, models.Order.created_at))).all()}
+    # Every finished order moves, including the one holding the highest id
+    async with Session() as db:
+        moved = await archive.archive_batch(db, START + timedelta(days=ORDERS), 100)
+
+    pages = await history(Session, customer_id, limit=2)
+    completed_pages = await history(Session, customer_id, limit=2, status=models.OrderStatus.COMPLETED)
+    async with Session() as db:
+        live_ids = set((await db.execute(select(models.Order.id))).scalars().all())
+        archived = await archive.find_order(db, ("id", "status"), ids_by_day[1])
+        db.add(models.Order(
+            customer_id=customer_id, type="taxi", status=models.OrderStatus.PENDING,
+            pickup_lat=24.7, pickup_lng=46.7, dropoff_lat=24.8, dropoff_lng=46.8, estimated_price=20.0, version=1,
+        ))
+        await db.commit()
+        newest_id = await db.scalar(select(models.Order.id).order_by(models.Order.id.desc()).limit(1))
+    await engine.dispose()
+    return ids_by_day, moved, pages, completed_pages, live_ids, archived, newest_id
+
+def test_history_pages_merge_live_and_archived_orders():
+    ids_by_day, moved, pages, completed_pages, live_ids, archived, newest_id = asyncio.run(archive_and_page())
+    newest_first = [ids_by_day[day] for day in sorted(ids_by_day, reverse=True)]
+
+    assert moved == 5
+    assert live_ids == {ids_by_day[day] for day in (2, 4, 6, 8)}
+    assert [len(page) for page in pages] == [2, 2, 2, 2, 1]
+    assert [order_id for page in pages for order_id in page] == newest_first
+    assert [order_id for page in completed_pages for order_id in page] == [
+        order_id for order_id in newest_first if (order_id - newest_first[-1]) % 2 == 0
+    ]
+    assert archived.id == ids_by_day[1] and archived.status == models.OrderStatus.COMPLETED
+    # Archived ids are never handed out again
+    assert newest_id == max(ids_by_day.values()) + 1
@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+
+from app.core import dispatch, geo
+
+def greedy_by_sorting(distances, max_km):
+    # Reference: repeatedly take the globally closest remaining pair
+    cells = sorted(
+        (distances[row, col], row, col)
+        for row in range(distances.shape[0])
+        for col in range(distances.shape[1])
+        if distances[row, col] <= max_km
+    )
+    used_rows, used_cols, pairs = set(), set(), set()
+    for _, row, col in cells:
+        if row not in used_rows and col not in used_cols:
+            used_rows.add(row)
+            used_cols.add(col)
+            pairs.add((row, col))
+    return pairs
+
+def test_distance_matrix_matches_scalar_haversine():
+    rng = np.random.default_rng(3)
+    lat_a, lng_a = rng.uniform(24.5, 25.0, 40), rng.uniform(46.5, 47.0, 40)
+    lat_b, lng_b = rng.uniform(21.0, 26.0, 30), rng.uniform(39.0, 50.0, 30)
+
+    matrix = geo.haversine_km_matrix(lat_a, lng_a, lat_b, lng_b)
+
+    assert matrix.shape == (40, 30)
+    for row in range(40):
+        for col in range(30):
+            expected = geo.haversine_km(lat_a[row], lng_a[row], lat_b[col], lng_b[col])
+            assert math.isclose(matrix[row, col], expected, rel_tol=1e-4, abs_tol=1e-3)
+
+def test_match_equals_global_greedy():
+    rng = np.random.default_rng(5)
+    for n_orders, n_drivers in ((60, 60), (80, 30), (25, 70)):
+        distances = rng.uniform(0, 10, (n_orders, n_drivers)).astype(np.float32)
+        pairs = dispatch.match(distances, max_km=4.0)
+
+        assert {(row, col) for row, col, _ in pairs} == greedy_by_sorting(distances, 4.0)
+        assert len({row for row, _, _ in pairs}) == len(pairs)
+        assert len({col for _, col, _ in pairs}) == len(pairs)
+
+def test_assign_respects_radius_and_exclusions():
+    orders = [(10, 24.70, 46.70), (11, 24.90, 46.90)]
+    drivers = [(1, 24.701, 46.701), (2, 24.702, 46.702)]
+
+    pairs = dispatch.assign(orders, drivers, max_km=5.0)
+    assert [(order_id, driver_id) for order_id, driver_id, _ in pairs] == [(10, 1)]
+    assert pairs[0][2] < 0.2
+
+    pairs = dispatch.assign(orders, drivers, max_km=5.0, excluded={(10, 1)})
+    assert [(order_id, driver_id) for order_id, driver_id, _ in pairs] == [(10, 2)]
@@ -0,0 +1,95 @@
+import asyncio
+import csv
+import gzip
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config import settings
+from app.core import archive, database, exports
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+COLUMNS = ("id", "status", "estimated_price", "created_at")
+
+def setup(monkeypatch, chunk_rows):
+    path = os.path.join(tempfile.mkdtemp(), "exports.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(database, "SessionLocal", Session)
+    monkeypatch.setattr(database, "ReadSessionLocal", None)
+    monkeypatch.setattr(settings, "EXPORT_CHUNK_ROWS", chunk_rows)
+    return engine, Session
+
+async def create_orders(engine, Session, count, archived_before=None):
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    async with Session() as db:
+        customer = models.User(phone="+966500000300", name="Customer", hashed_password="x", role=models.UserRole.CUSTOMER)
+        db.add(customer)
+        await db.flush()
+        db.add_all([
+            models.Order(
+                customer_id=customer.id, type="taxi",
+                status=models.OrderStatus.COMPLETED if index % 3 == 0 else models.OrderStatus.PENDING,
+                pickup_lat=24.7, pickup_lng=46.7, dropoff_lat=24.8, dropoff_lng=46.8,
+                estimated_price=10.0 + index, created_at=START + timedelta(hours=index), version=1,
+            )
+            for index in range(count)
+        ])
+        await db.commit()
+    if archived_before is not None:
+        async with Session() as db:
+            await archive.archive_batch(db, archived_before, 1000)
+
+async def collect(stream) -> list:
+    return [item async for item in stream]
+
+def export(monkeypatch, count, chunk_rows, format="csv", compress=False, archived_before=None):
+    engine, Session = setup(monkeypatch, chunk_rows)
+
+    async def scenario():
+        await create_orders(engine, Session, count, archived_before)
+        sources = exports.order_sources(COLUMNS, None, None, None, None)
+        body = await collect(exports._body(sources, COLUMNS, exports.order_record, format, compress))
+        chunks = await collect(exports._chunks(sources))
+        await engine.dispose()
+        return b"".join(body), chunks
+
+    return asyncio.run(scenario())
+
+def test_chunks_cross_the_chunk_size_boundary_without_gaps_or_duplicates(monkeypatch):
+    for count, sizes in ((7, [3, 3, 1]), (6, [3, 3]), (2, [2]), (0, [])):
+        _, chunks = export(monkeypatch, count, chunk_rows=3)
+        assert [len(rows) for rows in chunks] == sizes
+        assert [row.id for rows in chunks for row in rows] == list(range(1, count + 1))
+
+def test_csv_has_header_then_archived_and_live_rows_by_id(monkeypatch):
+    data, _ = export(monkeypatch, 10, chunk_rows=4, archived_before=START + timedelta(hours=5))
+    rows = list(csv.reader(io.StringIO(data.decode())))
+
+    assert rows[0] == list(COLUMNS)
+    ids = [int(row[0]) for row in rows[1:]]
+    # Finished orders of the first five hours were archived: 1 and 4
+    assert ids == [1, 4, 2, 3, 5, 6, 7, 8, 9, 10]
+    assert rows[1][3] == START.isoformat()
+
+def test_ndjson_datetimes_are_utc():
+    # SQLite returns naive UTC datetimes, asyncpg aware ones
+    naive = datetime(2024, 1, 1, 12, 30)
+    aware = datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc)
+    lines = exports._encode_ndjson([{"created_at": naive}, {"created_at": aware}]).splitlines()
+
+    assert [orjson.loads(line)["created_at"] for line in lines] == ["2024-01-01T12:30:00Z", "2024-01-01T12:30:00Z"]
+
+def test_gzip_stream_decompresses_to_the_plain_export(monkeypatch):
+    for format in ("csv", "ndjson"):
+        plain, _ = export(monkeypatch, 9, chunk_rows=2, format=format)
+        compressed, _ = export(monkeypatch, 9, chunk_rows=2, format=format, compress=True)
+        assert gzip.decompress(compressed) == plain
+        assert len(plain.splitlines()) == (10 if format == "csv" else 9)
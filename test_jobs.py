@@ -0,0 +1,197 @@
+import asyncio
+import os
+import tempfile
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config import settings
+from app.core import database, jobs
+
+BATCH_JOB = "test.batch"
+SINGLE_JOB = "test.single"
+
+# Payloads the handlers have seen, by kind
+handled = {BATCH_JOB: [], SINGLE_JOB: []}
+
+@jobs.handler(BATCH_JOB, batch=True)
+async def handle_batch(db, payloads):
+    if any(payload.get("fail") for payload in payloads):
+        raise ValueError("bad payload")
+    handled[BATCH_JOB].extend(payloads)
+
+@jobs.handler(SINGLE_JOB)
+async def handle_single(db, payload):
+    if payload.get("fail"):
+        raise ValueError("bad payload")
+    handled[SINGLE_JOB].append(payload)
+
+class Clock:
+    def __init__(self):
+        self.now_ms = 1_700_000_000_000
+
+    def __call__(self) -> int:
+        return self.now_ms
+
+def setup(monkeypatch):
+    for payloads in handled.values():
+        payloads.clear()
+    clock = Clock()
+    monkeypatch.setattr(jobs, "_now_ms", clock)
+    monkeypatch.setattr(settings, "JOBS_LEASE_SECONDS", 60)
+    monkeypatch.setattr(settings, "JOBS_RETRY_BASE_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "JOBS_MAX_ATTEMPTS", 3)
+
+    path = os.path.join(tempfile.mkdtemp(), "jobs.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(database, "SessionLocal", Session)
+    return engine, Session, clock
+
+async def create_tables(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+async def enqueue(Session, *jobs_to_add):
+    async with Session() as db:
+        for kind, payload in jobs_to_add:
+            jobs.enqueue(db, kind, payload)
+        await db.commit()
+
+async def stored_jobs(Session):
+    async with Session() as db:
+        result = await db.execute(select(models.OutboxJob).order_by(models.OutboxJob.id))
+        return result.scalars().all()
+
+def test_enqueue_is_part_of_the_callers_transaction(monkeypatch):
+    engine, Session, _ = setup(monkeypatch)
+    queue = jobs.JobQueue(workers=0, batch_size=10, poll_interval=1)
+
+    async def scenario():
+        await create_tables(engine)
+        async with Session() as db:
+            jobs.enqueue(db, SINGLE_JOB, {"n": 1})
+            await db.rollback()
+            assert "jobs_enqueued" not in db.info
+        rolled_back = await stored_jobs(Session)
+
+        await enqueue(Session, (SINGLE_JOB, {"n": 2}))
+        committed = await stored_jobs(Session)
+        await queue.drain()
+        left = await stored_jobs(Session)
+        await engine.dispose()
+        return rolled_back, committed, left
+
+    rolled_back, committed, left = asyncio.run(scenario())
+    assert rolled_back == []
+    assert [job.payload for job in committed] == [{"n": 2}]
+    assert handled[SINGLE_JOB] == [{"n": 2}]
+    assert left == []
+
+def test_expired_lease_is_reclaimed_and_stale_claim_does_nothing(monkeypatch):
+    engine, Session, clock = setup(monkeypatch)
+    queue = jobs.JobQueue(workers=0, batch_size=10, poll_interval=1)
+
+    async def scenario():
+        await create_tables(engine)
+        await enqueue(Session, (SINGLE_JOB, {"n": 1}))
+
+        first = await queue.claim()
+        while_leased = await queue.claim()
+        clock.now_ms += settings.JOBS_LEASE_SECONDS * 1000
+        second = await queue.claim()
+
+        # The first worker comes back after its lease expired
+        await queue.run_jobs(SINGLE_JOB, first)
+        after_stale = list(handled[SINGLE_JOB])
+        await queue.run_jobs(SINGLE_JOB, second)
+        left = await stored_jobs(Session)
+        await engine.dispose()
+        return first, while_leased, second, after_stale, left
+
+    first, while_leased, second, after_stale, left = asyncio.run(scenario())
+    assert len(first) == 1 and first[0].attempts == 1
+    assert while_leased == []
+    assert [job.id for job in second] == [first[0].id] and second[0].attempts == 2
+    assert after_stale == []
+    assert handled[SINGLE_JOB] == [{"n": 1}]
+    assert left == []
+
+def test_failures_back_off_then_go_dead(monkeypatch):
+    engine, Session, clock = setup(monkeypatch)
+    queue = jobs.JobQueue(workers=0, batch_size=10, poll_interval=1)
+
+    async def scenario():
+        await create_tables(engine)
+        await enqueue(Session, (SINGLE_JOB, {"fail": True}))
+
+        delays = []
+        for _ in range(settings.JOBS_MAX_ATTEMPTS):
+            claimed = await queue.claim()
+            assert len(claimed) == 1
+            await queue.run_jobs(SINGLE_JOB, claimed)
+            job = (await stored_jobs(Session))[0]
+            delays.append(job.run_at_ms - clock.now_ms)
+            clock.now_ms = job.run_at_ms
+
+        leftover_claim = await queue.claim()
+        job = (await stored_jobs(Session))[0]
+        await engine.dispose()
+        return delays, leftover_claim, job
+
+    delays, leftover_claim, job = asyncio.run(scenario())
+    assert delays == [2000, 4000, 8000]
+    assert job.dead and job.attempts == settings.JOBS_MAX_ATTEMPTS
+    assert "bad payload" in job.last_error
+    assert leftover_claim == []
+
+def test_bad_payload_in_a_batch_does_not_take_the_others_down(monkeypatch):
+    engine, Session, clock = setup(monkeypatch)
+    queue = jobs.JobQueue(workers=0, batch_size=10, poll_interval=1)
+
+    async def scenario():
+        await create_tables(engine)
+        await enqueue(Session, (BATCH_JOB, {"n": 1}), (BATCH_JOB, {"fail": True}), (BATCH_JOB, {"n": 3}))
+        for _ in range(settings.JOBS_MAX_ATTEMPTS):
+            await queue.drain()
+            clock.now_ms += 3600 * 1000
+        left = await stored_jobs(Session)
+        await engine.dispose()
+        return left
+
+    left = asyncio.run(scenario())
+    assert sorted(payload["n"] for payload in handled[BATCH_JOB]) == [1, 3]
+    assert [(job.payload, job.dead) for job in left] == [({"fail": True}, True)]
+
+def test_drain_runs_every_kind_and_retires_unknown_kinds(monkeypatch):
+    engine, Session, clock = setup(monkeypatch)
+    queue = jobs.JobQueue(workers=0, batch_size=2, poll_interval=1)
+
+    async def scenario():
+        await create_tables(engine)
+        await enqueue(
+            Session,
+            *((BATCH_JOB, {"n": n}) for n in range(5)),
+            *((SINGLE_JOB, {"n": n}) for n in range(3)),
+            ("test.unknown", {"n": 0}),
+        )
+        await queue.drain()
+        after_first_drain = await stored_jobs(Session)
+
+        for _ in range(settings.JOBS_MAX_ATTEMPTS):
+            clock.now_ms += 3600 * 1000
+            await queue.drain()
+        left = await stored_jobs(Session)
+        await engine.dispose()
+        return after_first_drain, left
+
+    after_first_drain, left = asyncio.run(scenario())
+    assert sorted(payload["n"] for payload in handled[BATCH_JOB]) == [0, 1, 2, 3, 4]
+    assert sorted(payload["n"] for payload in handled[SINGLE_JOB]) == [0, 1, 2]
+    # Not left claimed: pushed back with a backoff, then marked dead
+    assert [(job.kind, job.attempts, job.dead) for job in after_first_drain] == [("test.unknown", 1, False)]
+    assert [(job.kind, job.dead) for job in left] == [("test.unknown", True)]
+    assert "No handler" in left[0].last_error
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import tempfile
+from collections import defaultdict
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.core import ledger
+
+WALLETS = 23
+BATCH_SIZE = 5
+
+async def setup_database():
+    path = os.path.join(tempfile.mkdtemp(), "ledger.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+    Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with Session() as db:
+        drivers = [
+            models.User(phone=f"+9665002{index:05d}", name=f"Driver {index}", hashed_password="x", role=models.UserRole.DRIVER)
+            for index in range(WALLETS)
+        ]
+        db.add_all(drivers)
+        await db.flush()
+        wallets = [models.Wallet(driver_id=driver.id, balance_minor=1000 * index) for index, driver in enumerate(drivers)]
+        db.add_all(wallets)
+        await db.flush()
+        db.add_all([
+            models.Transaction(wallet_id=wallet.id, amount_minor=wallet.balance_minor, description="Opening")
+            for wallet in wallets
+        ])
+        await db.commit()
+        return engine, Session, {wallet.id: wallet.balance_minor for wallet in wallets}
+
+def postings_for(opening):
+    # Three interleaved rounds of top-ups and deductions; every third wallet
+    # gets a top-up and a deduction that net to zero
+    postings = []
+    for round in range(3):
+        for index, wallet_id in enumerate(sorted(opening)):
+            if index % 3 == 0:
+                amount = (250, -250, 0)[round]
+            else:
+                amount = (index + 1) * (10, -3, 10)[round]
+            if amount:
+                postings.append(ledger.Posting(wallet_id, amount, f"Round {round}"))
+    return postings
+
+async def post_and_read(postings):
+    engine, Session, opening = await setup_database()
+    async with Session() as db:
+        await ledger.post_many(db, postings(opening))
+        await db.commit()
+
+    async with Session() as db:
+        balances = dict((await db.execute(select(models.Wallet.id, models.Wallet.balance_minor))).all())
+        transactions = (await db.execute(
+            select(models.Transaction.wallet_id, models.Transaction.amount_minor, models.Transaction.description)
+            .order_by(models.Transaction.id)
+        )).all()
+        drifted = await ledger.audit(db)
+    await engine.dispose()
+    return opening, balances, transactions, drifted
+
+def test_post_many_nets_postings_across_chunks(monkeypatch):
+    monkeypatch.setattr(ledger, "BATCH_SIZE", BATCH_SIZE)
+    posted = []
+
+    def postings(opening):
+        posted.extend(postings_for(opening))
+        return posted
+
+    opening, balances, transactions, drifted = asyncio.run(post_and_read(postings))
+    assert any(posting.amount_minor < 0 for posting in posted)
+    assert len(posted) > 2 * BATCH_SIZE and WALLETS > 2 * BATCH_SIZE
+
+    expected = dict(opening)
+    for posting in posted:
+        expected[posting.wallet_id] += posting.amount_minor
+    assert balances == expected
+    # Wallets whose postings net to zero keep their balance but get both rows
+    netted = [wallet_id for index, wallet_id in enumerate(sorted(opening)) if index % 3 == 0]
+    assert all(balances[wallet_id] == opening[wallet_id] for wallet_id in netted)
+
+    assert [tuple(row) for row in transactions[WALLETS:]] == [
+        (posting.wallet_id, posting.amount_minor, posting.description) for posting in posted
+    ]
+    per_wallet = defaultdict(int)
+    for wallet_id, amount_minor, _ in transactions:
+        per_wallet[wallet_id] += amount_minor
+    assert per_wallet == balances
+    assert drifted == []
+
+def test_to_minor_rounds_half_up():
+    assert ledger.to_minor(12.345) == 1235
+    assert ledger.to_minor(-0.005) == -1
+    assert ledger.to_major(-1999) == -19.99
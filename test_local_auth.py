@@ -22,7 +22,7 @@ def test_register_driver():
     
     # We need to send a file, even if dummy
     files = [
-        ('id_photo', ('test_id.jpg', b'fakeimagebytes', 'image/jpeg'))
+        ('id_photo', ('test_id.jpg', b'\xff\xd8\xff\xe0fakeimagebytes', 'image/jpeg'))
     ]
 
     try:
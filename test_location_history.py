@@ -0,0 +1,56 @@
+import math
+import random
+
+from app.core import geo, location_history
+
+def random_trail(rng, count, start_ms=1_700_000_000_000):
+    ts, lat, lng = start_ms, rng.uniform(-60, 60), rng.uniform(-179, 179)
+    points = []
+    for _ in range(count):
+        ts += rng.randint(0, 10_000)
+        lat += rng.uniform(-0.001, 0.001)
+        lng += rng.uniform(-0.001, 0.001)
+        points.append((ts, lat, lng))
+    return points
+
+def test_encode_decode_round_trip():
+    rng = random.Random(11)
+    for count in (1, 2, 50, 500):
+        points = random_trail(rng, count)
+        decoded = location_history.decode(location_history.encode(points), points[0][0])
+
+        assert len(decoded) == count
+        for (ts, lat, lng), (ts2, lat2, lng2) in zip(points, decoded):
+            assert ts == ts2
+            assert abs(lat - lat2) <= 0.5e-6 + 1e-9
+            assert abs(lng - lng2) <= 0.5e-6 + 1e-9
+
+def test_encoding_is_compact_for_dense_pings():
+    rng = random.Random(12)
+    points = random_trail(rng, 1000)
+    assert len(location_history.encode(points)) < 10 * len(points)
+
+def test_thin_keeps_ends_and_spacing():
+    points = [(ts, 24.7, 46.6) for ts in range(0, 60_000, 1_000)]
+    thinned = location_history.thin(points, 15_000)
+
+    assert thinned[0] == points[0] and thinned[-1] == points[-1]
+    assert [ts for ts, _, _ in thinned[:-1]] == [0, 15_000, 30_000, 45_000]
+
+def test_driven_km_sums_legs():
+    points = random_trail(random.Random(13), 30)
+    expected = sum(
+        geo.haversine_km(a[1], a[2], b[1], b[2]) for a, b in zip(points, points[1:])
+    )
+    assert math.isclose(location_history.driven_km(points), expected, rel_tol=1e-9)
+    assert location_history.driven_km(points[:1]) == 0.0
+
+def test_split_by_window_bounds_chunk_span():
+    # e.g. a flush re-sending pings buffered through a long DB outage
+    points = random_trail(random.Random(14), 2000)
+    window_ms = 60_000
+    runs = location_history.split_by_window(points, window_ms)
+
+    assert [point for run in runs for point in run] == points
+    assert all(run[-1][0] - run[0][0] < window_ms for run in runs)
+    assert location_history.split_by_window(points[:1], window_ms) == [points[:1]]
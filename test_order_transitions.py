@@ -0,0 +1,91 @@
+import asyncio
+import os
+import tempfile
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.core import order_state
+
+DRIVERS = 25
+
+async def setup_database():
+    path = os.path.join(tempfile.mkdtemp(), "transitions.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 30})
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+    Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with Session() as db:
+        customer = models.User(phone="+966500000100", name="Customer", hashed_password="x", role=models.UserRole.CUSTOMER)
+        drivers = [
+            models.User(phone=f"+9665001{index:05d}", name=f"Driver {index}", hashed_password="x", role=models.UserRole.DRIVER)
+            for index in range(DRIVERS)
+        ]
+        db.add_all([customer, *drivers])
+        await db.flush()
+        order = models.Order(
+            customer_id=customer.id, type="taxi", status=models.OrderStatus.PENDING,
+            pickup_lat=24.7, pickup_lng=46.7, dropoff_lat=24.8, dropoff_lng=46.8, estimated_price=20.0
+        )
+        db.add(order)
+        await db.commit()
+        return engine, Session, customer.id, [driver.id for driver in drivers], order.id
+
+async def try_transition(Session, func, *args):
+    async with Session() as db:
+        try:
+            await func(db, *args)
+            await db.commit()
+            return 200
+        except HTTPException as exc:
+            await db.rollback()
+            return exc.status_code
+
+async def race_accepts():
+    engine, Session, _, driver_ids, order_id = await setup_database()
+    outcomes = await asyncio.gather(*(
+        try_transition(Session, order_state.accept, order_id, driver_id) for driver_id in driver_ids
+    ))
+
+    async with Session() as db:
+        order = (await db.execute(select(models.Order).where(models.Order.id == order_id))).scalars().one()
+    await engine.dispose()
+    return outcomes, driver_ids, order
+
+def test_concurrent_accepts_have_exactly_one_winner():
+    outcomes, driver_ids, order = asyncio.run(race_accepts())
+
+    assert outcomes.count(200) == 1
+    assert outcomes.count(409) == DRIVERS - 1
+    assert order.status == models.OrderStatus.ACCEPTED
+    assert order.driver_id == driver_ids[outcomes.index(200)]
+    assert order.version == 2
+
+async def race_cancel_and_accept():
+    engine, Session, customer_id, driver_ids, order_id = await setup_database()
+    outcomes = await asyncio.gather(
+        try_transition(Session, order_state.accept, order_id, driver_ids[0]),
+        try_transition(Session, order_state.cancel, order_id, customer_id),
+    )
+
+    async with Session() as db:
+        order = (await db.execute(select(models.Order).where(models.Order.id == order_id))).scalars().one()
+    complete = await try_transition(Session, order_state.complete, order_id, driver_ids[0])
+    await engine.dispose()
+    return outcomes, order, complete
+
+def test_cancel_and_accept_do_not_overwrite_each_other():
+    outcomes, order, complete = asyncio.run(race_cancel_and_accept())
+
+    # Whichever lands first, the final state reflects every call that reported success
+    assert order.status in (models.OrderStatus.ACCEPTED, models.OrderStatus.CANCELLED)
+    if order.status == models.OrderStatus.CANCELLED:
+        assert outcomes[1] == 200
+        assert complete == 409
+    else:
+        assert outcomes == [200, 409]
+        assert complete == 200
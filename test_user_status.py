@@ -0,0 +1,89 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.core import security
+from app.routers import admin
+
+class Clock:
+    # Starts at the wall clock, which stamps the status changes
+    def __init__(self):
+        self.now_ms = int(time.time() * 1000)
+
+    def __call__(self) -> int:
+        return self.now_ms
+
+def setup(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(security, "_now_ms", clock)
+    monkeypatch.setattr(security, "_user_cache", security.UserCache(100, 60, revalidate_interval=2))
+    path = os.path.join(tempfile.mkdtemp(), "users.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    return engine, Session, clock
+
+async def create_users(engine, Session):
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    async with Session() as db:
+        admin_user = models.User(phone="+966500000400", name="Admin", hashed_password="x", role=models.UserRole.ADMIN)
+        driver = models.User(phone="+966500000401", name="Driver", hashed_password="x", role=models.UserRole.DRIVER)
+        db.add_all([admin_user, driver])
+        await db.commit()
+        return security.CurrentUser(admin_user.id, admin_user.phone, admin_user.role, True), driver
+
+async def authenticate(Session, token):
+    async with Session() as db:
+        try:
+            return await security.authenticate_token(token, db)
+        except HTTPException as exc:
+            return exc.status_code
+
+async def deactivate(Session, admin_user, user_id):
+    async with Session() as db:
+        await admin.toggle_user_status(user_id, {"is_active": False}, db, admin_user)
+
+def test_deactivation_applies_at_once_in_this_worker(monkeypatch):
+    engine, Session, _ = setup(monkeypatch)
+
+    async def scenario():
+        admin_user, driver = await create_users(engine, Session)
+        token = security.create_access_token({"sub": driver.phone})
+        before = await authenticate(Session, token)
+        await deactivate(Session, admin_user, driver.id)
+        after = await authenticate(Session, token)
+        await engine.dispose()
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert isinstance(before, security.CurrentUser) and before.is_active
+    assert after == 400
+
+def test_deactivation_through_another_worker_applies_after_revalidation(monkeypatch):
+    engine, Session, clock = setup(monkeypatch)
+    # The change is made by another worker, so this cache is not touched directly
+    monkeypatch.setattr(security, "invalidate_user", lambda phone: None)
+
+    async def scenario():
+        admin_user, driver = await create_users(engine, Session)
+        token = security.create_access_token({"sub": driver.phone})
+        results = [await authenticate(Session, token)]
+        clock.now_ms += 1000
+        await deactivate(Session, admin_user, driver.id)
+        results.append(await authenticate(Session, token))
+        clock.now_ms += 1000
+        results.append(await authenticate(Session, token))
+        await engine.dispose()
+        return results
+
+    cached, within_interval, revalidated = asyncio.run(scenario())
+    assert isinstance(cached, security.CurrentUser)
+    # Still served from this worker's cache until the next status check
+    assert isinstance(within_interval, security.CurrentUser)
+    assert revalidated == 400